@@ -0,0 +1,284 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Benchmark suite for spikelearn
+
+Times single steps of neurons, synapses, learning rules, spike
+generators, and whole networks for a range of sizes, and reports
+steps per second, per-step latency percentiles, and peak memory.
+
+Results can be saved as JSON, appended to a history file to track them
+over time, and compared against a stored baseline:
+
+    python benchmarks/run_benchmarks.py --sizes 100 1000 --save base.json
+    python benchmarks/run_benchmarks.py --sizes 100 1000 --compare base.json
+
+The comparison exits with a nonzero status if any benchmark is slower
+than the baseline by more than the given tolerance.
+
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import runpy
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import spikelearn
+from spikelearn import SpikingLayer, StaticSynapse, STDPSynapse, MSESynapse
+from spikelearn.neurons import BioLIFLayer
+from spikelearn.loihi import STDPrule
+from spikelearn.generators import Poisson
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, "examples")
+
+#: Fraction of active inputs used by the synapse benchmarks
+ACTIVITY = 0.05
+
+
+def spikes(rng, N, p=ACTIVITY):
+    return (rng.random(N) < p).astype(np.float64)
+
+
+def bench_lif(N, rng):
+    layer = SpikingLayer(N, 4)
+    x = 2*rng.random(N)
+    return lambda: layer(x)
+
+
+def bench_biolif(N, rng):
+    layer = BioLIFLayer(N, 0.5)
+    xe = 2*rng.random(N)
+    xi = rng.random(N)
+    return lambda: layer(xe, xi)
+
+
+def bench_static_synapse(N, rng):
+    syn = StaticSynapse(N, N, rng.random((N, N)))
+    x = spikes(rng, N)
+    return lambda: syn(x)
+
+
+def bench_stdp_synapse(N, rng, p=ACTIVITY):
+    syn = STDPSynapse(N, N, rng.random((N, N)), tre=(0.5, 0.5), tro=(0.5, 0.5),
+                      rule_params={"Ap": 0.01, "An": 0.01}, syn_type="exc")
+    xe = spikes(rng, N, p)
+    xo = spikes(rng, N, p)
+    def step():
+        syn(xe)
+        syn.update(xo)
+    return step
+
+
+def bench_stdp_synapse_sparse(N, rng):
+    # Weight updates only touch the rows and columns of active neurons,
+    # so this should be several times faster than STDPSynapse
+    return bench_stdp_synapse(N, rng, ACTIVITY/10)
+
+
+def bench_mse_synapse(N, rng):
+    syn = MSESynapse(N, N, rng.random((N, N)), tre=(0.5, 0.5), tro=(0.5, 0.5),
+                     trm=(0.5, 0.5), rule_params={"lr": 0.01}, syn_type="exc")
+    xe = spikes(rng, N)
+    xo = spikes(rng, N)
+    xm = rng.random(N)
+    def step():
+        syn(xe, xm)
+        syn.update(xo)
+    return step
+
+
+def bench_loihi_apply_rule(N, rng):
+    syn = STDPrule(N, N, rng.random((N, N)), (0.5, 0.5), (0.5, 0.5), (0.5, 0.5),
+                   0.01, 0.01, None)
+    xe = spikes(rng, N)
+    xo = spikes(rng, N)
+    xm = rng.random(N)
+    syn(xe, xm)
+    syn.update(xo, learn=False)
+    return lambda: syn.apply_rule(syn.wrule, syn.xe, xo, xm)
+
+
+def bench_poisson(N, rng):
+    gen = Poisson(N, rng.random(N))
+    return gen
+
+
+def bench_recurrent_network(N, rng):
+    example = runpy.run_path(os.path.join(EXAMPLES, "recurrentnetwork.py"))
+    weights = {"W0ee": 0.1, "W0ei": 0.2, "W0ie": 0.5, "W0ext": 0.3}
+    n_inh = max(N//50, 1)
+    n_input = max(N//5, 1)
+    snn = example["create_sparse_network"](N, n_inh, n_input, 0.05, 0.05, weights)
+    gen = Poisson(n_input, 0.5)
+    return lambda: snn(gen())
+
+
+#: Benchmarks, with the largest size each of them is run at. Dense N x N
+#: synapses, and networks with a fixed connection probability, are limited
+#: to sizes that fit comfortably in memory.
+BENCHMARKS = {
+    "LIFLayer": (bench_lif, None),
+    "BioLIFLayer": (bench_biolif, None),
+    "StaticSynapse": (bench_static_synapse, 10000),
+    "STDPSynapse": (bench_stdp_synapse, 10000),
+    "STDPSynapse.sparse": (bench_stdp_synapse_sparse, 10000),
+    "MSESynapse": (bench_mse_synapse, 10000),
+    "LoihiSynapse.apply_rule": (bench_loihi_apply_rule, 3000),
+    "Poisson": (bench_poisson, None),
+    "recurrentnetwork": (bench_recurrent_network, 10000),
+}
+
+
+def measure(step, steps, warmup):
+    """Times individual calls to a step function
+
+    Returns:
+        A dictionary with steps per second and latency percentiles in
+        microseconds
+    """
+    for _ in range(warmup):
+        step()
+    latencies = np.empty(steps)
+    clock = time.perf_counter
+    start = clock()
+    for i in range(steps):
+        t0 = clock()
+        step()
+        latencies[i] = clock() - t0
+    total = clock() - start
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])*1e6
+    return {
+        "steps_per_sec": steps/total,
+        "p50_us": p50,
+        "p90_us": p90,
+        "p99_us": p99,
+        "max_us": latencies.max()*1e6,
+    }
+
+
+def peak_memory(setup, N, seed, steps):
+    """Peak memory allocated while building and running a benchmark"""
+    tracemalloc.start()
+    step = setup(N, np.random.default_rng(seed))
+    for _ in range(steps):
+        step()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run(names, sizes, steps, warmup, seed, memory=True):
+    results = []
+    for name in names:
+        setup, max_n = BENCHMARKS[name]
+        for N in sizes:
+            if max_n is not None and N > max_n:
+                print("{:<26}{:>8}   skipped".format(name, N))
+                continue
+            np.random.seed(seed)
+            step = setup(N, np.random.default_rng(seed))
+            result = {"name": name, "N": N}
+            result.update(measure(step, steps, warmup))
+            del step
+            if memory:
+                result["peak_mem_bytes"] = peak_memory(setup, N, seed, min(steps, 10))
+            results.append(result)
+            print(format_result(result))
+    return results
+
+
+def format_result(r):
+    mem = r.get("peak_mem_bytes")
+    mem = "" if mem is None else "{:>10.1f}".format(mem/2**20)
+    return "{:<26}{:>8}{:>12.1f}{:>11.1f}{:>11.1f}{:>11.1f}{}".format(
+        r["name"], r["N"], r["steps_per_sec"], r["p50_us"], r["p90_us"],
+        r["p99_us"], mem)
+
+
+def metadata():
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "spikelearn": getattr(spikelearn, "__version__", None),
+        "numpy": np.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Compares results against a baseline
+
+    Returns:
+        A list with the benchmarks slower than the baseline by more than
+        the tolerance
+    """
+    base = {(r["name"], r["N"]): r for r in baseline["results"]}
+    regressions = []
+    print("\n{:<26}{:>8}{:>14}{:>14}{:>9}".format(
+        "benchmark", "N", "baseline/s", "current/s", "ratio"))
+    for r in results:
+        b = base.get((r["name"], r["N"]))
+        if b is None:
+            continue
+        ratio = r["steps_per_sec"]/b["steps_per_sec"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  SLOWER"
+            regressions.append(r)
+        elif ratio > 1 + tolerance:
+            flag = "  faster"
+        print("{:<26}{:>8}{:>14.1f}{:>14.1f}{:>9.2f}{}".format(
+            r["name"], r["N"], b["steps_per_sec"], r["steps_per_sec"], ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bench", nargs="+", choices=sorted(BENCHMARKS),
+                        default=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--sizes", nargs="+", type=int,
+                        default=[100, 1000, 10000, 100000], help="layer sizes")
+    parser.add_argument("--steps", type=int, default=200, help="timed steps")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed steps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip peak memory measurements")
+    parser.add_argument("--save", help="write the results to a JSON file")
+    parser.add_argument("--append", help="append the results to a JSON lines history file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    print("{:<26}{:>8}{:>12}{:>11}{:>11}{:>11}{:>10}".format(
+        "benchmark", "N", "steps/s", "p50 us", "p90 us", "p99 us", "peak MB"))
+    results = run(args.bench, args.sizes, args.steps, args.warmup, args.seed,
+                  not args.no_memory)
+    report = {"meta": metadata(), "results": results}
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.append:
+        with open(args.append, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,18 @@
 Explores a sparse recurrent network with excitatory and inhibitory neurons
 """
 
-from spikelearn import SpikingNet, SpikingLayer, StaticSynapse
+from spikelearn import SpikingNet, SpikingLayer, StaticSynapse, SparseWeights
 from spikelearn.generators import Poisson
+from spikelearn.monitors import SpikeMonitor
 import numpy as np
 
 def create_sparse_static_synapse(n_in, n_out, weight, prob, syn_type):
     """Creates a sparse static synapse"""
-    w_sp = np.random.random((n_out, n_in))
-    w_sp = np.where(w_sp < prob, weight, 0)
+    n_syn = np.random.binomial(n_in*n_out, prob)
+    rows = np.random.randint(0, n_out, n_syn)
+    cols = np.random.randint(0, n_in, n_syn)
+    w_sp = SparseWeights.from_coo(rows, cols, 1, (n_out, n_in))
+    w_sp.data[:] = weight
     return StaticSynapse(n_in, n_out, w_sp, syn_type=syn_type)
 
 
@@ -50,17 +54,19 @@ if __name__ == "__main__":
     }
 
     sp_snn = create_sparse_network(1000, 20, 200, 0.05, 0.05, d_weights)
+    exc_mon = sp_snn.add_monitor(SpikeMonitor(sp_snn.get_layer("exc")))
+    inh_mon = sp_snn.add_monitor(SpikeMonitor(sp_snn.get_layer("inh")))
 
+    steps = 1000
     spikes = np.zeros(200)
     spike_gen = Poisson(100, 0.5)
-    out_list = []
-    out_inh = []
 
-    for i in range(1000):
+    for i in range(steps):
         spikes[:100] = spike_gen()
-        oute, outi = sp_snn(spikes)
-        out_list.append(np.mean(oute))
-        out_inh.append(np.mean(outi))
+        sp_snn(spikes)
 
-    pt.plot(out_list)
+    out_exc = np.bincount(exc_mon.t, minlength=steps)/1000
+    out_inh = np.bincount(inh_mon.t, minlength=steps)/20
+
+    pt.plot(out_exc)
     pt.show()
@@ -4,3 +4,4 @@ from .neurons import SpikingLayer, SpikingRecLayer
 from .synapses import *
 from .ternary import *
 from .snn import SpikingNet
+from .sparse import SparseWeights
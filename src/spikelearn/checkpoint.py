@@ -0,0 +1,197 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Checkpoints of the state of a network
+
+The state of a `SpikingNet` is made of the arrays held by its layers,
+synapses, learning rules, traces, and transforms, such as weights,
+membrane potentials, and traces, together with a few integer counters.
+`save_state` writes all of them into a single binary file, made of a
+JSON index followed by the raw data of each array, and `load_state`
+copies them back into the arrays of a network built in the same way.
+
+Arrays are restored in place, so that views and references between
+them remain valid. Weights can instead be memory-mapped copy-on-write,
+which restores large weight sets without reading them, and allows
+several networks forked from the same checkpoint to share memory until
+they learn.
+
+"""
+
+import json
+
+import numpy as np
+
+from .sparse import SparseWeights
+
+
+MAGIC = b"SPIKELEARN\x01"
+#: Alignment in bytes of the arrays in a checkpoint file
+ALIGNMENT = 64
+#: Attributes referencing inputs or outputs of the current timestep,
+#: which are recomputed at the next timestep, or arrays owned by
+#: another component
+TRANSIENT = {"xe", "xm", "out", "_bounded_W"}
+#: Synaptic variables that can be memory-mapped
+WEIGHTS = {"_W", "tag"}
+
+
+def _is_component(obj):
+    return (type(obj).__module__.startswith("spikelearn.")
+            and hasattr(obj, "__dict__"))
+
+
+def _walk(obj, prefix, arrays, scalars, seen):
+    """Collects the state arrays and counters of an object and its parts"""
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    children = []
+    for name, value in vars(obj).items():
+        if name in TRANSIENT:
+            continue
+        key = prefix + "/" + name
+        if isinstance(value, np.ndarray):
+            if id(value) not in seen:
+                seen.add(id(value))
+                arrays[key] = (obj, name, value)
+        elif isinstance(value, (bool, int)) and name.startswith("_"):
+            scalars[key] = (obj, name, value)
+        elif _is_component(value):
+            children.append((key, value))
+        elif isinstance(value, (list, tuple)):
+            for i, item in enumerate(value):
+                if _is_component(item):
+                    children.append(("{}/{}".format(key, i), item))
+    for key, child in children:
+        _walk(child, key, arrays, scalars, seen)
+
+
+def network_state(net):
+    """Returns the state of a network
+
+    Args:
+        net : a `SpikingNet`
+
+    Returns:
+        Two dictionaries, mapping keys to tuples (object, attribute,
+        value), one with arrays and one with integer and boolean
+        counters
+    """
+    arrays = {}
+    scalars = {"t": (net, "t", net.t)}
+    seen = set()
+    for name, el in net._elements.items():
+        _walk(el._neuron, "layers/" + name, arrays, scalars, seen)
+    for name, el in net._elements.items():
+        for i, syn in enumerate(el._synapses):
+            _walk(syn, "synapses/{}/{}".format(name, i), arrays, scalars, seen)
+    return arrays, scalars
+
+
+def _align(offset):
+    return -(-offset//ALIGNMENT)*ALIGNMENT
+
+
+def save_state(net, path):
+    """Writes the state of a network to a file
+
+    Args:
+        net : a `SpikingNet`
+        path : name of the file
+    """
+    arrays, scalars = network_state(net)
+    index = {"arrays": {}, "scalars": {k: v[2] for k, v in scalars.items()}}
+    offset = 0
+    for key, (_, _, a) in arrays.items():
+        index["arrays"][key] = {"dtype": a.dtype.str, "shape": a.shape,
+                                "offset": offset}
+        offset = _align(offset + a.nbytes)
+    header = json.dumps(index).encode()
+    start = _align(len(MAGIC) + 8 + len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for key, (_, _, a) in arrays.items():
+            f.seek(start + index["arrays"][key]["offset"])
+            np.ascontiguousarray(a).tofile(f)
+        f.truncate(start + offset)
+
+
+def _read_index(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a spikelearn checkpoint".format(path))
+        size = int(np.frombuffer(f.read(8), np.uint64)[0])
+        index = json.loads(f.read(size).decode())
+    return index, _align(len(MAGIC) + 8 + size)
+
+
+def load_state(net, path, mmap_weights=False):
+    """Restores the state of a network from a file
+
+    The network must have been built in the same way as the one that
+    was saved.
+
+    Args:
+        net : a `SpikingNet`
+        path : name of the file
+        mmap_weights : if True, synaptic weights and tags are replaced
+            by copy-on-write memory maps of the file instead of being
+            copied (optional, default False)
+
+    Raises:
+        ValueError: the file does not match the network, or holds
+            different values for a read-only array, such as weights
+            attached with `attach_weights`
+    """
+    index, start = _read_index(path)
+    arrays, scalars = network_state(net)
+    if set(index["arrays"]) != set(arrays):
+        missing = set(index["arrays"]) ^ set(arrays)
+        raise ValueError("Checkpoint does not match the network: {}".format(
+            sorted(missing)[:5]))
+
+    data = np.memmap(path, dtype=np.uint8, mode="c" if mmap_weights else "r")
+    values = {}
+    for key, (obj, name, a) in arrays.items():
+        entry = index["arrays"][key]
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        if shape != a.shape:
+            raise ValueError("Shape of {} does not match the network".format(key))
+        offset = start + entry["offset"]
+        size = int(np.prod(shape))*dtype.itemsize
+        values[key] = data[offset:offset + size].view(dtype).reshape(shape)
+        # Read-only arrays, such as shared weights, are checked before
+        # anything is restored
+        replaced = mmap_weights and _is_weight(obj, name)
+        if not (replaced or a.flags.writeable or np.array_equal(a, values[key])):
+            raise ValueError("{} is read-only and differs from the checkpoint".format(key))
+
+    for key, (obj, name, a) in arrays.items():
+        if mmap_weights and _is_weight(obj, name):
+            _set(obj, name, values[key])
+        elif a.flags.writeable:
+            np.copyto(a, values[key], casting="unsafe")
+
+    for key, (obj, name, _) in scalars.items():
+        if key in index["scalars"]:
+            setattr(obj, name, index["scalars"][key])
+    # Weights restored in place are copied again into fused synapses
+    net.invalidate()
+
+
+def _set(obj, name, value):
+    """Sets an attribute, through its public property if there is one"""
+    public = name.lstrip("_")
+    if isinstance(getattr(type(obj), public, None), property):
+        name = public
+    setattr(obj, name, value)
+
+
+def _is_weight(obj, name):
+    if isinstance(obj, SparseWeights):
+        return name == "data"
+    return name in WEIGHTS
@@ -1,43 +1,106 @@
 #Copyright Argonne 2022. See LICENSE.md for details.
 
+import copy
+
 import numpy as np
 
 class Generator:
     """Base class for spike generators
-    
+
+    Spikes are generated in blocks of several timesteps, and each call
+    returns a view of the next row of the current block. Blocks are
+    never modified once generated, so returned arrays remain valid.
+
+    Each generator draws random numbers from its own `np.random.Generator`
+    seeded from a `np.random.SeedSequence`. Generators with independent
+    streams, for instance for parallel workers, can be created with
+    `spawn`.
+
+    Spikes are uint8 by default. Expressions mixing them with floats
+    give the same results as the int64 spikes of earlier versions, but
+    integer expressions such as `-s` or `s - 1` wrap around: use a
+    signed or floating point dtype for them.
+
     """
-    def __init__(self, N, r0, scale=1.0):
+    def __init__(self, N, r0, scale=1.0, seed=None, block_size=100, dtype=np.uint8):
         """Instantiates a spike generator
 
         Args:
             N : number of parallel streams
             r0: array with input rates, with values between 0 and 1
             scale: scalar factor to control the degree of sparsity
+            seed: an integer or a `np.random.SeedSequence` (optional)
+            block_size: number of timesteps generated at once
+                (optional, default 100)
+            dtype: type of the spike arrays (optional, default uint8)
 
         """
         self.N = N
         self.r0 = r0
         self.scale = scale
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype)
+        if isinstance(seed, np.random.SeedSequence):
+            self.seed = seed
+        else:
+            self.seed = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed)
         self.init()
 
     def __call__(self, r0=None):
         """Returns an array of spikes
 
         Args:
-            r0 : optional, array with input rates
+            r0 : optional, array with input rates. Spikes already
+                generated with the previous rates are discarded.
 
         Returns:
             An array of spikes (1 if spiking 0 otherwise)
         """
         if r0 is not None:
-            self.p0 = r0
-        return self._next_spike()
+            self.r0 = r0
+            self._pos = len(self._block)
+            steps = 1
+        else:
+            steps = self.block_size
+        if self._pos == len(self._block):
+            self._block = self._generate(steps)
+            self._block.flags.writeable = False
+            self._pos = 0
+        out = self._block[self._pos]
+        self._pos += 1
+        return out
 
-    def _next_spike(self):
+    def _generate(self, steps):
+        """Returns a (steps, N) array with the next spikes"""
         raise NotImplementedError()
 
     def init(self):
-        pass
+        self._block = np.zeros((0, self.N), self.dtype)
+        self._pos = 0
+
+    def spawn(self, n):
+        """Creates generators with independent random streams
+
+        The new generators have the same parameters, and their seeds are
+        spawned from the seed of this generator, so that the streams are
+        reproducible.
+
+        Args:
+            n : number of generators
+
+        Returns:
+            A list of generators
+        """
+        out = []
+        for seed in self.seed.spawn(n):
+            gen = copy.copy(self)
+            gen.seed = seed
+            gen.rng = np.random.default_rng(seed)
+            gen.init()
+            out.append(gen)
+        return out
+
 
 class Poisson(Generator):
     """Poisson spike generator
@@ -48,18 +111,24 @@ class Poisson(Generator):
         N : number of spike trains
         r0 : array of rates used to generate the spike trains
         scale : scalar factor used to control the degree of sparsity
-    
+
     """
-    
-    def _next_spike(self):
-        s = np.random.random(self.N)
-        return np.where(s > self.scale*self.r0, 0, 1)
+
+    def _generate(self, steps):
+        p = self.scale*np.asarray(self.r0)
+        u = self.rng.random((steps, self.N))
+        if self.dtype.itemsize == 1:
+            out = np.empty((steps, self.N), self.dtype)
+            np.less(u, p, out=out.view(bool))
+            return out
+        return (u < p).astype(self.dtype)
 
 
 class Periodic(Generator):
     """Periodic spike generator
 
-    Generates an array of deterministic periodic spike trains
+    Generates an array of deterministic periodic spike trains. A spike
+    train with rate r fires every floor(1/r)+1 timesteps.
 
     Attributes:
         N : number of spike trains
@@ -69,43 +138,51 @@ class Periodic(Generator):
     """
 
     def init(self):
-        self.val = np.zeros(self.N)
-
-    def _next_spike(self):
-        self.val += self.scale*self.r0
-        out = np.where(self.val>1, 1, 0)
-        self.val[self.val>1] = 0
+        super().init()
+        self.count = np.zeros(self.N, np.int64)
+
+    def _generate(self, steps):
+        rate = np.broadcast_to(self.scale*np.asarray(self.r0, dtype=float), (self.N,))
+        active = rate > 0
+        period = np.ones(self.N, np.int64)
+        period[active] = np.floor(1/rate[active]).astype(np.int64) + 1
+        t = self.count + np.arange(1, steps+1)[:,None]
+        out = ((t % period == 0) & active).astype(self.dtype)
+        self.count = (self.count + steps) % period
         return out
 
 
 class SpikeSequence(Generator):
     """Spike sequence generator
-    
+
     Generates an array of spike sequences. Sequences repeat
-    over time. 
+    over time.
 
     Attributes:
         N : number of spike trains
         r0 : 2D array with the spike sequences
     """
 
-    def __init__(self, N, r0):
+    def __init__(self, N, r0, dtype=np.uint8):
         """Instantiates a spike sequence generator
 
         Args:
             N : number of parallel streams
             r0: 2D array with spike sequences
+            dtype: type of the spike arrays (optional, default uint8)
 
         """
-        super().__init__(N, r0)
+        super().__init__(N, r0, dtype=dtype)
 
     def init(self):
-        self.time_step = 0
+        super().init()
+        self._seq = None
         self.pulse_length = self.r0.shape[1]
 
-    def _next_spike(self):
-        out = self.r0[:,self.time_step]
-        self.time_step += 1
-        if self.time_step == self.pulse_length:
-            self.time_step = 0
-        return out
+    def _generate(self, steps):
+        # The whole sequence is a block, stored with time as first axis
+        if self._seq is None or self._seq_source is not self.r0:
+            self._seq = np.ascontiguousarray(self.r0.T, dtype=self.dtype)
+            self._seq_source = self.r0
+            self.pulse_length = self.r0.shape[1]
+        return self._seq
@@ -1,6 +1,7 @@
 #Copyright Argonne 2022. See LICENSE.md for details.
 
 from collections import deque
+import numpy as np
 
 class Layer:
     """Base class for a Layer
@@ -8,12 +9,73 @@ class Layer:
     Provides the basic interface that any layer instance should have.
     """
 
+    batch_size = None
+    dtype = np.dtype(np.float64)
+    _dtype_fixed = False
+    spike_dtype = None
+    _spike_dtype_fixed = False
+    #: True if the layer adds all its inputs, so that the outputs of
+    #: several synapses can be replaced by their sum
+    sums_inputs = False
+
     def __call__(self, *x):
         raise NotImplementedError()
 
     def reset(self):
         pass
 
+    def set_batch_size(self, batch_size):
+        """Sets the number of independent samples simulated in parallel
+
+        Layers keep a separate state for each sample, so that their
+        state arrays have a shape (batch_size, N). Setting the batch
+        size resets the layer.
+
+        Args:
+            batch_size : number of samples, or None for a single
+                unbatched simulation
+        """
+        self.batch_size = batch_size
+        self.reset()
+
+    def set_dtype(self, dtype, override=True):
+        """Sets the floating point type of the layer state
+
+        Setting the dtype resets the layer.
+
+        Args:
+            dtype : a numpy floating point type
+            override : if False, a dtype given explicitly when the layer
+                was created is preserved
+        """
+        if self._dtype_fixed and not override:
+            return
+        self.dtype = np.dtype(dtype)
+        self._dtype_fixed = override
+        self.reset()
+
+    def set_spike_dtype(self, spike_dtype, override=True):
+        """Sets the type of the output spikes
+
+        Spikes can be stored as bool or uint8 arrays, which reduces the
+        memory traffic of passing them to synapses and recording them.
+        Setting the spike dtype resets the layer.
+
+        Args:
+            spike_dtype : a numpy type, or None to use the dtype of the
+                layer state
+            override : if False, a spike dtype given explicitly when the
+                layer was created is preserved
+        """
+        if self._spike_dtype_fixed and not override:
+            return
+        self.spike_dtype = None if spike_dtype is None else np.dtype(spike_dtype)
+        self._spike_dtype_fixed = override
+        self.reset()
+
+    def _spike_dtype(self):
+        return self.dtype if self.spike_dtype is None else self.spike_dtype
+
     @property
     def out(self):
         raise NotImplementedError()
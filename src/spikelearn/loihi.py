@@ -1,17 +1,223 @@
 #Copyright Argonne 2022. See LICENSE.md for details.
 
+import numpy as np
 from .synapses import BaseSynapse
+from .trace import TraceBank
+from .ops import state_shape, matvec, sharded_matvec
+from .parallel import run_calls
+
+
+#: Rule factors depending on presynaptic variables
+PRE_FACTORS = {0: "xe", 1: "te", 2: "te2"}
+#: Rule factors depending on postsynaptic or modulatory variables
+POST_FACTORS = {3: "xo", 4: "to", 5: "to2", 6: "to3", 7: "xm", 8: "tm"}
+#: Rule factors depending on synaptic variables, with a flag set to
+#: True if the factor is the sign of the variable
+SYN_FACTORS = {9: ("W", False), 11: ("tag", False), 12: ("W", True), 14: ("tag", True)}
+#: Constant rule factors, with a flag set to True if the factor is the sign
+#: of the value
+SCALAR_FACTORS = {10: False, 13: True, 15: False}
+
+#: Traces required by each rule variable
+_TRACES = {"te": "tre", "te2": "tre2", "to": "tro", "to2": "tro2",
+           "to3": "tro3", "tm": "trm"}
+
+
+class RuleKernel:
+    """Compiled form of a Loihi plasticity rule
+
+    A rule is a list of chunks, each chunk being a list of (index, value)
+    factors whose product is added to the synaptic variable. Each chunk
+    is factored at construction into a constant, a presynaptic vector,
+    a postsynaptic vector, and an optional list of synaptic factors.
+
+    Chunks without synaptic factors are outer products of a
+    postsynaptic and a presynaptic vector, and all of them are
+    accumulated with a single matrix product. Only chunks involving the
+    weights or the tag are evaluated elementwise.
+
+    Args:
+        rule : list of chunks
+
+    Raises:
+        ValueError: unknown factor index
+    """
+
+    def __init__(self, rule):
+
+        self.rank1 = []
+        self.elementwise = []
+        self.variables = set()
+        for chunk in rule:
+            coef = 1.0
+            pre = []
+            post = []
+            syn = []
+            for i, value in chunk:
+                if i in PRE_FACTORS:
+                    pre.append((PRE_FACTORS[i], value))
+                    self.variables.add(PRE_FACTORS[i])
+                elif i in POST_FACTORS:
+                    post.append((POST_FACTORS[i], value))
+                    self.variables.add(POST_FACTORS[i])
+                elif i in SYN_FACTORS:
+                    name, sign = SYN_FACTORS[i]
+                    syn.append((name, value, sign))
+                elif i in SCALAR_FACTORS:
+                    coef *= np.sign(value) if SCALAR_FACTORS[i] else value
+                else:
+                    raise ValueError("{} is not a valid rule factor".format(i))
+            if syn:
+                self.elementwise.append((coef, pre, post, syn))
+            else:
+                self.rank1.append((coef, pre, post))
+
+    @staticmethod
+    def _product(factors, values, n, dtype):
+        if not factors:
+            return np.ones(n, dtype)
+        # Offsets have the weight dtype, so that spikes stored as bool
+        # or uint8 are promoted to it
+        name, value = factors[0]
+        out = values[name] + dtype.type(value)
+        for name, value in factors[1:]:
+            out = out*(values[name] + dtype.type(value))
+        return out
+
+    def factors(self, values, No, Ne, dtype):
+        """Evaluates the postsynaptic and presynaptic factors of the rule
+
+        Args:
+            values : dictionary with the current value of the pre and
+                postsynaptic variables used by the rule
+            No : number of postsynaptic neurons
+            Ne : number of presynaptic neurons
+            dtype : floating point type of the synaptic variables
+
+        Returns:
+            A list with a tuple (u, v) for each chunk, rank-1 chunks
+            first, where u includes the constant of the chunk. With
+            batched variables, u and v are (batch_size, N) arrays
+        """
+        chunks = self.rank1 + [chunk[:3] for chunk in self.elementwise]
+        out = []
+        for coef, pre, post in chunks:
+            u = coef*self._product(post, values, No, dtype)
+            v = self._product(pre, values, Ne, dtype)
+            # Factors without batched variables are shared by all samples
+            if u.ndim != v.ndim:
+                batch_size = max(u, v, key=np.ndim).shape[0]
+                u = np.broadcast_to(u, state_shape(No, batch_size))
+                v = np.broadcast_to(v, state_shape(Ne, batch_size))
+            out.append((u, v))
+        return out
+
+    @staticmethod
+    def _stack(pairs, No, Ne, dtype):
+        """Stacks factors so that U @ V is the sum of their outer products
+
+        As in `ops.outer`, batched factors are averaged over the batch.
+        """
+        K = sum(1 if u.ndim == 1 else u.shape[0] for u, _ in pairs)
+        U = np.empty((No, K), dtype)
+        V = np.empty((K, Ne), dtype)
+        k = 0
+        for u, v in pairs:
+            if u.ndim == 1:
+                U[:, k] = u
+                V[k] = v
+                k += 1
+            else:
+                batch_size = u.shape[0]
+                U[:, k:k+batch_size] = u.T/batch_size
+                V[k:k+batch_size] = v
+                k += batch_size
+        return U, V
+
+    def combine(self, factors, W, tag):
+        """Sums the chunks of the rule over several evaluations
+
+        Chunks with synaptic factors are evaluated with the given W and
+        tag, so that summing their factors over timesteps is exact as
+        long as W and tag do not change in between.
+
+        Args:
+            factors : a list with, for each chunk, a list of (u, v)
+                tuples returned by `factors`
+            W : synaptic weights
+            tag : synaptic tag
+
+        Returns:
+            An array with the same shape as W
+        """
+        No, Ne = W.shape
+        n = len(self.rank1)
+        pairs = [pair for chunk in factors[:n] for pair in chunk]
+        if pairs:
+            U, V = self._stack(pairs, No, Ne, W.dtype)
+            dx = U @ V
+        else:
+            dx = np.zeros((No, Ne), W.dtype)
+
+        syn_values = {"W": W, "tag": tag}
+        for (coef, pre, post, syn), pairs in zip(self.elementwise, factors[n:]):
+            if not pairs:
+                continue
+            if len(pairs) == 1 and pairs[0][0].ndim == 1:
+                dchunk = np.outer(*pairs[0])
+            else:
+                U, V = self._stack(pairs, No, Ne, W.dtype)
+                dchunk = U @ V
+            for name, value, sign in syn:
+                if sign:
+                    dchunk *= np.sign(syn_values[name] + value)
+                else:
+                    dchunk *= syn_values[name] + value
+            dx += dchunk
+        return dx
+
+    def __call__(self, values, W, tag):
+        """Evaluates the rule
+
+        Args:
+            values : dictionary with the current value of the pre and
+                postsynaptic variables used by the rule
+            W : synaptic weights
+            tag : synaptic tag
+
+        Returns:
+            An array with the same shape as W
+        """
+        No, Ne = W.shape
+        factors = self.factors(values, No, Ne, W.dtype)
+        return self.combine([[pair] for pair in factors], W, tag)
+
 
 class LoihiSynapse(BaseSynapse):
     """General plasticity rule inspired in that of Intel's Loihi chip
 
-    Synaptic delays are ignored. Otherwise the rule follows the
-    same code shown in Intel's IEEE Access Loihi paper.
+    Synaptic delays can be modeled with a `DelayLine` transform, which
+    delays the inputs seen by both the weights and the presynaptic
+    traces. Otherwise the rule follows the same code shown in Intel's
+    IEEE Access Loihi paper. Rules are compiled into a `RuleKernel`
+    when the synapse is created.
+
+    As in Loihi, weights and tag can be updated every few timesteps
+    with a learning_epoch. The factors of the rules are then stored at
+    each timestep, and the changes are computed and committed at the
+    end of the epoch. Chunks involving the weights or the tag use their
+    values at the start of the epoch, and the tag is updated after the
+    weights. With `set_shards`, the rules are evaluated and committed
+    by blocks of postsynaptic rows.
+
+    With `set_batch_size`, each sample keeps its own traces and the
+    changes of weights and tag are averaged over the batch.
     """
 
     def __init__(self, Ne, No, W0, tre, tro, wrule, transform=None,
         tagrule=None, Wlim=1, taglim=1,
-        tre2=None, trm=None, tro2=None, tro3=None, tracelim=10):
+        tre2=None, trm=None, tro2=None, tro3=None, tracelim=10,
+        learning_epoch=1):
         """
         Parameters
         ----------
@@ -50,9 +256,15 @@ class LoihiSynapse(BaseSynapse):
             third postsynaptic trace tuple
         tracelim : float
             clamping parameter for synaptic traces
+        learning_epoch : int
+            number of timesteps between updates of weights and tag
         
         """
 
+        if not isinstance(learning_epoch, (int, np.integer)) or learning_epoch < 1:
+            raise ValueError("learning_epoch must be a positive integer, not {}".format(
+                learning_epoch))
+
         super().__init__(Ne, No, W0, transform)
 
         self.tre = tre
@@ -67,125 +279,185 @@ class LoihiSynapse(BaseSynapse):
 
         self.wrule = wrule
         self.tagrule = tagrule
+        self._wkernel = self._compile(wrule)
+        self._tagkernel = None if tagrule is None else self._compile(tagrule)
 
-        self.te = Trace(self.Ne, self.tre[0], self.tre[1], self.tracelim)
-        self.to = Trace(self.No, self.tro[0], self.tro[1], self.tracelim)
-
-        if self.trm is not None:
-            self.tm = Trace(self.No, self.trm[0], self.trm[1], self.tracelim)
-        if self.tre2 is not None:
-            self.te2 = Trace(self.Ne, self.tre2[0], self.tre2[1], self.tracelim)
-        if self.tro2 is not None:
-            self.to2 = Trace(self.No, self.tro2[0], self.tro2[1], self.tracelim)
-        if self.tro3 is not None:
-            self.to3 = Trace(self.No, self.tro3[0], self.tro3[1], self.tracelim)
-        
-        self.tag = np.zeros((self.No, self.Ne))
+        self._init_traces()
+        self.tag = np.zeros((self.No, self.Ne), self.dtype)
+        self.learning_epoch = int(learning_epoch)
+        self._clear_epoch()
+
+
+    def _compile(self, rule):
+        kernel = RuleKernel(rule)
+        for name in kernel.variables:
+            if name in _TRACES and getattr(self, _TRACES[name]) is None:
+                raise ValueError("Rule requires undefined trace {}".format(_TRACES[name]))
+        return kernel
+
+
+    def _init_traces(self):
+
+        specs = []
+        self._trace_names = []
+        for name, trace in _TRACES.items():
+            params = getattr(self, trace)
+            if params is not None:
+                N = self.Ne if name.startswith("te") else self.No
+                specs.append((N, params[0], params[1], self.tracelim))
+                self._trace_names.append(name)
+        self.traces = TraceBank(specs, self.batch_size, self.dtype)
+        for name, trace in zip(self._trace_names, self.traces.traces):
+            setattr(self, name, trace)
+
+
+    def set_batch_size(self, batch_size):
+        # Pending factors have the shape of the previous batch
+        if hasattr(self, "tag"):
+            self.flush()
+        super().set_batch_size(batch_size)
+        if hasattr(self, "tag"):
+            self._init_traces()
+
+
+    def set_dtype(self, dtype, override=True):
+        super().set_dtype(dtype, override)
+        # BaseSynapse sets the dtype before the traces and the tag exist
+        if hasattr(self, "tag"):
+            self._init_traces()
+            self.tag = self.tag.astype(self.dtype, copy=False)
+
+
+    def _clear_epoch(self):
+        self._epoch_step = 0
+        self._pending_w = [[] for _ in self._wkernel.rank1 + self._wkernel.elementwise]
+        self._pending_tag = None if self._tagkernel is None else \
+            [[] for _ in self._tagkernel.rank1 + self._tagkernel.elementwise]
+
+
+    @property
+    def plastic(self):
+        """Loihi synapses update their traces, weights, and tag"""
+        return True
 
 
     def reset(self):
 
+        self.flush()
         super().reset()
-        self.te.reset()
-        self.to.reset()
-        if self.trm is not None:
-            self.tm.reset()
-        if self.tre2 is not None:
-            self.te2.reset()
-        if self.tro2 is not None:
-            self.to2.reset()
-        if self.tro3 is not None:
-            self.to3.reset()
+        self.traces.reset()
 
 
     def __call__(self, xe, xm):
 
         self.xe = self.transform(xe)
         self.xm = xm 
-        return self.W @ self.xe
+        if self._shards is not None:
+            return sharded_matvec(self.W, self.xe, self.event_driven, *self._shards)
+        return matvec(self.W, self.xe, self.event_driven)
 
 
     def update(self, xo, learn=True):
 
-        self.te.update(self.xe)
-        if self.tre2 is not None:
-            self.te2.update(self.xe)
+        inputs = {"te": self.xe, "te2": self.xe, "to": xo, "to2": xo,
+                  "to3": xo, "tm": self.xm}
+        self.traces.update(*[inputs[name] for name in self._trace_names])
 
-        self.to.update(xo)
+        if learn and self.learning_epoch > 1:
 
-        if self.trm is not None:
-            self.tm.update(self.xm)
+            self._accumulate(self._wkernel, self._pending_w, xo)
+            if self._tagkernel is not None:
+                self._accumulate(self._tagkernel, self._pending_tag, xo)
+            self._epoch_step += 1
+            if self._epoch_step >= self.learning_epoch:
+                self.flush()
 
-        if self.tro2 is not None:
-            self.to2.update(xo)
+        elif learn:
 
-        if self.tro3 is not None:
-            self.to3.update(xo)
+            wfactors = [[pair] for pair in self._factors(self._wkernel, xo)]
+            tagfactors = None
+            if self._tagkernel is not None:
+                tagfactors = [[pair] for pair in self._factors(self._tagkernel, xo)]
+            self._commit(wfactors, tagfactors)
 
-        if learn:
 
-            dW = self.apply_rule(self.wrule, self.xe, xo, xm)
-            self.W += dW
-            self.W[self.W > self.Wlim] = self.Wlim
-            self.W[self.W < -self.Wlim] = -self.Wlim
+    def _factors(self, kernel, xo):
+        values = self._values(kernel, self.xe, xo, self.xm)
+        return kernel.factors(values, self.No, self.Ne, self.dtype)
+
+
+    def _accumulate(self, kernel, pending, xo):
+        for chunk, (u, v) in zip(pending, self._factors(kernel, xo)):
+            if np.any(u):
+                chunk.append((u, v))
+
+
+    def _commit(self, wfactors, tagfactors):
+        """Applies the chunks of the rules, by blocks of rows if sharded
+
+        Args:
+            wfactors : for each chunk of the weight rule, a list of
+                (u, v) factors, see `RuleKernel.combine`
+            tagfactors : same for the tag rule, or None
+        """
+        if self._shards is None:
+            self._commit_rows(wfactors, tagfactors, slice(None))
+            return
+        bounds, executor = self._shards
+        run_calls(executor, [(self._commit_rows, (wfactors, tagfactors, slice(start, end)))
+                             for start, end in bounds])
+
+
+    def _commit_rows(self, wfactors, tagfactors, rows):
+        # Only the postsynaptic factors depend on the rows
+        if rows != slice(None):
+            wfactors = [[(u[..., rows], v) for u, v in chunk] for chunk in wfactors]
+        W = self.W[rows]
+        tag = self.tag[rows]
+        W += self._wkernel.combine(wfactors, W, tag)
+        np.clip(W, -self.Wlim, self.Wlim, out=W)
+        if tagfactors is not None:
+            if rows != slice(None):
+                tagfactors = [[(u[..., rows], v) for u, v in chunk] for chunk in tagfactors]
+            tag += self._tagkernel.combine(tagfactors, W, tag)
+            np.clip(tag, -self.taglim, self.taglim, out=tag)
+
+
+    def flush(self):
+        """Commits the weight and tag changes of the current learning epoch"""
+        if self._epoch_step == 0:
+            return
+        self._commit(self._pending_w, self._pending_tag)
+        self._clear_epoch()
+
+
+    def _values(self, rule, xe, xo, xm):
+        inputs = {"xe": xe, "xo": xo, "xm": xm}
+        values = {}
+        for name in rule.variables:
+            if name in inputs:
+                values[name] = inputs[name]
+            else:
+                values[name] = getattr(self, name)()
+        return values
 
-            if self.tagrule is not None:
-                dtag = self.apply_rule(self.tagrule, self.xe, xo, xm)
-                self.tag += dtag
-                self.tag[self.tag > self.taglim] = self.taglim
-                self.tag[self.tag < -self.taglim] = -self.taglim
-            
 
     def apply_rule(self, rule, xe, xo, xm):
+        """Evaluates a plasticity rule
 
-        dx = np.zeros((self.No, self.Ne))
-        for chunk in rule:
-            dchunk = np.ones((self.No, self.Ne))
-            for i, value in chunk:
-                if i == 0:
-                    dchunk = dchunk*(xe + value)
-
-                elif i == 1:
-                    dchunk = dchunk*(self.te() + value)
-                elif i == 2:
-                    dchunk = dchunk*(self.te2() + value)
-                elif i == 3:
-                    dchunkT = dchunk.T*(xo + value)
-                    dchunk = dchunkT.T
-                elif i == 4:
-                    dchunkT = dchunk.T*(self.to() + value)
-                    dchunk = dchunkT.T
-                elif i == 5:
-                    dchunkT = dchunk.T*(self.to2() + value)
-                    dchunk = dchunkT.T
-                elif i == 6:
-                    dchunkT = dchunk.T*(self.to3() + value)
-                    dchunk = dchunkT.T
-                elif i == 7:
-                    dchunkT = dchunk.T*(xm + value)
-                    dchunk = dchunkT.T
-                elif i == 8:
-                    dchunkT = dchunk.T*(self.tm() + value)
-                    dchunk = dchunkT.T
-                elif i == 9:
-                    dchunk = dchunk*(self.W + value)
-                elif i == 10:
-                    dchunk *= value
-                elif i == 11:
-                    dchunk = dchunk*(self.tag + value)
-                elif i == 12:
-                    dchunk = dchunk*np.sign(self.W + value)
-                elif i == 13:
-                    dchunk = dchunk*np.sign(value)
-                elif i == 14:
-                    dchunk = dchunk*np.sign(self.tag + value)
-                elif i == 15:
-                    dchunk *= value
-                else:
-                    raise ValueError
+        Args:
+            rule : a list of chunks or a compiled `RuleKernel`
+            xe : presynaptic input
+            xo : postsynaptic output
+            xm : modulatory input
 
-            dx += dchunk
-        return dx
+        Returns:
+            A (No, Ne) array with the change of the synaptic variable
+        """
+
+        if not isinstance(rule, RuleKernel):
+            rule = self._compile(rule)
+        return rule(self._values(rule, xe, xo, xm), self.W, self.tag)
 
 
 
@@ -195,7 +467,7 @@ class ModulatedSTDPrule(LoihiSynapse):
     """
 
     def __init__(self, Ne, No, W0, tre, tro, trm, Ap, Ad, transform,
-        Wlim=1, tracelim=10):
+        trace=True, Wlim=1, tracelim=10, learning_epoch=1):
 
         """
         Parameters
@@ -219,10 +491,14 @@ class ModulatedSTDPrule(LoihiSynapse):
             depletion component of STDP
         transform : Transform
             apply a synaptic transform to the input
+        trace : bool
+            if True, uses the modulatory trace instead of the modulatory input
         Wlim : float
             clamping parameter for synaptic weights
         tracelim : float
             clamping parameter for synaptic traces
+        learning_epoch : int
+            number of timesteps between weight updates
         
         """
 
@@ -238,7 +514,8 @@ class ModulatedSTDPrule(LoihiSynapse):
                 ]
 
 
-        super().__init__(Ne, No, W0, tre, tro, wrule, transform, Wlim=Wlim, trm=trm, tracelim=tracelim)
+        super().__init__(Ne, No, W0, tre, tro, wrule, transform, Wlim=Wlim, trm=trm,
+                         tracelim=tracelim, learning_epoch=learning_epoch)
 
 
 class STDPrule(LoihiSynapse):
@@ -247,7 +524,7 @@ class STDPrule(LoihiSynapse):
     """
 
     def __init__(self, Ne, No, W0, tre, tro, trm, Ap, Ad, transform,
-        trace=True, Wlim=1, tracelim=10):
+        trace=True, Wlim=1, tracelim=10, learning_epoch=1):
 
         """
         Parameters
@@ -275,6 +552,8 @@ class STDPrule(LoihiSynapse):
             clamping parameter for synaptic weights
         tracelim : float
             clamping parameter for synaptic traces
+        learning_epoch : int
+            number of timesteps between weight updates
         
         """
 
@@ -290,7 +569,8 @@ class STDPrule(LoihiSynapse):
                 ]
 
 
-        super().__init__(Ne, No, W0, tre, tro, wrule, transform, Wlim=Wlim, trm=trm, tracelim=tracelim)
+        super().__init__(Ne, No, W0, tre, tro, wrule, transform, Wlim=Wlim, trm=trm,
+                         tracelim=tracelim, learning_epoch=learning_epoch)
 
 
 class MSErule(LoihiSynapse):
@@ -299,7 +579,7 @@ class MSErule(LoihiSynapse):
     """
 
     def __init__(self, Ne, No, W0, tre, tro, trm, lr, trace=True,
-        transform=None, Wlim=1, tracelim=10):
+        transform=None, Wlim=1, tracelim=10, learning_epoch=1):
 
         """
         Parameters
@@ -329,6 +609,8 @@ class MSErule(LoihiSynapse):
             clamping parameter for synaptic weights
         tracelim : float
             clamping parameter for synaptic traces
+        learning_epoch : int
+            number of timesteps between weight updates
         
         """
 
@@ -344,6 +626,6 @@ class MSErule(LoihiSynapse):
                 ]
 
         super().__init__(Ne, No, W0, tre, tro, wrule, transform,
-            Wlim=Wlim, trm=trm, tracelim=tracelim)
+            Wlim=Wlim, trm=trm, tracelim=tracelim, learning_epoch=learning_epoch)
 
 
@@ -0,0 +1,308 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Monitors record the activity of a network during a simulation
+
+A monitor reads a variable of a layer, synapse, or trace each time it
+is called with the current timestep. Monitors added to a `SpikingNet`
+through `add_monitor` are called at the end of every timestep.
+
+- `SpikeMonitor` stores spikes as address events, that is, as arrays
+  with the time and the index of each spike, which grow geometrically
+  as needed.
+- `StateMonitor` stores the last values of a variable, such as a
+  membrane potential, the weights, or a trace, in a preallocated ring
+  buffer.
+
+Both monitors can record a subset of the neurons, and record only every
+few timesteps. Monitors created with a `Recorder` write their data to
+disk in chunks instead of keeping it in memory.
+
+"""
+
+import numpy as np
+
+
+def _getter(source, var):
+    """Returns a function reading the current value of a variable
+
+    Args:
+        source : a layer, synapse, trace, or any object
+        var : name of the attribute of source to read. If None, the
+            output of a layer or the value of a trace is used
+
+    Raises:
+        ValueError: the variable cannot be read from the source
+    """
+    if var is not None:
+        def get():
+            value = getattr(source, var)
+            return value() if callable(value) else value
+        get()
+        return get
+    if hasattr(source, "out"):
+        return lambda: source.out
+    if callable(source):
+        return source
+    raise ValueError("Cannot read a variable from {}".format(source))
+
+
+class Monitor:
+    """Base class for monitors
+
+    Args:
+        source : a layer, synapse, trace, or any object
+        var : name of the variable to record (optional, defaults to the
+            output of a layer or the value of a trace)
+        neurons : indices of the neurons to record, along the last axis
+            of the variable (optional, defaults to all)
+        every : records one every `every` timesteps (optional, default 1)
+        recorder : a `Recorder` where full chunks are written (optional)
+        name : prefix of the recorder streams, required with a recorder
+
+    """
+
+    def __init__(self, source, var=None, neurons=None, every=1,
+            recorder=None, name=None):
+        if every < 1:
+            raise ValueError("every must be a positive integer")
+        if recorder is not None and name is None:
+            raise ValueError("Monitors writing to a recorder need a name")
+        self.source = source
+        self.var = var
+        self.neurons = None if neurons is None else np.asarray(neurons, dtype=np.intp)
+        self.every = every
+        self.recorder = recorder
+        self.name = name
+        self._get = _getter(source, var)
+        self._clear()
+        if recorder is not None:
+            recorder.attach(self)
+
+    def reset(self):
+        """Discards all recorded values kept in memory
+
+        Values not yet written to the recorder are written first.
+        """
+        self.flush()
+        self._clear()
+
+    def _clear(self):
+        pass
+
+    def flush(self):
+        """Writes the values kept in memory to the recorder"""
+        pass
+
+    def _read(self):
+        value = np.asarray(self._get())
+        if self.neurons is not None:
+            value = value[..., self.neurons]
+        return value
+
+    def __call__(self, t):
+        """Records the variable at timestep t"""
+        if t % self.every == 0:
+            self._record(t, self._read())
+
+    def _record(self, t, value):
+        raise NotImplementedError()
+
+
+class SpikeMonitor(Monitor):
+    """Records spikes as address events
+
+    Each spike is stored as a timestep in `t` and a neuron index in `i`.
+    When recording a subset of neurons, `i` holds the original neuron
+    indices. Batched layers also store the sample of each spike in
+    `sample`.
+
+    With a recorder, chunks of `capacity` events are written to the
+    streams `<name>.t`, `<name>.i` and `<name>.sample`, and only the
+    events not yet written are kept in memory.
+
+    Args:
+        source : a layer, or any object with spikes
+        var : name of the spike variable (optional, defaults to the
+            output of the layer)
+        neurons : indices of the neurons to record (optional)
+        every : records one every `every` timesteps (optional, default 1)
+        capacity : initial number of events allocated, and number of
+            events per chunk with a recorder (optional, default 1024)
+        recorder : a `Recorder` (optional)
+        name : prefix of the recorder streams (optional)
+
+    """
+
+    def __init__(self, source, var=None, neurons=None, every=1, capacity=1024,
+            recorder=None, name=None):
+        self.capacity = capacity
+        super().__init__(source, var, neurons, every, recorder, name)
+
+    def _clear(self):
+        self._sample = None
+        self._allocate()
+
+    def _allocate(self):
+        self.n = 0
+        self._t = np.empty(self.capacity, np.int64)
+        self._i = np.empty(self.capacity, np.intp)
+        if self._sample is not None:
+            self._sample = np.empty(self.capacity, np.intp)
+
+    def flush(self):
+        if self.recorder is None or self.n == 0:
+            return
+        # The recorder takes ownership of the buffers
+        self.recorder.write(self.name + ".t", self.t)
+        self.recorder.write(self.name + ".i", self.i)
+        if self._sample is not None:
+            self.recorder.write(self.name + ".sample", self.sample)
+        self._allocate()
+
+    def _reserve(self, n):
+        """Makes room for n more events"""
+        size = len(self._t)
+        if self.n + n <= size:
+            return
+        while size < self.n + n:
+            size *= 2
+        for name in ("_t", "_i", "_sample"):
+            old = getattr(self, name)
+            if old is not None:
+                new = np.empty(size, old.dtype)
+                new[:self.n] = old[:self.n]
+                setattr(self, name, new)
+
+    def _record(self, t, value):
+        if value.ndim == 1:
+            i = np.flatnonzero(value)
+            sample = None
+        else:
+            sample, i = np.nonzero(value)
+            if self._sample is None:
+                self._sample = np.zeros(len(self._t), np.intp)
+        n = len(i)
+        if n == 0:
+            return
+        if self.recorder is not None and self.n + n > len(self._t):
+            self.flush()
+        self._reserve(n)
+        end = self.n + n
+        self._t[self.n:end] = t
+        self._i[self.n:end] = i if self.neurons is None else self.neurons[i]
+        if sample is not None:
+            self._sample[self.n:end] = sample
+        self.n = end
+
+    @property
+    def t(self):
+        """Timesteps of the recorded spikes"""
+        return self._t[:self.n]
+
+    @property
+    def i(self):
+        """Neuron indices of the recorded spikes"""
+        return self._i[:self.n]
+
+    @property
+    def sample(self):
+        """Batch samples of the recorded spikes, None if unbatched"""
+        return None if self._sample is None else self._sample[:self.n]
+
+    def counts(self, N=None):
+        """Returns the number of recorded spikes of each neuron
+
+        Args:
+            N : number of neurons (optional, defaults to the largest
+                recorded index plus one)
+        """
+        return np.bincount(self.i, minlength=0 if N is None else N)
+
+
+class StateMonitor(Monitor):
+    """Records a variable in a ring buffer
+
+    Keeps the last `size` recorded values of a variable, such as the
+    membrane potential `v` of a layer, the weights `W` of a synapse, or
+    a trace. The buffer is allocated at the first recording, and is
+    never reallocated.
+
+    With a recorder, the buffer is written to the streams `<name>.t`
+    and `<name>.values` each time it is full, and replaced by a new one.
+    Only the values not yet written are then kept in memory.
+
+    Args:
+        source : a layer, synapse, trace, or any object
+        var : name of the variable to record (optional, defaults to the
+            output of a layer or the value of a trace)
+        neurons : indices to record, along the last axis of the
+            variable (optional)
+        every : records one every `every` timesteps (optional, default 1)
+        size : number of values kept, and number of values per chunk
+            with a recorder (optional, default 1000)
+        recorder : a `Recorder` (optional)
+        name : prefix of the recorder streams (optional)
+
+    """
+
+    def __init__(self, source, var=None, neurons=None, every=1, size=1000,
+            recorder=None, name=None):
+        if size < 1:
+            raise ValueError("size must be a positive integer")
+        self.size = size
+        super().__init__(source, var, neurons, every, recorder, name)
+
+    def _clear(self):
+        self.n = 0
+        self._flushed = 0
+        self._values = None
+        self._t = np.empty(self.size, np.int64)
+
+    def flush(self):
+        if self.recorder is None or self._values is None:
+            return
+        pending = self._pending()
+        if pending == 0:
+            return
+        # The recorder takes ownership of the buffers
+        self.recorder.write(self.name + ".t", self._t[:pending])
+        self.recorder.write(self.name + ".values", self._values[:pending])
+        self._t = np.empty(self.size, np.int64)
+        self._values = np.empty_like(self._values)
+        self._flushed = self.n
+
+    def _pending(self):
+        return self.n - self._flushed
+
+    def _record(self, t, value):
+        if self._values is None:
+            self._values = np.empty((self.size,) + value.shape, value.dtype)
+        if self.recorder is not None:
+            if self._pending() == self.size:
+                self.flush()
+            k = self._pending()
+        else:
+            k = self.n % self.size
+        self._values[k] = value
+        self._t[k] = t
+        self.n += 1
+
+    def _order(self, x):
+        if self.recorder is not None:
+            return x[:self._pending()]
+        if self.n <= self.size:
+            return x[:self.n]
+        k = self.n % self.size
+        return np.concatenate((x[k:], x[:k]))
+
+    @property
+    def t(self):
+        """Timesteps of the stored values, in chronological order"""
+        return self._order(self._t)
+
+    @property
+    def values(self):
+        """Stored values in chronological order, with time as first axis"""
+        if self._values is None:
+            return None
+        return self._order(self._values)
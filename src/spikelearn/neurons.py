@@ -10,20 +10,47 @@ defined.
 """
 
 from .layer import Layer
+from .ops import state_shape, matvec, cast
 
 import numpy as np
 
-def hard(x):
+def hard(x, out=None):
     """Implements a Heaviside or step function
     
     Args:
         x: a numpy array object
+        out: optional array where the result is stored
 
     Returns:
         An array: 1 if x>0, 0 otherwise
 
     """
-    return np.where(x>=0, 1.0, 0.0).astype(x.dtype)
+    if out is None:
+        return (x>=0).astype(x.dtype)
+    return np.greater_equal(x, 0, out=out)
+
+
+def sum_inputs(x, out):
+    """Adds a tuple of inputs
+
+    Args:
+        x: a tuple of arrays
+        out: array where the sum is stored if there is more than one input
+
+    Returns:
+        The only input if the tuple has one element, out otherwise. out
+        is zeroed if there are no inputs
+    """
+    if len(x) == 1:
+        return x[0]
+    if len(x) == 0:
+        out[...] = 0
+        return out
+    np.add(x[0], x[1], out=out)
+    for xi in x[2:]:
+        np.add(out, xi, out=out)
+    return out
+
 
 class LIFLayer(Layer):
     """Implements a leaky integrate and fire
@@ -31,25 +58,39 @@ class LIFLayer(Layer):
     Implements a layer of LIF neurons. Its interface conforms
     to that of a `Layer` object. 
 
+    The membrane potential and the spikes alternate between two
+    preallocated buffers, so that a timestep does not allocate memory.
+    Arrays returned by the layer remain valid during the next timestep,
+    and are overwritten by the one after it: copy them to keep them.
+
     Args:
 
         N : Neurons in the layer
         tau : decay time, in timestep units
         v0  : threshold value (optional, default 1)
         refr : boolean, neuron has 1 timestep refractory period
+        dtype : floating point type of the layer state (optional)
+        spike_dtype : type of the output spikes, such as bool or uint8
+            (optional, defaults to dtype)
 
     """
 
-    def __init__(self, N, tau, v0=1, refr=True):
+    sums_inputs = True
+
+    def __init__(self, N, tau, v0=1, refr=True, dtype=None, spike_dtype=None):
         """Instantiates a layer of LIF neuron
         """
 
         self._N = N
         self._tau = tau
-        self._a = np.exp(-1./tau)
-        self._b = 1-self._a
         self._v0 = v0*np.ones(N)
         self._refr = refr
+        if dtype is not None:
+            self.dtype = np.dtype(dtype)
+            self._dtype_fixed = True
+        if spike_dtype is not None:
+            self.spike_dtype = np.dtype(spike_dtype)
+            self._spike_dtype_fixed = True
         self.reset()
         self._group_synapses = False
 
@@ -88,12 +129,21 @@ class LIFLayer(Layer):
         
         """
 
-        xtot = sum(x)
+        s, buf = self._s, self._buf
+        xtot = sum_inputs(x, self._xtot)
+        v = np.multiply(self._v, self._a, out=self._v_next)
         if self._refr:
-            self._v = (1-self._s) * (self._a * self._v + self._b * xtot)
+            np.multiply(xtot, self._b, out=buf)
+            v += buf
+            np.multiply(v, s, out=buf)
+            v -= buf
         else:
-            self._v = (1-self._s) * self._a * self._v + self._b * xtot
-        self._s = hard(self._v-self._v0)
+            np.multiply(v, s, out=buf)
+            v -= buf
+            np.multiply(xtot, self._b, out=buf)
+            v += buf
+        self._v_next, self._v = self._v, v
+        self._s_next, self._s = s, np.greater_equal(v, self._v0, out=self._s_next)
         return self._s
 
     def step(self, *x):
@@ -111,8 +161,16 @@ class LIFLayer(Layer):
     def reset(self):
         """Resets the neuron internal state
         """
-        self._v = np.zeros(self.N)
-        self._s = np.zeros(self.N)
+        shape = state_shape(self.N, self.batch_size)
+        self._a = cast(np.exp(-1./self._tau), self.dtype)
+        self._b = 1-self._a
+        self._v0 = self._v0.astype(self.dtype, copy=False)
+        self._v = np.zeros(shape, self.dtype)
+        self._v_next = np.zeros(shape, self.dtype)
+        self._s = np.zeros(shape, self._spike_dtype())
+        self._s_next = np.zeros(shape, self._spike_dtype())
+        self._xtot = np.zeros(shape, self.dtype)
+        self._buf = np.zeros(shape, self.dtype)
 
     @property
     def out(self):
@@ -136,10 +194,12 @@ class SpikingRecLayer(LIFLayer):
         tau : decay time, in timestep units
         Wrec: a 2D array with synaptic weights
         v0 (optional, default 1) : threshold value
+        dtype (optional) : floating point type of the layer state
+        spike_dtype (optional) : type of the output spikes
 
     """
 
-    def __init__(self, N, tau, Wrec, v0=1):
+    def __init__(self, N, tau, Wrec, v0=1, dtype=None, spike_dtype=None):
         """Instantiates a layer of LIF neurons with recurrent weights
 
         Args:
@@ -148,11 +208,17 @@ class SpikingRecLayer(LIFLayer):
             tau : decay time, in timestep units
             Wrec: a 2D array with synaptic weights
             v0 (optional, default 1) : threshold value
+            dtype (optional) : floating point type of the layer state
+            spike_dtype (optional) : type of the output spikes
 
         """
 
         self.Wrec = Wrec
-        super().__init__(N, tau, v0)
+        super().__init__(N, tau, v0, dtype=dtype, spike_dtype=spike_dtype)
+
+    def reset(self):
+        super().reset()
+        self.Wrec = self.Wrec.astype(self.dtype, copy=False)
 
 
     def __call__(self, *x):
@@ -165,17 +231,23 @@ class SpikingRecLayer(LIFLayer):
             An array of spikes, 1 if a neuron spikes 0 otherwise
         
         """
-        xn = x + (self.Wrec @ self.s,)
+        xn = x + (matvec(self.Wrec, self.s),)
         return super().__call__(*xn)
 
 
 
 class BioLIFLayer(Layer):
 
-    def __init__(self, N, nudt, v0=0.5):
+    def __init__(self, N, nudt, v0=0.5, dtype=None, spike_dtype=None):
         self.N = N
         self.nu0 = nudt
         self.v0 = v0
+        if dtype is not None:
+            self.dtype = np.dtype(dtype)
+            self._dtype_fixed = True
+        if spike_dtype is not None:
+            self.spike_dtype = np.dtype(spike_dtype)
+            self._spike_dtype_fixed = True
         self.reset()
         self._group_synapses = True
 
@@ -184,21 +256,39 @@ class BioLIFLayer(Layer):
         return self._group_synapses
 
     def reset(self):
-        self.v = np.zeros(self.N)
-        self.vold = np.zeros(self.N)
-        self.s = np.zeros(self.N)
+        shape = state_shape(self.N, self.batch_size)
+        self._mnu0 = cast(-self.nu0, self.dtype)
+        self._v0 = cast(self.v0, self.dtype)
+        self.v = np.zeros(shape, self.dtype)
+        self._v_next = np.zeros(shape, self.dtype)
+        self.vold = np.zeros(shape, self.dtype)
+        self.s = np.zeros(shape, self._spike_dtype())
+        self._s_next = np.zeros(shape, self._spike_dtype())
+        self.nu = np.zeros(shape, self.dtype)
+        self.de = np.zeros(shape, self.dtype)
+        self._a = np.zeros(shape, self.dtype)
+        self._buf = np.zeros(shape, self.dtype)
 
 
     def __call__(self, xe, xi, perf=False):
-        self.nu = (1+xe+xi)
-        a = np.exp(-self.nu0*self.nu)
-        self.de = xe/self.nu
-        self.v = self.vold * a + self.de*(1-a)
-        self.s = hard(self.v-self.v0)
+        # v and s alternate between two buffers, see LIFLayer
+        nu, a, de, buf = self.nu, self._a, self.de, self._buf
+        np.add(xe, 1, out=nu)
+        nu += xi
+        np.multiply(nu, self._mnu0, out=a)
+        np.exp(a, out=a)
+        np.divide(xe, nu, out=de)
+        v = np.multiply(self.vold, a, out=self._v_next)
+        np.subtract(1, a, out=buf)
+        buf *= de
+        v += buf
+        self._v_next, self.v = self.v, v
+        self._s_next, self.s = self.s, np.greater_equal(v, self._v0, out=self._s_next)
         if perf:
             self.xe = xe
             self.calc_perf()
-        self.vold = (1-self.s)*self.v
+        np.multiply(v, self.s, out=buf)
+        np.subtract(v, buf, out=self.vold)
         return self.s
 
     @property
@@ -0,0 +1,374 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Array operations shared by neurons, synapses, and learning rules
+
+Layers, synapses, and traces hold their state either as 1D arrays of
+length N or, when a network simulates several independent samples at
+once, as 2D arrays of shape (batch_size, N). The functions in this
+module hide the difference between both cases.
+
+"""
+
+import numpy as np
+from .sparse import SparseWeights
+from .parallel import run_calls
+
+
+def state_shape(N, batch_size=None):
+    """Returns the shape of a state array
+
+    Args:
+        N : number of neurons
+        batch_size : number of independent samples (optional)
+
+    Returns:
+        (N,) if batch_size is None, (batch_size, N) otherwise
+    """
+    if batch_size is None:
+        return (N,)
+    return (batch_size, N)
+
+
+def cast(value, dtype):
+    """Converts a scalar or an array to a given dtype
+
+    Scalars are returned as numpy scalars, so that they do not promote
+    arrays of lower precision in arithmetic operations.
+
+    Args:
+        value : a scalar or an array
+        dtype : a numpy dtype
+
+    Returns:
+        A numpy scalar or an array of the given dtype
+    """
+    return np.asarray(value, dtype=dtype)[()]
+
+
+def weight_dtype(W):
+    """Returns the floating point dtype of synaptic weights"""
+    dtype = W.dtype if isinstance(W, SparseWeights) else np.asarray(W).dtype
+    if np.issubdtype(dtype, np.floating):
+        return dtype
+    return np.dtype(np.float64)
+
+
+def cast_weights(W, dtype):
+    """Converts synaptic weights to a given dtype, copying only if needed"""
+    if isinstance(W, SparseWeights):
+        return W.astype(dtype)
+    return cast(W, dtype)
+
+
+def outer(xo, xe):
+    """Outer product of postsynaptic and presynaptic activity
+
+    For batched inputs the outer products of each sample are averaged,
+    so that learning rates do not depend on the batch size.
+
+    Args:
+        xo : postsynaptic array, shape (No,) or (B, No)
+        xe : presynaptic array, shape (Ne,) or (B, Ne)
+
+    Returns:
+        A (No, Ne) array
+    """
+    if np.ndim(xo) == 1:
+        return np.outer(xo, xe)
+    return (xo.T @ xe)/xo.shape[0]
+
+
+def outer_at(xo, xe, rows, cols):
+    """Elements (rows, cols) of the outer product of xo and xe
+
+    Equivalent to `outer(xo, xe)[rows, cols]` without computing the
+    full outer product.
+
+    Args:
+        xo : postsynaptic array, shape (No,) or (B, No)
+        xe : presynaptic array, shape (Ne,) or (B, Ne)
+        rows : postsynaptic indices
+        cols : presynaptic indices
+
+    Returns:
+        A 1D array with the same length as rows and cols
+    """
+    if np.ndim(xo) == 1:
+        return xo[rows]*xe[cols]
+    return np.einsum("bi,bi->i", xo[:, rows], xe[:, cols])/xo.shape[0]
+
+
+#: Maximum fraction of active inputs for which synapses use the
+#: event-driven propagation path
+EVENT_DENSITY = 0.05
+
+
+def active_columns(x, max_density=EVENT_DENSITY):
+    """Returns the indices of the active inputs of a sparse input
+
+    For batched inputs, an input is active if it is nonzero in any
+    of the samples.
+
+    Args:
+        x : input array, shape (N,) or (B, N)
+        max_density : maximum fraction of active inputs
+
+    Returns:
+        An array of indices, or None if the fraction of active
+        inputs is larger than max_density
+    """
+    active = x if x.ndim == 1 else np.any(x, axis=0)
+    idx = np.flatnonzero(active)
+    if len(idx) > max_density*active.shape[0]:
+        return None
+    return idx
+
+
+def event_matvec(W, x, idx):
+    """Event-driven product of a weight matrix and a sparse input
+
+    Computes the same result as `x @ W.T` using only the columns of W
+    corresponding to active inputs. Unbatched boolean inputs only add up
+    the active columns.
+
+    Args:
+        W : (No, Ne) weight matrix
+        x : input array, shape (Ne,) or (B, Ne)
+        idx : indices of the active inputs, as returned by
+            `active_columns`
+
+    Returns:
+        An array of shape (No,) or (B, No)
+    """
+    if x.dtype == bool and x.ndim == 1:
+        return W[:, idx].sum(axis=1)
+    return x[..., idx] @ W[:, idx].T
+
+
+def matvec(W, x, event_driven=None):
+    """Product of a weight matrix and an input
+
+    Args:
+        W : (No, Ne) weight matrix or `SparseWeights` object
+        x : input array, shape (Ne,) or (B, Ne)
+        event_driven : if None, uses the event-driven path when at most
+            a fraction `EVENT_DENSITY` of the inputs is active. True
+            always uses the event-driven path, False never does. For
+            sparse weights, the event-driven path reads the synapses
+            of the active inputs through their column index.
+
+    Returns:
+        An array of shape (No,) or (B, No)
+    """
+    idx = None
+    if event_driven is not False:
+        idx = active_columns(x, 1.0 if event_driven else EVENT_DENSITY)
+    if isinstance(W, SparseWeights):
+        return W.dot(x, idx)
+    if idx is not None:
+        return event_matvec(W, x, idx)
+    return x @ W.T
+
+
+def shard_bounds(N, shards):
+    """Splits N rows into at most `shards` blocks of similar size
+
+    Returns:
+        A list of tuples (start, end)
+    """
+    edges = np.linspace(0, N, min(shards, N) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def sharded_matvec(W, x, event_driven, bounds, executor):
+    """Product of a weight matrix and an input, by blocks of rows
+
+    Computes the same result as `matvec` for a dense weight matrix, with
+    each block of postsynaptic rows computed as a separate task. Active
+    inputs are found once for all the blocks.
+
+    Args:
+        W : (No, Ne) weight matrix
+        x : input array, shape (Ne,) or (B, Ne)
+        event_driven : see `matvec`
+        bounds : list of row blocks (start, end), see `shard_bounds`
+        executor : a thread pool, or None to compute the blocks
+            sequentially
+
+    Returns:
+        An array of shape (No,) or (B, No)
+    """
+    idx = None
+    if event_driven is not False:
+        idx = active_columns(x, 1.0 if event_driven else EVENT_DENSITY)
+    out = np.empty(x.shape[:-1] + (W.shape[0],), np.result_type(x.dtype, W.dtype))
+
+    def block(start, end):
+        if idx is None:
+            out[..., start:end] = x @ W[start:end].T
+        else:
+            out[..., start:end] = event_matvec(W[start:end], x, idx)
+
+    run_calls(executor, [(block, b) for b in bounds])
+    return out
+
+
+def sharded_rank1_update(W, terms, Wmin, Wmax, bounds, executor):
+    """Applies `rank1_update` by blocks of rows
+
+    Traces given as presynaptic factors are evaluated once, before the
+    blocks are updated as separate tasks.
+
+    Args:
+        W, terms, Wmin, Wmax : see `rank1_update`
+        bounds : list of row blocks (start, end), see `shard_bounds`
+        executor : a thread pool, or None
+    """
+    resolved = []
+    for c, u, v in terms:
+        if callable(v):
+            if not np.any(u):
+                continue
+            v = v()
+        resolved.append((c, u, v))
+    run_calls(executor, [
+        (rank1_update, (W[start:end], [(c, u[start:end], v) for c, u, v in resolved],
+                        Wmin, Wmax))
+        for start, end in bounds])
+
+
+def sharded_add_clip(W, dW, Wmin, Wmax, bounds, executor):
+    """Adds a weight change and clamps the weights, by blocks of rows"""
+    def block(start, end):
+        Wb = W[start:end]
+        Wb += dW[start:end]
+        Wb[Wb > Wmax] = Wmax
+        Wb[Wb < Wmin] = Wmin
+
+    run_calls(executor, [(block, b) for b in bounds])
+
+
+def rank1_update(W, terms, Wmin, Wmax):
+    """Adds a sum of rank-1 terms to a weight matrix in place
+
+    Computes `W += sum(c*outer(u, v) for c, u, v in terms)` and clamps
+    the result between Wmin and Wmax. Each term only touches its own
+    block, the rows where u is nonzero and the columns where v is
+    nonzero, and terms with no activity are skipped. The block of a
+    term is clamped as a band of rows if it has few rows, or as a band
+    of columns otherwise, so that the cost is proportional to the
+    activity instead of the size of W, even when a trace makes one of
+    the factors dense. Weights outside the updated blocks are assumed
+    to be already within bounds.
+
+    Args:
+        W : (No, Ne) weight matrix
+        terms : iterable of tuples (c, u, v) with a scalar c, a
+            postsynaptic (No,) array u, and a presynaptic (Ne,) array v.
+            v can also be a callable returning the array, such as a
+            trace, which is then only evaluated if u is nonzero
+        Wmin : lower bound of the weights
+        Wmax : upper bound of the weights
+    """
+    No, Ne = W.shape
+    band_rows = []
+    band_cols = []
+    for c, u, v in terms:
+        rows = np.flatnonzero(u)
+        if len(rows) == 0:
+            continue
+        if callable(v):
+            v = v()
+        cols = np.flatnonzero(v)
+        if len(cols) == 0:
+            continue
+        full_rows = len(rows) == No
+        full_cols = len(cols) == Ne
+        ur = u if full_rows else u[rows]
+        vc = v if full_cols else v[cols]
+        if full_rows and full_cols:
+            W += c*np.outer(ur, vc)
+        elif full_rows:
+            W[:, cols] += c*np.outer(ur, vc)
+        elif full_cols:
+            W[rows] += c*np.outer(ur, vc)
+        else:
+            W[np.ix_(rows, cols)] += c*np.outer(ur, vc)
+        if len(rows)*Ne <= No*len(cols):
+            band_rows.append(rows)
+        else:
+            band_cols.append(cols)
+    _clip_bands(W, band_rows, band_cols, Wmin, Wmax)
+
+
+def _clip_bands(W, band_rows, band_cols, Wmin, Wmax):
+    """Clamps the given rows and columns of W, each weight only once"""
+    No, Ne = W.shape
+    rows = np.unique(np.concatenate(band_rows)) if band_rows else None
+    cols = np.unique(np.concatenate(band_cols)) if band_cols else None
+    if (rows is not None and len(rows) == No) or (cols is not None and len(cols) == Ne):
+        np.clip(W, Wmin, Wmax, out=W)
+        return
+    if rows is not None:
+        band = W[rows]
+        np.clip(band, Wmin, Wmax, out=band)
+        W[rows] = band
+    if cols is not None:
+        if rows is None:
+            index = (slice(None), cols)
+        else:
+            index = np.ix_(np.setdiff1d(np.arange(No), rows, assume_unique=True), cols)
+        band = W[index]
+        np.clip(band, Wmin, Wmax, out=band)
+        W[index] = band
+
+
+def _add_block(W, dW, rows, cols, full_rows, full_cols, Wmin, Wmax):
+    """Adds dW to the block (rows, cols) of W and clamps the block"""
+    if full_rows and full_cols:
+        W += dW
+        np.clip(W, Wmin, Wmax, out=W)
+        return
+    if full_rows:
+        index = (slice(None), cols)
+    elif full_cols:
+        index = rows
+    else:
+        index = np.ix_(rows, cols)
+    block = W[index]
+    block += dW
+    np.clip(block, Wmin, Wmax, out=block)
+    W[index] = block
+
+
+def lowrank_update(W, U, V, Wmin, Wmax):
+    """Adds a low rank product to a weight matrix in place
+
+    Computes `W += U @ V` with a single matrix product and clamps the
+    result between Wmin and Wmax, only touching the rows where U is
+    nonzero and the columns where V is nonzero. Used to commit the sum
+    of the rank-1 terms of several timesteps at once. Weights outside
+    the updated block are assumed to be already within bounds.
+
+    Args:
+        W : (No, Ne) weight matrix
+        U : (No, m) array
+        V : (m, Ne) array
+        Wmin : lower bound of the weights
+        Wmax : upper bound of the weights
+    """
+    rows = np.flatnonzero(np.any(U, axis=1))
+    cols = np.flatnonzero(np.any(V, axis=0))
+    if len(rows) == 0 or len(cols) == 0:
+        return
+    full_rows = len(rows) == W.shape[0]
+    full_cols = len(cols) == W.shape[1]
+    Ur = U if full_rows else U[rows]
+    Vc = V if full_cols else V[:, cols]
+    _add_block(W, Ur @ Vc, rows, cols, full_rows, full_cols, Wmin, Wmax)
+
+
+def sharded_lowrank_update(W, U, V, Wmin, Wmax, bounds, executor):
+    """Applies `lowrank_update` by blocks of rows, see `sharded_matvec`"""
+    run_calls(executor, [(lowrank_update, (W[start:end], U[start:end], V, Wmin, Wmax))
+                         for start, end in bounds])
@@ -0,0 +1,80 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Thread-parallel execution of independent computations
+
+NumPy releases the global interpreter lock in matrix products and in
+most ufuncs, so that independent computations on large arrays, such as
+the elements of a network within a timestep, can run concurrently on
+several cores using threads. Small computations are better run
+sequentially, as each task adds a few microseconds of overhead.
+
+When NumPy uses a multithreaded BLAS library, the number of BLAS
+threads may need to be reduced, for instance through the environment
+variable `OPENBLAS_NUM_THREADS`, to avoid running more threads than
+cores.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def make_executor(threads):
+    """Returns a thread pool, or None for sequential execution
+
+    Args:
+        threads : number of worker threads. None, 0 or 1 run
+            sequentially
+    """
+    if threads is None or threads <= 1:
+        return None
+    return ThreadPoolExecutor(threads, thread_name_prefix="spikelearn")
+
+
+def run_calls(executor, calls):
+    """Runs independent function calls and waits for all of them
+
+    The first call is run in the calling thread and the others in the
+    executor. If the executor is None, calls are run sequentially.
+
+    Args:
+        executor : a `concurrent.futures.Executor`, or None
+        calls : list of tuples (function, args)
+
+    Returns:
+        The list of results, in the order of the calls
+
+    Raises:
+        The first exception raised by a call, once all calls are done
+    """
+    if executor is None or len(calls) < 2:
+        return [f(*args) for f, args in calls]
+    futures = [executor.submit(f, *args) for f, args in calls[1:]]
+    try:
+        f, args = calls[0]
+        first = f(*args)
+    finally:
+        rest = [future.exception() for future in futures]
+    for e in rest:
+        if e is not None:
+            raise e
+    return [first] + [future.result() for future in futures]
+
+
+_shared = {}
+
+
+def shared_executor(threads):
+    """Returns a thread pool shared by all the callers with the same size
+
+    Used for the shards of synapses, so that synapses do not each
+    create their own threads. Shard tasks never wait for other tasks,
+    so that a shared pool cannot deadlock.
+
+    Args:
+        threads : number of worker threads
+    """
+    executor = _shared.get(threads)
+    if executor is None:
+        executor = make_executor(threads)
+        _shared[threads] = executor
+    return executor
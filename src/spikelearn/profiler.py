@@ -0,0 +1,188 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Wall time profiling of the parts of a network
+
+A `Profiler` attached to a `StreamNet` or a `SpikingNet` measures the
+time spent in the forward pass of each timestep, in each element, and,
+for the layers of a `SpikingNet`, in the neuron update, in each synapse,
+in the learning updates broadcast at the end of the timestep, and in
+the traces and weight changes of the learning rules.
+
+The profiler replaces the methods it measures by timed wrappers when
+it is attached, and restores them when it is detached, so that a
+network that is not profiled runs exactly the same code as before.
+Times are inclusive: the time of an element includes the time of its
+synapses, and the time of the forward pass includes the time of all
+the elements.
+
+"""
+
+from time import perf_counter
+
+import numpy as np
+
+
+class Profiler:
+    """Records the number of calls and the wall time of network parts
+
+    Each measured part is identified by a label, such as `forward`,
+    `update`, `<layer>`, `<layer>/neuron`, `<layer>/synapse<i>`,
+    `<layer>/synapse<i>.update`, `<layer>/synapse<i>.traces` or
+    `<layer>/synapse<i>.apply_rule`. Rules computing their weight
+    changes as rank-1 terms are measured under `rank1_terms`, and the
+    weight updates committed at the end of a learning epoch under
+    `flush`. With `fuse_synapses`, the products of the fused synapses
+    of a layer are measured under `<layer>/fused`, and not under the
+    labels of each synapse.
+
+    Args:
+        samples : if True, the duration of every call is kept in
+            addition to the totals (optional, default False)
+
+    """
+
+    def __init__(self, samples=False):
+        self.samples = samples
+        self.stats = {}
+        self.net = None
+        self._restore = []
+
+    def timer(self, label, f):
+        """Returns a function calling f and recording its duration"""
+        stats = self.stats.setdefault(label, [0, 0.0, 0.0, []])
+        keep = stats[3].append if self.samples else None
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            out = f(*args, **kwargs)
+            dt = perf_counter() - start
+            stats[0] += 1
+            stats[1] += dt
+            if dt > stats[2]:
+                stats[2] = dt
+            if keep is not None:
+                keep(dt)
+            return out
+        return timed
+
+    def _patch(self, obj, name, label):
+        """Replaces a method of an object by a timed one"""
+        if name in vars(obj):
+            old = vars(obj)[name]
+            self._restore.append(lambda: setattr(obj, name, old))
+        else:
+            self._restore.append(lambda: delattr(obj, name))
+        setattr(obj, name, self.timer(label, getattr(obj, name)))
+
+    def _patch_item(self, items, i, label):
+        old = items[i]
+        self._restore.append(lambda: items.__setitem__(i, old))
+        items[i] = self.timer(label, old)
+
+    def attach(self, net):
+        """Starts measuring a network
+
+        Args:
+            net : a `StreamNet` or `SpikingNet`
+
+        Raises:
+            ValueError: the profiler is already attached
+        """
+        if self.net is not None:
+            raise ValueError("Profiler is already attached to a network")
+        self.net = net
+        self._patch(net, "_step", "forward")
+        if hasattr(net, "update"):
+            self._patch(net, "update", "update")
+        for name, el in net._elements.items():
+            if hasattr(el, "_call_neuron"):
+                self._patch(el, "_call_neuron", name + "/neuron")
+            if hasattr(el, "_call_fused_synapses"):
+                self._patch(el, "_call_fused_synapses", name + "/fused")
+            for i, syn in enumerate(getattr(el, "_synapses", ())):
+                label = "{}/synapse{}".format(name, i)
+                self._patch_item(el._syn_calls, i, label)
+                self._patch(syn, "update", label + ".update")
+                rule = getattr(syn, "learning_rule", None)
+                traces = getattr(rule, "traces", getattr(syn, "traces", None))
+                if hasattr(traces, "update"):
+                    self._patch(traces, "update", label + ".traces")
+                for method in ("apply_rule", "apply_rule_sparse", "rank1_terms", "flush"):
+                    if hasattr(rule, method):
+                        self._patch(rule, method, "{}.{}".format(label, method))
+                    elif hasattr(syn, method):
+                        self._patch(syn, method, "{}.{}".format(label, method))
+        # Elements are timed in the execution plan
+        net._profiler = self
+        net.invalidate()
+
+    def detach(self):
+        """Stops measuring and restores the methods of the network"""
+        if self.net is None:
+            return
+        for restore in reversed(self._restore):
+            restore()
+        self._restore = []
+        self.net._profiler = None
+        self.net.invalidate()
+        self.net = None
+
+    def reset(self):
+        """Discards all the measurements"""
+        for stats in self.stats.values():
+            stats[:3] = [0, 0.0, 0.0]
+            stats[3].clear()
+
+    def as_dict(self):
+        """Returns the measurements
+
+        Returns:
+            A dictionary mapping each label to a dictionary with the
+            number of calls, and the total, mean, and maximum time in
+            seconds. With samples, the duration of each call is given
+            as an array under samples.
+        """
+        out = {}
+        for label, (calls, total, longest, samples) in self.stats.items():
+            out[label] = {"calls": calls, "total": total,
+                          "mean": total/calls if calls else 0.0, "max": longest}
+            if self.samples:
+                out[label]["samples"] = np.array(samples)
+        return out
+
+    def report(self, sort="total", limit=None):
+        """Returns a table with the measurements
+
+        Parts that were never called are omitted. The last column gives
+        the share of the total time of the forward passes and learning
+        updates.
+
+        Args:
+            sort : column used to sort the parts, one of total, mean,
+                max, calls (optional, default total)
+            limit : maximum number of parts (optional)
+
+        Raises:
+            ValueError: unknown sort column
+        """
+        if sort not in ("total", "mean", "max", "calls"):
+            raise ValueError("Cannot sort by {}".format(sort))
+        stats = {k: s for k, s in self.as_dict().items() if s["calls"] > 0}
+        labels = sorted(stats, key=lambda k: stats[k][sort], reverse=True)[:limit]
+        step = sum(stats[k]["total"] for k in ("forward", "update") if k in stats)
+        width = max([len(k) for k in labels] + [4])
+        lines = ["{:<{w}} {:>10} {:>12} {:>12} {:>12} {:>7}".format(
+            "part", "calls", "total ms", "mean us", "max us", "%time", w=width)]
+        for k in labels:
+            s = stats[k]
+            share = 100*s["total"]/step if step else 0.0
+            lines.append("{:<{w}} {:>10} {:>12.3f} {:>12.2f} {:>12.2f} {:>7.1f}".format(
+                k, s["calls"], 1e3*s["total"], 1e6*s["mean"], 1e6*s["max"], share,
+                w=width))
+        return "\n".join(lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.detach()
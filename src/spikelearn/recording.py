@@ -0,0 +1,165 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+On-disk recording for long simulations
+
+A `Recorder` streams the data of monitors to a directory, with one
+`.npy` file per recorded array. Monitors created with a recorder hand
+over their buffers whenever a chunk is full, and a background thread
+appends them to disk, so that the simulation does not wait for I/O.
+Files are valid `.npy` files once the recorder is closed, and
+`open_recording` memory-maps them back for analysis without loading
+them into memory.
+
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+from numpy.lib import format as npy_format
+
+
+#: Size in bytes reserved for the header of recorded .npy files
+HEADER_SIZE = 256
+
+
+def _write_header(f, dtype, shape):
+    """Writes a fixed size .npy version 1.0 header"""
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+        npy_format.dtype_to_descr(dtype), tuple(shape))
+    header_len = HEADER_SIZE - len(npy_format.MAGIC_PREFIX) - 4
+    if len(header) >= header_len:
+        raise ValueError("Header of dtype {} too long".format(dtype))
+    f.seek(0)
+    f.write(npy_format.MAGIC_PREFIX + bytes([1, 0]))
+    f.write(np.uint16(header_len).tobytes())
+    f.write((header.ljust(header_len - 1) + "\n").encode("latin1"))
+
+
+class _Stream:
+
+    def __init__(self, path, dtype, shape):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.length = 0
+        self.file = open(path, "wb")
+        _write_header(self.file, self.dtype, (0,) + self.shape)
+
+    def write(self, chunk):
+        chunk.tofile(self.file)
+        self.length += len(chunk)
+
+    def close(self):
+        _write_header(self.file, self.dtype, (self.length,) + self.shape)
+        self.file.close()
+
+
+class Recorder:
+    """Writes recorded data to disk in a background thread
+
+    Data is written as chunks of arrays whose first axis is time. Each
+    named stream is stored in the file `<name>.npy` of the directory.
+
+    Args:
+        directory : output directory, created if needed
+        max_pending : maximum number of chunks waiting to be written.
+            Writing blocks when it is reached (optional, default 16)
+
+    """
+
+    def __init__(self, directory, max_pending=16):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._streams = {}
+        self._monitors = []
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.closed = False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            stream, chunk = item
+            try:
+                if self._error is None:
+                    stream.write(chunk)
+            except Exception as e:
+                self._error = e
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def attach(self, monitor):
+        """Registers a monitor to be flushed when closing the recorder"""
+        self._monitors.append(monitor)
+
+    def write(self, name, chunk):
+        """Queues a chunk of data to be written
+
+        The chunk is written as is, and should not be modified by the
+        caller afterwards.
+
+        Args:
+            name : name of the stream
+            chunk : array whose first axis is time
+
+        Raises:
+            ValueError: the chunk dtype or shape differ from those of
+                previous chunks, or the recorder is closed
+        """
+        if self.closed:
+            raise ValueError("Recorder is closed")
+        self._check()
+        chunk = np.ascontiguousarray(chunk)
+        stream = self._streams.get(name)
+        if stream is None:
+            path = os.path.join(self.directory, name + ".npy")
+            stream = _Stream(path, chunk.dtype, chunk.shape[1:])
+            self._streams[name] = stream
+        elif chunk.dtype != stream.dtype or chunk.shape[1:] != stream.shape:
+            raise ValueError("Chunk does not match stream {}".format(name))
+        if len(chunk) > 0:
+            self._queue.put((stream, chunk))
+
+    def close(self):
+        """Flushes the monitors, writes all pending chunks and closes the files"""
+        if self.closed:
+            return
+        for monitor in self._monitors:
+            monitor.flush()
+        self.closed = True
+        self._queue.put(None)
+        self._thread.join()
+        for stream in self._streams.values():
+            stream.close()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_recording(directory):
+    """Memory-maps the streams of a recording
+
+    Args:
+        directory : directory written by a `Recorder`
+
+    Returns:
+        A dictionary with a read-only memory-mapped array per stream
+    """
+    out = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".npy"):
+            path = os.path.join(directory, filename)
+            out[filename[:-4]] = np.load(path, mmap_mode="r")
+    return out
@@ -14,16 +14,221 @@ they will be implemented.
 
 """
 
-from .trace import Trace
+from .trace import TraceBank, TraceList
+from .ops import (outer, outer_at, rank1_update, sharded_rank1_update,
+                  sharded_add_clip, lowrank_update, sharded_lowrank_update)
+from .sparse import SparseWeights
 import numpy as np
 from collections import namedtuple
 
-WeightConstr = namedtuple('WeightConstr', ["Wmax", "Wmin"], [1.0, None])
+WeightConstr = namedtuple('WeightConstr', ["Wmax", "Wmin"], defaults=[1.0, None])
 
-class LearningRule:
-    """Base class implementing a learning rule"""
 
-    def __init__(self, rule_params, tre=None, tro=None, tracelim=10, w_const=None):
+class _EpochUpdates:
+    """Weight changes accumulated over a learning epoch
+
+    Rank-1 terms are kept as their postsynaptic and presynaptic vectors,
+    so that accumulating a timestep costs O(No + Ne), and are committed
+    with a single matrix product. Other weight changes are summed.
+
+    Args:
+        epoch : number of timesteps between weight updates
+
+    Raises:
+        ValueError: epoch is not a positive integer
+    """
+
+    def __init__(self, epoch):
+        if not isinstance(epoch, (int, np.integer)) or epoch < 1:
+            raise ValueError("learning_epoch must be a positive integer, not {}".format(epoch))
+        self.epoch = int(epoch)
+        self.clear()
+
+    def clear(self):
+        self.steps = 0
+        self.us = []
+        self.vs = []
+        self.dW = None
+
+    def add_terms(self, terms, dtype):
+        """Stores rank-1 terms (c, u, v), see `LearningRule.rank1_terms`"""
+        for c, u, v in terms:
+            if not np.any(u):
+                continue
+            if callable(v):
+                v = v()
+            self.us.append(np.asarray(c*u, dtype))
+            # Traces are updated in place, so v is copied
+            self.vs.append(np.array(v, dtype))
+
+    def add(self, dW):
+        if self.dW is None:
+            self.dW = np.array(dW)
+        else:
+            self.dW += dW
+
+    def step(self):
+        """Counts a timestep and returns True at the end of the epoch"""
+        self.steps += 1
+        return self.steps >= self.epoch
+
+    def flush(self, W, Wmin, Wmax, shards, bounded):
+        """Adds the accumulated changes to W and clamps it once
+
+        Rank-1 terms only clamp the weights they change, so that they
+        are added as a dense change unless W is known to be bounded.
+        """
+        if self.us and not bounded:
+            self.add(np.stack(self.us, axis=1) @ np.stack(self.vs))
+            self.us = []
+            self.vs = []
+        if isinstance(W, SparseWeights):
+            if self.dW is not None:
+                W.data += self.dW
+                W.clip(Wmin, Wmax)
+            self.clear()
+            return W
+        if self.dW is not None:
+            if shards is not None and np.ndim(W) == 2:
+                sharded_add_clip(W, self.dW, Wmin, Wmax, *shards)
+            else:
+                W += self.dW
+                W[W > Wmax] = Wmax
+                W[W < Wmin] = Wmin
+        if self.us:
+            U = np.stack(self.us, axis=1)
+            V = np.stack(self.vs)
+            if shards is None:
+                lowrank_update(W, U, V, Wmin, Wmax)
+            else:
+                sharded_lowrank_update(W, U, V, Wmin, Wmax, *shards)
+        self.clear()
+        return W
+
+
+class _PlasticRule:
+    """Weight updates shared by `LearningRule` and `ModulatedLearningRule`
+
+    Rules are called with a tuple of inputs, (xe, xo) or (xe, xo, xm),
+    which is passed to the traces and to `apply_rule`,
+    `apply_rule_sparse`, and `rank1_terms`. Subclasses define the
+    weight bounds in `_bounds`.
+    """
+
+    def _init_updates(self, learning_epoch):
+        self.batch_size = None
+        self.dtype = np.dtype(np.float64)
+        self._bounded_W = None
+        self._shards = None
+        self._epoch = _EpochUpdates(learning_epoch)
+        self.learning_epoch = self._epoch.epoch
+
+
+    def set_batch_size(self, batch_size):
+        """Sets the number of independent samples and resets the traces"""
+        self.batch_size = batch_size
+        self._init_traces()
+
+
+    def set_dtype(self, dtype):
+        """Sets the floating point type and resets the traces"""
+        self.dtype = np.dtype(dtype)
+        self._init_traces()
+
+
+    def _update(self, x, W, learn):
+
+        if self.has_traces:
+            self.traces.update(*x)
+
+        if learn and self.learning_epoch > 1:
+            self._accumulate(x, W)
+            if self._epoch.step():
+                W = self.flush(W)
+
+        elif learn:
+
+            Wmin, Wmax = self._bounds()
+            if isinstance(W, SparseWeights):
+                W.data += self.apply_rule_sparse(*x, W.rows, W.indices)
+                W.clip(Wmin, Wmax)
+                return W
+
+            terms = None
+            if W is self._bounded_W and np.ndim(x[1]) == 1:
+                terms = self.rank1_terms(*x)
+            if terms is not None:
+                if self._shards is None:
+                    rank1_update(W, terms, Wmin, Wmax)
+                else:
+                    sharded_rank1_update(W, terms, Wmin, Wmax, *self._shards)
+            else:
+                dW = self.apply_rule(*x)
+                if self._shards is not None and np.ndim(W) == 2:
+                    sharded_add_clip(W, dW, Wmin, Wmax, *self._shards)
+                else:
+                    W += dW
+                    W[W > Wmax] = Wmax
+                    W[W < Wmin] = Wmin
+                if np.ndim(W) == 2:
+                    self._bounded_W = W
+        return W
+
+    def _accumulate(self, x, W):
+        if isinstance(W, SparseWeights):
+            self._epoch.add(self.apply_rule_sparse(*x, W.rows, W.indices))
+            return
+        terms = None
+        if np.ndim(W) == 2 and np.ndim(x[1]) == 1:
+            terms = self.rank1_terms(*x)
+        if terms is not None:
+            self._epoch.add_terms(terms, W.dtype)
+        else:
+            self._epoch.add(self.apply_rule(*x))
+
+    def flush(self, W):
+        """Commits the weight changes accumulated in the current epoch
+
+        Args:
+            W : synaptic weights, updated in place
+
+        Returns:
+            The updated weights
+        """
+        Wmin, Wmax = self._bounds()
+        W = self._epoch.flush(W, Wmin, Wmax, self._shards, W is self._bounded_W)
+        if np.ndim(W) == 2:
+            self._bounded_W = W
+        return W
+
+    def set_shards(self, shards):
+        """Applies weight updates by blocks of postsynaptic neurons
+
+        Args:
+            shards : tuple (bounds, executor) with a list of row blocks
+                (start, end) and a thread pool, or None to update the
+                weights at once
+        """
+        self._shards = shards
+
+
+    def reset(self):
+        if self.has_traces:
+            self.traces.reset()
+
+
+class LearningRule(_PlasticRule):
+    """Base class implementing a learning rule
+
+    With a learning_epoch k > 1, traces are still updated at every
+    timestep, but weight changes are accumulated and committed every k
+    timesteps, as in Loihi. Weights are then clamped once per epoch,
+    and rules whose weight change is a sum of rank-1 terms only store
+    two vectors per term and timestep.
+    """
+
+    def __init__(self, rule_params, tre=None, tro=None, tracelim=10, w_const=None,
+            lazy_traces=False, learning_epoch=1):
         self.rule_params = rule_params
         self.tre = tre
         self.tro = tro
@@ -33,8 +238,16 @@ class LearningRule:
             self.has_traces = True
 
         self.tracelim = tracelim
+        self.lazy_traces = lazy_traces
         self.w_const = WeightConstr() if w_const is None else w_const
         self.Wmax = self.w_const.Wmax
+        self._init_updates(learning_epoch)
+
+
+    def init(self, Ne, No, syn_type=None):
+        self.Ne = Ne
+        self.No = No
+        self.syn_type = syn_type
         if self.w_const.Wmin is None:
             if self.syn_type is None:
                 self.Wmin = - self.Wmax
@@ -42,55 +255,80 @@ class LearningRule:
                 self.Wmin = 0
         else:
             self.Wmin = self.w_const.Wmin
+        self._init_traces()
 
 
-    def init(self, Ne, No, syn_type=None):
+    def _init_traces(self):
         if self.has_traces:
-            self.te = Trace(Ne, self.tre[0], self.tre[1], self.tracelim)
-            self.to = Trace(No, self.tro[0], self.tro[1], self.tracelim)
+            traces = TraceList if self.lazy_traces else TraceBank
+            self.traces = traces(
+                [(self.Ne, self.tre[0], self.tre[1], self.tracelim),
+                 (self.No, self.tro[0], self.tro[1], self.tracelim)],
+                self.batch_size, self.dtype)
+            self.te, self.to = self.traces.traces
         else:
+            self.traces = None
             self.te = None
             self.to = None
-        self.syn_type = syn_type
 
 
-    def update(self, xe, xo, W=None, learn=True):
+    def _bounds(self):
+        return self.Wmin, self.Wmax
 
-        if self.has_traces:
-            self.te.update(xe)
-            self.to.update(xo)
 
-        if learn:
+    def update(self, xe, xo, W=None, learn=True):
+        return self._update((xe, xo), W, learn)
 
-            dW = self.apply_rule(xe, xo)
-            W += dW
-            W[W > self.Wmax] = self.Wmax
-            W[W < self.Wmin] = self.Wmin
-        return W
+    def apply_rule(self, xe, xo):
+        raise NotImplemented
 
+    def apply_rule_sparse(self, xe, xo, rows, cols):
+        """Returns the weight change of the synapses (rows, cols)
 
-    def reset(self):
-        if self.has_traces:
-            self.te.reset()
-            self.to.reset()
+        Rules should override this method to avoid computing the
+        full weight change matrix.
+        """
+        return self.apply_rule(xe, xo)[rows, cols]
 
-    def apply_rule(self, xe, xo):
-        raise NotImplemented
+    def rank1_terms(self, xe, xo):
+        """Returns the weight change as a sum of rank-1 terms
+
+        Rules whose weight change is a sum of outer products of a
+        postsynaptic and a presynaptic vector can return it as a list of
+        tuples (c, u, v), meaning `sum(c*outer(u, v))`. Weights are then
+        updated only where there is activity. The presynaptic factor v
+        can be a trace, which is then only read if u has activity.
+        Returns None by default, in which case `apply_rule` is used.
+        """
+        return None
 
 class STDPRule(LearningRule):
 
     def apply_rule(self, xe, xo):
 
-        dW = self.rule_params["Ap"]*np.outer(xo,self.te())
-        dW -= self.rule_params["An"]*np.outer(self.to(), xe)
+        dW = self.rule_params["Ap"]*outer(xo,self.te())
+        dW -= self.rule_params["An"]*outer(self.to(), xe)
         return dW        
 
+    def apply_rule_sparse(self, xe, xo, rows, cols):
+
+        dW = self.rule_params["Ap"]*outer_at(xo, self.te(), rows, cols)
+        dW -= self.rule_params["An"]*outer_at(self.to(), xe, rows, cols)
+        return dW
 
-class ModulatedLearningRule:
-    """Base class implementing a modulated learning rule"""
+    def rank1_terms(self, xe, xo):
+        return [(self.rule_params["Ap"], xo, self.te),
+                (-self.rule_params["An"], self.to(), xe)]
+
+
+class ModulatedLearningRule(_PlasticRule):
+    """Base class implementing a modulated learning rule
+
+    See `LearningRule` for the learning_epoch.
+    """
 
     def __init__(self, rule_params, tre=None, tro=None, trm=None, 
-            tracelim=10, Wlim=1):
+            tracelim=10, Wlim=1, lazy_traces=False, learning_epoch=1):
         self.rule_params = rule_params
         self.tre = tre
         self.tro = tro
@@ -101,56 +339,78 @@ class ModulatedLearningRule:
             self.has_traces = True
 
         self.tracelim = tracelim
+        self.lazy_traces = lazy_traces
         self.Wlim = Wlim
+        self._init_updates(learning_epoch)
 
     def init(self, Ne, No, Nm, syn_type=None):
+        self.Ne = Ne
+        self.No = No
+        self.Nm = Nm
+        self.syn_type = syn_type
+        self._init_traces()
+
+    def _init_traces(self):
         if self.has_traces:
-            self.te = Trace(Ne, self.tre[0], self.tre[1], self.tracelim)
-            self.to = Trace(No, self.tro[0], self.tro[1], self.tracelim)
-            self.tm = Trace(Nm, self.trm[0], self.trm[1], self.tracelim)
+            traces = TraceList if self.lazy_traces else TraceBank
+            self.traces = traces(
+                [(self.Ne, self.tre[0], self.tre[1], self.tracelim),
+                 (self.No, self.tro[0], self.tro[1], self.tracelim),
+                 (self.Nm, self.trm[0], self.trm[1], self.tracelim)],
+                self.batch_size, self.dtype)
+            self.te, self.to, self.tm = self.traces.traces
 
         else:
+            self.traces = None
             self.te = None
             self.to = None
             self.tm = None
-        self.syn_type = syn_type
+
+    def _bounds(self):
+        return (-self.Wlim if self.syn_type is None else 0), self.Wlim
 
     def update(self, xe, xo, xm, W=None, learn=True):
+        return self._update((xe, xo, xm), W, learn)
 
-        if self.has_traces:
-            self.te.update(xe)
-            self.to.update(xo)
-            self.tm.update(xm)
+    def apply_rule(self, xe, xo, xm):
+        raise NotImplemented
 
-        if learn:
+    def apply_rule_sparse(self, xe, xo, xm, rows, cols):
+        """Returns the weight change of the synapses (rows, cols)
 
-            dW = self.apply_rule(xe, xo, xm)
-            W += dW
-            W[W > self.Wlim] = self.Wlim
-            if self.syn_type is None:
-                W[W < -self.Wlim] = -self.Wlim
-            else:
-                W[W < 0] = 0
-        return W
+        Rules should override this method to avoid computing the
+        full weight change matrix.
+        """
+        return self.apply_rule(xe, xo, xm)[rows, cols]
 
+    def rank1_terms(self, xe, xo, xm):
+        """Returns the weight change as a sum of rank-1 terms
 
-    def reset(self):
-        if self.has_traces:
-            self.te.reset()
-            self.to.reset()
-            self.tm.reset()
-
-    def apply_rule(self, xe, xo, xm):
-        raise NotImplemented
+        See `LearningRule.rank1_terms`. Returns None by default.
+        """
+        return None
 
 
 class ModSTDPRule(ModulatedLearningRule):
 
     def apply_rule(self, xe, xo, xm):
         
-        dW = self.rule_params["Ap"]*np.outer(xo,self.te())
-        dW -= self.rule_params["An"]*np.outer(self.to(), xe)
-        return self.tm()*dW
+        tm = self.tm()
+        dW = self.rule_params["Ap"]*outer(tm*xo, self.te())
+        dW -= self.rule_params["An"]*outer(tm*self.to(), xe)
+        return dW
+
+    def apply_rule_sparse(self, xe, xo, xm, rows, cols):
+
+        tm = self.tm()
+        dW = self.rule_params["Ap"]*outer_at(tm*xo, self.te(), rows, cols)
+        dW -= self.rule_params["An"]*outer_at(tm*self.to(), xe, rows, cols)
+        return dW
+
+    def rank1_terms(self, xe, xo, xm):
+        tm = self.tm()
+        return [(self.rule_params["Ap"], tm*xo, self.te),
+                (-self.rule_params["An"], tm*self.to(), xe)]
 
 
 class MSERule(ModulatedLearningRule):
@@ -159,6 +419,12 @@ class MSERule(ModulatedLearningRule):
     """
 
     def apply_rule(self, xe, xo, xm):        
-        dW = self.rule_params["lr"]*np.outer(xm-self.to(),self.te())
+        dW = self.rule_params["lr"]*outer(xm-self.to(),self.te())
         return dW
 
+    def apply_rule_sparse(self, xe, xo, xm, rows, cols):
+        return self.rule_params["lr"]*outer_at(xm-self.to(), self.te(), rows, cols)
+
+    def rank1_terms(self, xe, xo, xm):
+        return [(self.rule_params["lr"], xm-self.to(), self.te)]
+
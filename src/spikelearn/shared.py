@@ -0,0 +1,189 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Arrays shared between processes
+
+A `SharedArray` stores a numpy array in a shared memory block. It can be
+passed to other processes, for instance as an argument of a process
+pool task, and only its name, shape, and dtype are serialized: each
+process maps the same memory instead of receiving a copy of the data.
+
+`share_weights` publishes the synaptic weights of a network in shared
+memory, and `attach_weights` makes the synapses of replicas of the
+network use read-only views of them, for instance to run an ensemble of
+inference networks in a process pool without copying the weights.
+
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .checkpoint import network_state, _is_weight, _set
+from .sparse import SparseWeights
+
+
+class SharedArray:
+    """A numpy array stored in shared memory
+
+    Instances are created with `from_array` in the process owning the
+    memory, which should `unlink` it once all processes are done. Other
+    processes access the data through `array`, which is read-only
+    unless the array was attached with `writeable` set to True.
+
+    Args:
+        name : name of the shared memory block
+        shape : shape of the array
+        dtype : dtype of the array
+        writeable : if True, processes other than the owner can write
+            into the array (optional, default False)
+
+    """
+
+    def __init__(self, name, shape, dtype, writeable=False):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.writeable = writeable
+        self._shm = None
+        self._array = None
+        self._owner = False
+
+    @classmethod
+    def from_array(cls, a, writeable=False):
+        """Copies an array into a new shared memory block
+
+        Args:
+            a : a numpy array
+            writeable : if True, other processes can write into the
+                array (optional, default False)
+
+        Returns:
+            A `SharedArray` owning the memory block
+        """
+        a = np.asarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        out = cls(shm.name, a.shape, a.dtype, writeable)
+        out._shm = shm
+        out._owner = True
+        out._array = np.ndarray(a.shape, a.dtype, buffer=shm.buf)
+        out._array[...] = a
+        return out
+
+    @property
+    def array(self):
+        """The shared array, mapped into this process on first access"""
+        if self._array is None:
+            try:
+                # Only the owner is responsible for unlinking the memory
+                self._shm = shared_memory.SharedMemory(name=self.name, track=False)
+            except TypeError:
+                # Before Python 3.13 attached blocks are tracked too. Child
+                # processes share the tracker of their parent, in which the
+                # block is already registered.
+                self._shm = shared_memory.SharedMemory(name=self.name)
+            self._array = np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)
+            self._array.flags.writeable = self.writeable
+        return self._array
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape))*self.dtype.itemsize
+
+    def __getstate__(self):
+        return (self.name, self.shape, self.dtype.str, self.writeable)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def close(self):
+        """Unmaps the memory from this process
+
+        Arrays obtained from `array` must not be used afterwards.
+        """
+        self._array = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                # Views of the array are still alive, the memory is
+                # unmapped when they are released
+                pass
+            self._shm = None
+
+    def unlink(self):
+        """Closes and frees the memory block. Only the owner can unlink it."""
+        if not self._owner:
+            raise ValueError("Only the owner can unlink shared array {}".format(self.name))
+        shm = self._shm
+        self.close()
+        if shm is not None:
+            shm.unlink()
+        self._owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self._owner:
+            self.unlink()
+        else:
+            self.close()
+
+
+def _weight_arrays(net):
+    """Returns the synaptic weights of a network, with the structure of sparse weights"""
+    arrays, _ = network_state(net)
+    return {key: (obj, name, a) for key, (obj, name, a) in arrays.items()
+            if isinstance(obj, SparseWeights) or _is_weight(obj, name)}
+
+
+def share_weights(net):
+    """Copies the synaptic weights of a network into shared memory
+
+    Args:
+        net : a `SpikingNet`
+
+    Returns:
+        A dictionary of `SharedArray`, owned by the calling process,
+        which can be sent to other processes and passed to
+        `attach_weights`
+    """
+    return {key: SharedArray.from_array(a)
+            for key, (_, _, a) in _weight_arrays(net).items()}
+
+
+def attach_weights(net, weights):
+    """Replaces the synaptic weights of a network by shared weights
+
+    The network must have been built in the same way as the one passed
+    to `share_weights`. Its weights become read-only views of the
+    shared memory, so that replicas of a network running in several
+    processes only hold their own neuron states and traces. Replicas
+    must be run with `learn=False`.
+
+    Args:
+        net : a `SpikingNet`
+        weights : dictionary returned by `share_weights`
+
+    Raises:
+        ValueError: the weights do not match the network
+    """
+    arrays = _weight_arrays(net)
+    if set(weights) != set(arrays):
+        missing = set(weights) ^ set(arrays)
+        raise ValueError("Shared weights do not match the network: {}".format(
+            sorted(missing)[:5]))
+    for key, (obj, name, a) in arrays.items():
+        shared = weights[key]
+        # The structure of sparse weights is replaced as a whole, and
+        # may have a different number of synapses
+        if shared.dtype != a.dtype or (shared.shape != a.shape
+                and not isinstance(obj, SparseWeights)):
+            raise ValueError("Shape or dtype of {} does not match the network".format(key))
+    for key, (obj, name, a) in arrays.items():
+        # The owner of the memory can write into its array
+        view = weights[key].array.view()
+        view.flags.writeable = False
+        _set(obj, name, view)
+    # The views are only valid while the memory is mapped
+    net._shared_weights = weights
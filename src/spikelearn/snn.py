@@ -1,31 +1,171 @@
 #Copyright Argonne 2022. See LICENSE.md for details.
 
 from .streamnet import StreamNet, Element
+from . import checkpoint, shared
+from .ops import matvec
+from .synapses import BaseSynapse
+from .parallel import run_calls
+import numpy as np
+
+
+class _FusedSynapses:
+    """Static synapses of a layer applied as a single matrix product
+
+    The weights of the synapses are stacked side by side into a single
+    column-major matrix, and the inputs are concatenated into a
+    preallocated buffer, negated for inhibitory synapses. The weights
+    of the synapses are then replaced by views of the stacked matrix,
+    so that modifying `syn.W` in place also modifies the stacked
+    matrix, while assigning a new `syn.W` rebuilds the fusion. Arrays
+    referenced before the fusion, such as the initial weights passed
+    to a synapse, are copied and no longer used by the synapse.
+
+    Args:
+        synapses : list of synapses with a `fusable` property set, the
+            same weight dtype and the same event_driven setting
+        sources : index of the input of each synapse
+    """
+
+    def __init__(self, synapses, sources):
+        self.synapses = synapses
+        self.sources = sources
+        No = synapses[0].W.shape[0]
+        Ne = sum(syn.W.shape[1] for syn in synapses)
+        # Column-major, so that the columns of active inputs gathered
+        # by the event-driven product are contiguous
+        self.W = np.empty((No, Ne), synapses[0].W.dtype, order="F")
+        self.bounds = []
+        start = 0
+        for syn in synapses:
+            end = start + syn.W.shape[1]
+            self.W[:, start:end] = syn.W
+            syn.W = self.W[:, start:end]
+            self.bounds.append((start, end))
+            start = end
+        self.weights = [syn.W for syn in synapses]
+        self.inh = [syn.syn_type == "inh" for syn in synapses]
+        self.event_driven = synapses[0].event_driven
+        self._x = None
+
+    def valid(self):
+        """False if the weights of a synapse have been replaced"""
+        for syn, W in zip(self.synapses, self.weights):
+            if syn.W is not W:
+                return False
+        return True
+
+    def __call__(self, args):
+        xs = [args[i] for i in self.sources]
+        shape = np.shape(xs[0])[:-1] + (self.W.shape[1],)
+        if any(self.inh):
+            dtype = np.result_type(self.W.dtype, *xs)
+        else:
+            dtype = np.result_type(*xs)
+        x = self._x
+        if x is None or x.shape != shape or x.dtype != dtype:
+            x = self._x = np.empty(shape, dtype)
+        for syn, xe, inh, (start, end) in zip(self.synapses, xs, self.inh, self.bounds):
+            syn.xe = xe
+            x[..., start:end] = xe
+            if inh:
+                np.negative(x[..., start:end], out=x[..., start:end])
+        return matvec(self.W, x, self.event_driven)
 
 
 class NeuronElement(Element):
 
-    def __init__(self, neuron):
+    def __init__(self, neuron, fuse=False):
         self._neuron = neuron
         self._synapses = []
+        # Functions called to run the neuron, the synapses, and the
+        # fused synapses, which a profiler can replace
+        self._call_neuron = neuron
+        self._syn_calls = []
+        self._call_fused_synapses = _FusedSynapses.__call__
         self._syn_types = []
         self._n_pre = []
         self.out = self._neuron.out
         self.total_syn_inputs = 0
+        self.fuse = fuse
+        self._fusion = None
 
     def add_synapse(self, synapse, n_pre=1):
         self._synapses.append(synapse)
+        self._syn_calls.append(synapse)
         self._n_pre.append(n_pre)
         self.total_syn_inputs += n_pre
+        self.invalidate()
+
+    def invalidate(self):
+        """Discards the fused synapses, which are rebuilt when needed"""
+        self._fusion = None
+
+    def _fuse(self):
+        """Groups the static synapses that can be fused
+
+        Synapses are fused if the neuron adds all its inputs, or, for
+        neurons grouping their synapses, with the other synapses of the
+        same type.
+
+        Returns:
+            A tuple (fused, rest, starts) with a list of tuples
+            (`_FusedSynapses`, inh), the indices of the synapses that
+            are not fused, and the index of the first input of each
+            synapse
+        """
+        starts = np.cumsum([0] + self._n_pre[:-1]).tolist()
+        grouped = self._neuron.group_synapses
+        candidates = {}
+        if grouped or getattr(self._neuron, "sums_inputs", False):
+            for i, syn in enumerate(self._synapses):
+                if self._n_pre[i] != 1 or not syn.fusable:
+                    continue
+                if grouped and syn.syn_type not in ("exc", "inh"):
+                    continue
+                inh = grouped and syn.syn_type == "inh"
+                key = (inh, syn.W.dtype, syn.event_driven)
+                candidates.setdefault(key, []).append(i)
+        fused = []
+        rest = list(range(len(self._synapses)))
+        for (inh, _, _), indices in candidates.items():
+            if len(indices) > 1:
+                synapses = [self._synapses[i] for i in indices]
+                fused.append((_FusedSynapses(synapses, [starts[i] for i in indices]), inh))
+                rest = [i for i in rest if i not in indices]
+        return fused, rest, starts
 
     def reset(self):
         self._neuron.reset()
         for syn in self._synapses:
             syn.reset()
+        self.out = self._neuron.out
+
+    def set_batch_size(self, batch_size):
+        self._neuron.set_batch_size(batch_size)
+        for syn in self._synapses:
+            syn.set_batch_size(batch_size)
+        self.out = self._neuron.out
+
+    def set_dtype(self, dtype):
+        self._neuron.set_dtype(dtype, override=False)
+        for syn in self._synapses:
+            syn.set_dtype(dtype, override=False)
+        self.out = self._neuron.out
+
+    def set_spike_dtype(self, spike_dtype):
+        self._neuron.set_spike_dtype(spike_dtype, override=False)
+        self.out = self._neuron.out
+
+    def flush(self):
+        for syn in self._synapses:
+            if hasattr(syn, "flush"):
+                syn.flush()
 
     def __call__(self, *args):
         if len(self._synapses) == 0:
-            self.out = self._neuron(*args)
+            self.out = self._call_neuron(*args)
+        elif self.fuse:
+            self.out = self._call_fused(args)
         else:
             if self._neuron.group_synapses:
                 xe_list = []
@@ -39,10 +179,11 @@ class NeuronElement(Element):
                         ap_list = xi_list
                     else:
                         raise ValueError("Synapse type must be either exc or inh")
+                    call = self._syn_calls[i]
                     if n_inputs == 1:
-                        ap_list.append(syn(args[n]))
+                        ap_list.append(call(args[n]))
                     else:
-                        ap_list.append(syn(*args[n:(n+n_inputs)]))
+                        ap_list.append(call(*args[n:(n+n_inputs)]))
                     n += n_inputs
                 if len(xe_list) > 0:
                     xe = sum(xe_list)
@@ -52,21 +193,55 @@ class NeuronElement(Element):
                     xi = sum(xi_list)
                 else:
                     xi = None
-                self.out = self._neuron(xe, xi)
+                self.out = self._call_neuron(xe, xi)
 
             else:
                 neuron_args = []
                 n = 0
-                for i, syn in enumerate(self._synapses):
+                for i, call in enumerate(self._syn_calls):
                     n_inputs = self._n_pre[i]
                     if n_inputs == 1:
-                        neuron_args.append(syn(args[n]))
+                        neuron_args.append(call(args[n]))
                     else:
-                        neuron_args.append(syn(*args[n:(n+n_inputs)]))
+                        neuron_args.append(call(*args[n:(n+n_inputs)]))
                     n += n_inputs
-                self.out = self._neuron(*neuron_args)
+                self.out = self._call_neuron(*neuron_args)
         return self.out
 
+    def _call_fused(self, args):
+        fusion = self._fusion
+        if fusion is None or not all(f.valid() for f, _ in fusion[0]):
+            fusion = self._fusion = self._fuse()
+        fused, rest, starts = fusion
+        grouped = self._neuron.group_synapses
+        xe_list = []
+        xi_list = []
+        call_fused = self._call_fused_synapses
+        for f, inh in fused:
+            if inh:
+                xi_list.append(call_fused(f, args))
+            else:
+                xe_list.append(call_fused(f, args))
+        for i in rest:
+            syn = self._synapses[i]
+            call = self._syn_calls[i]
+            n, n_inputs = starts[i], self._n_pre[i]
+            if n_inputs == 1:
+                out = call(args[n])
+            else:
+                out = call(*args[n:(n+n_inputs)])
+            if not grouped or syn.syn_type == 'exc':
+                xe_list.append(out)
+            elif syn.syn_type == 'inh':
+                xi_list.append(out)
+            else:
+                raise ValueError("Synapse type must be either exc or inh")
+        if not grouped:
+            return self._call_neuron(*xe_list)
+        xe = sum(xe_list) if len(xe_list) > 0 else None
+        xi = sum(xi_list) if len(xi_list) > 0 else None
+        return self._call_neuron(xe, xi)
+
     def update(self, learn):
         for syn in self._synapses:
             syn.update(self.out, learn)
@@ -100,14 +275,43 @@ class SpikingNet(StreamNet):
     layers or synapses would most likely break the network or result
     in unpredictable behavior.
 
+    A network can simulate a batch of independent samples, set the
+    floating point and spike types of its layers and synapses, fuse its
+    static synapses, and run its layers in threads. The arguments of
+    `__init__` describe these options, and the documentation of the
+    network module details them.
+
     """
 
-    def __init__(self):
+    def __init__(self, batch_size=None, dtype=None, spike_dtype=None,
+            fuse_synapses=False, threads=None):
         """Initiates an empty network
+
+        Args:
+            batch_size : number of independent samples simulated in
+                parallel (optional, default None)
+            dtype : floating point type of layers and synapses that do
+                not define their own (optional, default None keeps the
+                dtype of each layer and synapse)
+            spike_dtype : type of the spikes of layers that do not
+                define their own, such as bool or uint8 (optional,
+                default None keeps the spike type of each layer)
+            fuse_synapses : if True, static synapses targeting the same
+                layer are fused (optional, default False)
+            threads : number of threads running the layers and the
+                learning updates (optional, default None runs them
+                sequentially)
         """
         self.is_synapse = {}
         self.pos_synapse = {}
+        self.batch_size = batch_size
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.spike_dtype = None if spike_dtype is None else np.dtype(spike_dtype)
+        self.t = 0
+        self._monitors = []
+        self.fuse_synapses = fuse_synapses
         super().__init__()
+        self.set_threads(threads)
 
 
     def add_layer(self, snl, name):
@@ -119,7 +323,24 @@ class SpikingNet(StreamNet):
         
         """            
 
-        self.add_element(name, NeuronElement(snl))
+        if self.dtype is not None:
+            snl.set_dtype(self.dtype, override=False)
+        if self.spike_dtype is not None:
+            snl.set_spike_dtype(self.spike_dtype, override=False)
+        if self.batch_size is not None:
+            snl.set_batch_size(self.batch_size)
+        self.add_element(name, NeuronElement(snl, self.fuse_synapses))
+
+
+    def get_layer(self, name):
+        """Returns the layer with a given name
+
+        Raises:
+            ValueError: layer not found
+        """
+        if name not in self._elements:
+            raise ValueError("Layer {} not found".format(name))
+        return self._elements[name]._neuron
 
 
     def add_synapse(self, pos_name, syn, *pre_names):
@@ -143,20 +364,185 @@ class SpikingNet(StreamNet):
 
         """
      
+        if self.dtype is not None:
+            syn.set_dtype(self.dtype, override=False)
+        if self.batch_size is not None:
+            syn.set_batch_size(self.batch_size)
         self._elements[pos_name].add_synapse(syn, len(pre_names))
         for i, name in enumerate(pre_names):
             self.add_el_input(pos_name, name, 1)
 
 
+    def invalidate(self):
+        """Discards the execution plan and the fused synapses
+
+        Called automatically whenever the graph is modified or a new
+        weight array is assigned to a fused synapse.
+        """
+        super().invalidate()
+        for el in self._elements.values():
+            el.invalidate()
+
+    def add_monitor(self, monitor):
+        """Adds a monitor called at the end of every timestep
+
+        Args:
+            monitor : a monitor, or any object implementing
+                `__call__(t)` and `reset()`
+
+        Returns:
+            The monitor
+        """
+        self._monitors.append(monitor)
+        return monitor
+
     def reset(self):
         """Broadcasts a reset signal to all layers and synapses
         in the network
+
+        Also sets the timestep back to zero and clears the monitors.
         """
         self.broadcast("reset")
+        self.t = 0
+        for monitor in self._monitors:
+            monitor.reset()
+
+    def set_batch_size(self, batch_size):
+        """Sets the number of independent samples simulated in parallel
+
+        Broadcasts the new batch size to all layers and synapses, which
+        also resets their state.
+
+        Args:
+            batch_size : number of samples, or None for a single
+                unbatched simulation
+        """
+        self.batch_size = batch_size
+        self.broadcast("set_batch_size", batch_size)
+
+    def set_dtype(self, dtype):
+        """Sets the floating point type of the network
+
+        Broadcasts the new dtype to all layers and synapses that were not
+        created with an explicit dtype. Their state is reset.
+
+        Args:
+            dtype : a numpy floating point type
+        """
+        self.dtype = np.dtype(dtype)
+        self.broadcast("set_dtype", self.dtype)
+
+    def set_spike_dtype(self, spike_dtype):
+        """Sets the type of the spikes of all layers
+
+        Broadcasts the new spike type to all layers that were not
+        created with an explicit spike_dtype, which resets the layers
+        and their synapses.
+
+        Args:
+            spike_dtype : a numpy type such as bool or uint8, or None to
+                use the dtype of each layer
+        """
+        self.spike_dtype = None if spike_dtype is None else np.dtype(spike_dtype)
+        self.broadcast("set_spike_dtype", self.spike_dtype)
+
+    def save_state(self, path):
+        """Writes the state of the network to a file
+
+        Saves weights, membrane potentials, spikes, traces, and
+        transforms into a single binary file. See `checkpoint`. Weight
+        changes pending in a learning epoch are committed first.
+
+        Args:
+            path : name of the file
+        """
+        self.flush()
+        checkpoint.save_state(self, path)
+
+    def load_state(self, path, mmap_weights=False):
+        """Restores the state of the network from a file
+
+        The network must have been built in the same way as the saved
+        one. Arrays are restored in place.
+
+        Args:
+            path : name of a file written by `save_state`
+            mmap_weights : if True, synaptic weights are memory-mapped
+                copy-on-write instead of copied, so that large weight
+                sets are restored without reading them, and networks
+                restored from the same file share memory until they
+                learn (optional, default False)
+
+        Raises:
+            ValueError: the file does not match the network
+        """
+        # Pending weight changes are committed to the weights that are
+        # then overwritten
+        self.flush()
+        checkpoint.load_state(self, path, mmap_weights)
+
+    def share_weights(self):
+        """Copies the synaptic weights into shared memory
+
+        See `shared.share_weights`.
+
+        Returns:
+            A dictionary of `SharedArray` that replicas of the network
+            built in other processes can pass to `attach_weights`. The
+            caller should unlink them once the replicas are done.
+        """
+        return shared.share_weights(self)
+
+    def attach_weights(self, weights):
+        """Makes the synapses use read-only views of shared weights
+
+        See `shared.attach_weights`. The network must then be run with
+        `learn=False`.
+
+        Args:
+            weights : dictionary returned by `share_weights`
+
+        Raises:
+            ValueError: the weights do not match the network
+        """
+        shared.attach_weights(self, weights)
+
+    def flush(self):
+        """Commits the weight changes of the current learning epoch
+
+        Broadcasts a flush signal to all synapses, see
+        `BaseSynapse.flush`.
+        """
+        self.broadcast("flush")
 
     def update(self, learn):
-        """Broadcasts a learn signal to all layers and synapses"""
-        self.broadcast("update", learn)
+        """Broadcasts a learn signal to all layers and synapses
+
+        With threads, the synapses are updated concurrently, unless an
+        element defines its own update.
+        """
+        calls = None if self._executor is None else self._update_calls(learn)
+        if calls is None:
+            self.broadcast("update", learn)
+            return
+        run_calls(self._executor, calls)
+
+    def _update_calls(self, learn):
+        """Returns the synapse updates of `NeuronElement.update`
+
+        Synapses whose update does nothing are left out. Returns None
+        if an element does not use `NeuronElement.update`.
+        """
+        calls = []
+        for el in self._elements.values():
+            if getattr(el.update, "__func__", None) is not NeuronElement.update:
+                return None
+            for syn in el._synapses:
+                if getattr(syn.update, "__func__", None) is BaseSynapse.update \
+                        and not syn.plastic:
+                    continue
+                calls.append((syn.update, (el.out, learn)))
+        return calls
 
     def __call__(self, *args, learn=True):
         """Advances the network a single timestep.
@@ -174,5 +560,100 @@ class SpikingNet(StreamNet):
         
         self.learn = learn
         super().__call__(*args)
+        # Layers reuse their output buffers in later timesteps
+        self.out = [np.array(out) for out in self.out]
         self.update(learn)
+        for monitor in self._monitors:
+            monitor(self.t)
+        self.t += 1
         return self.out
+
+    def run(self, *inputs, learn=True, record=None, steps=None):
+        """Advances the network over multiple timesteps
+
+        Each input can be either an array whose first axis is time,
+        an iterator, or a callable taking no arguments, such as a spike
+        generator. The values of the recorded layers and inputs are
+        written into arrays that are allocated once at the beginning of
+        the run. The network is left in the same state as after calling
+        it at each timestep, with `out` holding the outputs of the last
+        timestep.
+
+        Args:
+            inputs: one input per network input, in the order in which
+                they were declared
+            learn: if True, broadcasts a learn signal at the end of each
+                timestep
+            record: names of the layers and inputs to record (optional,
+                defaults to the declared network outputs)
+            steps: number of timesteps (optional if at least one of the
+                inputs is an array)
+
+        Returns:
+            A list with one array of shape (steps, ...) per recorded
+            layer or input
+
+        Raises:
+            ValueError: wrong number of inputs, unknown record name, or
+                number of timesteps undefined or not positive
+
+        """
+
+        if len(inputs) != len(self._iports):
+            raise ValueError("Expected {} inputs, got {}".format(
+                len(self._iports), len(inputs)))
+
+        sources = []
+        for inp in inputs:
+            if isinstance(inp, np.ndarray):
+                if steps is None:
+                    steps = inp.shape[0]
+                elif inp.shape[0] < steps:
+                    raise ValueError("Input has fewer than {} timesteps".format(steps))
+                sources.append(inp.__getitem__)
+            elif hasattr(inp, "__next__"):
+                sources.append(lambda t, it=inp: next(it))
+            elif callable(inp):
+                sources.append(lambda t, f=inp: f())
+            else:
+                raise ValueError("Inputs must be arrays, iterators, or callables")
+
+        if steps is None:
+            raise ValueError("Number of timesteps cannot be inferred from the inputs")
+        if steps < 1:
+            raise ValueError("Number of timesteps must be positive")
+
+        if record is None:
+            record = [op[0] for op in self._oports]
+
+        getters = []
+        for name in record:
+            if name in self._iports_dict:
+                getters.append(lambda args, n=self._iports_dict[name]: args[n])
+            elif name in self._elements:
+                getters.append(lambda args, el=self._elements[name]: el.out)
+            else:
+                raise ValueError("Element or Input {} not found".format(name))
+
+        self.learn = learn
+        update = self.update
+        monitors = self._monitors
+        recorded = None
+        for t in range(steps):
+            args = tuple(f(t) for f in sources)
+            self._step(args)
+            update(learn)
+            for monitor in monitors:
+                monitor(self.t)
+            self.t += 1
+            if recorded is None:
+                recorded = []
+                for g in getters:
+                    value = np.asarray(g(args))
+                    recorded.append(np.empty((steps,) + value.shape, value.dtype))
+            for out, g in zip(recorded, getters):
+                out[t] = g(args)
+
+        # Network outputs of the last timestep, as after a call
+        self.out = [np.array(out) for out in self._outputs(args)]
+        return recorded
@@ -0,0 +1,177 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Sparse synaptic weights
+
+Synapses connecting large layers with a low connection probability can
+store their weights as a `SparseWeights` object instead of a dense 2D
+array. Only the existing synapses are stored, using the compressed
+sparse row (CSR) format, and the sparsity pattern remains fixed during
+the simulation: learning rules only modify the weights of existing
+synapses.
+
+Since the pattern is fixed, a column index in compressed sparse column
+(CSC) order is also built once. It gives the synapses of each
+presynaptic neuron, so that the product with a sparse input only reads
+the synapses of the active inputs. The weights themselves are only
+stored in row order, which keeps the per-row layout used by learning
+rules and avoids keeping two copies in sync.
+
+"""
+
+import numpy as np
+
+
+class SparseWeights:
+    """Synaptic weights with a fixed sparsity pattern
+
+    Weights are stored in compressed sparse row format: the weights
+    of postsynaptic neuron i are stored in `data[indptr[i]:indptr[i+1]]`,
+    and the corresponding presynaptic neurons in
+    `indices[indptr[i]:indptr[i+1]]`.
+
+    The synapses of presynaptic neuron j are
+    `col_order[colptr[j]:colptr[j+1]]`, as positions in `data`.
+
+    Args:
+        shape : tuple (No, Ne) with the dimensions of the weight matrix
+        indptr : array of No+1 row pointers
+        indices : array with the presynaptic index of each synapse
+        data : array with the weight of each synapse
+
+    """
+
+    def __init__(self, shape, indptr, indices, data):
+
+        self.shape = tuple(shape)
+        self.indptr = np.asarray(indptr, dtype=np.intp)
+        self.indices = np.asarray(indices, dtype=np.intp)
+        self.data = np.asarray(data)
+        if len(self.indptr) != self.shape[0] + 1:
+            raise ValueError("indptr must have {} elements".format(self.shape[0] + 1))
+        if len(self.indices) != len(self.data):
+            raise ValueError("indices and data must have the same length")
+        self.rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        self.col_order = np.argsort(self.indices, kind="stable")
+        counts = np.bincount(self.indices, minlength=self.shape[1])
+        self.colptr = np.concatenate(([0], np.cumsum(counts)))
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape):
+        """Creates sparse weights from lists of synapses
+
+        Duplicated synapses are merged by adding their weights.
+
+        Args:
+            rows : postsynaptic index of each synapse
+            cols : presynaptic index of each synapse
+            values : weight of each synapse, or a scalar
+            shape : tuple (No, Ne)
+
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        cols = np.asarray(cols, dtype=np.intp)
+        values = np.broadcast_to(values, rows.shape)
+        keys, inverse = np.unique(rows*shape[1] + cols, return_inverse=True)
+        data = np.zeros(len(keys), dtype=np.result_type(values, float))
+        np.add.at(data, inverse, values)
+        counts = np.bincount(keys // shape[1], minlength=shape[0])
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return cls(shape, indptr, keys % shape[1], data)
+
+    @classmethod
+    def from_dense(cls, W, mask=None):
+        """Creates sparse weights from a dense 2D array
+
+        Args:
+            W : 2D array with synaptic weights
+            mask : boolean array defining the existing synapses
+                (optional, defaults to the nonzero elements of W)
+
+        """
+        W = np.asarray(W)
+        if mask is None:
+            mask = W != 0
+        rows, cols = np.nonzero(mask)
+        counts = np.bincount(rows, minlength=W.shape[0])
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return cls(W.shape, indptr, cols, W[rows, cols])
+
+    @classmethod
+    def from_scipy(cls, m):
+        """Creates sparse weights from a scipy.sparse matrix"""
+        m = m.tocsr()
+        m.sum_duplicates()
+        return cls(m.shape, m.indptr, m.indices, m.data.copy())
+
+    @property
+    def nnz(self):
+        """Number of synapses"""
+        return len(self.data)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def astype(self, dtype):
+        """Returns weights of the given dtype, sharing the sparsity pattern
+
+        Returns the object itself if it already has the given dtype.
+        """
+        if self.data.dtype == dtype:
+            return self
+        return SparseWeights(self.shape, self.indptr, self.indices,
+                             self.data.astype(dtype))
+
+    def copy(self):
+        return SparseWeights(self.shape, self.indptr, self.indices, self.data.copy())
+
+    def toarray(self):
+        """Returns the weights as a dense 2D array"""
+        W = np.zeros(self.shape, dtype=self.data.dtype)
+        W[self.rows, self.indices] = self.data
+        return W
+
+    def dot(self, x, idx=None):
+        """Propagates an input through the synapses
+
+        Args:
+            x : presynaptic input, shape (Ne,) or (B, Ne)
+            idx : indices of the active inputs (optional). If given,
+                only the synapses of these inputs are read, through
+                the column index
+
+        Returns:
+            An array of shape (No,) or (B, No)
+        """
+        if idx is None:
+            syn = None
+            rows, indices, data = self.rows, self.indices, self.data
+        else:
+            starts = self.colptr[idx]
+            counts = self.colptr[np.asarray(idx) + 1] - starts
+            # Positions colptr[j] + k for each active input j
+            first = np.cumsum(counts) - counts
+            pos = np.repeat(starts - first, counts) + np.arange(counts.sum())
+            syn = self.col_order[pos]
+            rows, indices, data = self.rows[syn], self.indices[syn], self.data[syn]
+        if x.dtype == bool and x.ndim == 1:
+            active = x[indices]
+            out = np.bincount(rows[active], weights=data[active],
+                              minlength=self.shape[0])
+            return out.astype(self.data.dtype, copy=False)
+        prod = x[..., indices]*data
+        if prod.ndim == 1:
+            out = np.bincount(rows, weights=prod, minlength=self.shape[0])
+        else:
+            B, No = prod.shape[0], self.shape[0]
+            offsets = (np.arange(B)*No)[:, None] + rows
+            out = np.bincount(offsets.ravel(), weights=prod.ravel(), minlength=B*No)
+            out = out.reshape(B, No)
+        return out.astype(prod.dtype, copy=False)
+
+    def __matmul__(self, x):
+        return self.dot(x)
+
+    def clip(self, Wmin, Wmax):
+        """Clamps the weights of the existing synapses in place"""
+        np.clip(self.data, Wmin, Wmax, out=self.data)
@@ -10,6 +10,11 @@ An element has the following interface:
 
 """
 
+from operator import itemgetter
+
+from ..parallel import make_executor, run_calls
+
+
 class StreamNet:
 
     """
@@ -28,6 +33,10 @@ class StreamNet:
         self._el_in = {}
         self._el_out = {}
         self.return_values = return_values
+        self._plan = None
+        self._profiler = None
+        self._executor = None
+        self.threads = None
 
 
     def add_element(self, name, el, n_in=0, n_out=1):
@@ -49,6 +58,7 @@ class StreamNet:
         self._elements[name] = el
         self._el_in[name] = [None for i in range(n_in)]
         self._el_out[name] = n_out
+        self.invalidate()
 
     def get_element_names(self):
         return self._elements.keys()[:]
@@ -70,6 +80,7 @@ class StreamNet:
             raise ValueError("Input {} already defined".format(name))
         self._iports.append(name)
         self._iports_dict[name] = len(self._iports)-1
+        self.invalidate()
 
     def add_output(self, name, n=1):
         """Defines an output
@@ -84,10 +95,11 @@ class StreamNet:
                 raise ValueError("Element {} has fewer than {} outputs".format(name, n))
             else:
                 self._oports.append((name, n))
-        elif name in self._iports:
+        elif name in self._iports_dict:
             self._oports.append((name,))
         else:
             raise ValueError("Element or Input {} not found".format(name))
+        self.invalidate()
 
     def set_el_inputs(self, name, *args):
         if name not in self._elements.keys():
@@ -103,6 +115,7 @@ class StreamNet:
                     raise ValueError("Element {} not found".format(arg[0]))
                 arg_list.append(arg)
         self._el_in[name] = arg_list
+        self.invalidate()
 
     def set_el_input(self, el_name, n_in, name, n_out=None):
         if name not in self._elements.keys():
@@ -112,9 +125,10 @@ class StreamNet:
             self._el_in[el_name][n_in] = (name,)
         else:
             self._el_in[el_name][n_in] = (name, n_out)
+        self.invalidate()
 
     def name_exists(self, name):
-        return (name in self._elements.keys()) or (name in self._iports)
+        return (name in self._elements) or (name in self._iports_dict)
     
     def add_el_input(self, el_name, name, n_out=None):
     
@@ -125,53 +139,173 @@ class StreamNet:
             self._el_in[el_name].append((name,))
         else:
             self._el_in[el_name].append((name, n_out))
+        self.invalidate()
 
     def broadcast(self, method_name, *method_args):
         for _, el in self._elements.items():
             f = getattr(el, method_name)
             f(*method_args)
 
-    def __call__(self, *args):
-        input_dict = {}
+    @property
+    def is_compiled(self):
+        """True if the current graph has an up to date execution plan"""
+        return self._plan is not None
+
+    def invalidate(self):
+        """Discards the execution plan
+
+        Called automatically whenever the graph is modified. The plan
+        is rebuilt by `compile` on the next call.
+        """
+        self._plan = None
+
+    def compile(self):
+        """Freezes the graph into a flat execution plan
+
+        Every element input is resolved into an index of a flat list of
+        values that is assembled once per timestep: the external inputs
+        come first, followed by the last output of each element, or the
+        individual output of a multi-output element, that is consumed
+        by some element. Outputs that no element reads are not gathered.
+        Each element gets a prebound getter taking its inputs from that
+        list. Network outputs are resolved into tuples (input index,
+        element, output number) read once the elements have run. Each
+        timestep then simply runs the precomputed schedule.
+
+        `compile` is called automatically by `__call__` the first time
+        the network is run and after any modification of the graph.
+
+        Returns:
+            The streamnet itself
+
+        Raises:
+            ValueError: an element input is undefined or refers to an
+                invalid output
+        """
+
+        n_ports = len(self._iports)
+        consumed = []
+        consumed_index = {}
+
+        def el_source(inp_name, n_out):
+            # n_out is None for single-output elements, and otherwise an
+            # index into the outputs of the element
+            if self._el_out[inp_name] == 1:
+                if n_out != 1:
+                    raise ValueError("{} is greater than the number of outputs".format(n_out))
+                n_out = None
+            key = (inp_name, n_out)
+            if key not in consumed_index:
+                consumed_index[key] = n_ports + len(consumed)
+                consumed.append((self._elements[inp_name], n_out))
+            return consumed_index[key]
+
+        schedule = []
         for name, el in self._elements.items():
-            input_list = []
+            sources = []
             for el_input in self._el_in[name]:
+                if el_input is None:
+                    raise ValueError("Undefined input for element {}".format(name))
                 inp_name = el_input[0]
-                if inp_name in self._iports:
-                    input_list.append(args[self._iports_dict[inp_name]])
+                if inp_name in self._iports_dict:
+                    sources.append(self._iports_dict[inp_name])
                 else:
-                    if len(el_input) == 1:
-                        n_out = 1
-                    else:
-                        n_out = el_input[1]
-
-                    if self._el_out[inp_name] == 1:
-                        if n_out == 1:
-                            input_list.append(self._elements[inp_name].out)
-                        else:
-                            raise ValueError("{} is greater than the number of outputs".format(n_out))
-                    else:
-                        input_list.append(self._elements[inp_name].out[n_out])
-            input_dict[name] = input_list
-        
-        for name, el in self._elements.items():
-            el(*input_dict[name])
-        
-        self.out = []
-
+                    n_out = 1 if len(el_input) == 1 else el_input[1]
+                    sources.append(el_source(inp_name, n_out))
+            if self._profiler is not None:
+                el = self._profiler.timer(name, el)
+            get = itemgetter(*sources) if sources else None
+            schedule.append((el, get, len(sources)))
+
+        outputs = []
         for op in self._oports:
             if len(op) == 1:
-                self.out.append(args[self._iports_dict[op[0]]])
+                outputs.append((self._iports_dict[op[0]], None, None))
             else:
                 name, nout = op
-                if self._el_out[name] == 1:
-                    self.out.append(self._elements[name].out)
+                # outputs are numbered from 1
+                n = None if self._el_out[name] == 1 else nout-1
+                outputs.append((None, self._elements[name], n))
+
+        self._plan = (n_ports, tuple(consumed), tuple(schedule), tuple(outputs))
+        return self
+
+    def set_threads(self, threads):
+        """Sets the number of threads running the elements
+
+        Within a timestep, elements only read the outputs of the
+        previous timestep, so that they can run concurrently. See
+        `parallel`.
+
+        Args:
+            threads : number of threads, or None to run the elements
+                sequentially
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+        self.threads = threads
+        self._executor = make_executor(threads)
+
+    def enable_profiling(self, samples=False):
+        """Starts measuring the time spent in each part of the network
+
+        See `profiler.Profiler`. Profiling adds a small overhead to each
+        measured call, and none once it is disabled.
+
+        Args:
+            samples : if True, the duration of every call is kept
+                (optional, default False)
+
+        Returns:
+            The `Profiler`, whose `report` and `as_dict` methods give
+            the measurements
+        """
+        from ..profiler import Profiler
+        self.disable_profiling()
+        profiler = Profiler(samples)
+        profiler.attach(self)
+        return profiler
+
+    def disable_profiling(self):
+        """Stops measuring and restores the unprofiled execution"""
+        if self._profiler is not None:
+            self._profiler.detach()
+
+    def _gather(self, args, consumed):
+        values = list(args)
+        values.extend([el.out if n is None else el.out[n] for el, n in consumed])
+        return values
+
+    def _outputs(self, args):
+        """Returns the network outputs after a timestep"""
+        return [args[i] if el is None else (el.out if n is None else el.out[n])
+                for i, el, n in self._plan[3]]
+
+    def _step(self, args):
+        """Runs the execution plan for a single timestep"""
+        if self._plan is None:
+            self.compile()
+        n_ports, consumed, schedule, _ = self._plan
+        if len(args) != n_ports:
+            raise ValueError("Expected {} inputs, got {}".format(n_ports, len(args)))
+
+        values = self._gather(args, consumed)
+        if self._executor is None:
+            for el, get, n in schedule:
+                if n == 1:
+                    el(get(values))
+                elif n:
+                    el(*get(values))
                 else:
-                    self.out.append(self._element[name].out[nout-1])
-        
-#        if len(self._oports) == 1:
-#            self.out = self.out[0]
+                    el()
+        else:
+            run_calls(self._executor, [
+                (el, (get(values),) if n == 1 else get(values) if n else ())
+                for el, get, n in schedule])
+
+    def __call__(self, *args):
+        self._step(args)
+        self.out = self._outputs(args)
 
         if self.return_values:
             return self.out
-
@@ -0,0 +1,212 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+"""
+Parameter sweeps over network configurations
+
+`run_sweep` builds and runs a network for each configuration of a
+sweep in a pool of worker processes. Configurations are dictionaries of
+parameters, which can be generated with `grid` or `random_search`.
+
+Input arrays are copied once into shared memory, and each worker maps
+them instead of receiving a copy with every task. Results are appended
+to a JSON lines file as soon as each configuration finishes, so that an
+interrupted sweep can be resumed by running it again with the same
+results file: configurations already in the file are not run again.
+
+"""
+
+import itertools
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .shared import SharedArray
+
+
+def grid(params):
+    """Returns all the combinations of parameter values
+
+    Args:
+        params : dictionary with the list of values of each parameter
+
+    Returns:
+        A list of configurations
+    """
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+
+def random_search(params, n, seed=None):
+    """Returns random configurations
+
+    Args:
+        params : dictionary with, for each parameter, either a list of
+            values to choose from, a function taking a
+            `np.random.Generator` and returning a value, or a constant
+        n : number of configurations
+        seed : random seed (optional)
+
+    Returns:
+        A list of configurations
+    """
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, values in params.items():
+            if isinstance(values, list):
+                value = values[rng.integers(len(values))]
+            elif callable(values):
+                value = values(rng)
+            else:
+                value = values
+            config[name] = value.item() if isinstance(value, np.generic) else value
+        configs.append(config)
+    return configs
+
+
+def mean_rates(net, outputs, config):
+    """Default evaluation: mean value of each recorded output"""
+    return {"rates": [float(np.mean(out)) for out in outputs]}
+
+
+def _jsonable(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("{} is not JSON serializable".format(type(value)))
+
+
+def config_key(config):
+    """Returns a string identifying a configuration"""
+    return json.dumps(config, sort_keys=True, default=_jsonable)
+
+
+_worker = {}
+
+
+def _init_worker(build, evaluate, inputs, run_kwargs):
+    _worker.update(build=build, evaluate=evaluate, inputs=inputs,
+                   run_kwargs=run_kwargs)
+
+
+def _run_config(index, config):
+    try:
+        net = _worker["build"](config)
+        inputs = [shared.array for shared in _worker["inputs"]]
+        outputs = net.run(*inputs, **_worker["run_kwargs"])
+        return index, _worker["evaluate"](net, outputs, config), None
+    except Exception:
+        return index, None, traceback.format_exc()
+
+
+def load_results(path):
+    """Reads the records of a results file
+
+    Lines that cannot be parsed, such as a line truncated by a crash,
+    are ignored.
+
+    Returns:
+        A list of dictionaries with keys config, and result or error
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records
+
+
+def run_sweep(build, configs, inputs=(), steps=None, learn=True, record=None,
+        evaluate=mean_rates, results=None, workers=None, mp_context=None):
+    """Runs a network for each configuration of a sweep
+
+    Each worker calls `build(config)` to create a `SpikingNet`, runs it
+    with `SpikingNet.run` over the inputs, and calls
+    `evaluate(net, outputs, config)`, which should return a dictionary
+    that can be serialized as JSON. `build` and `evaluate` must be
+    defined at module level so that they can be sent to the workers.
+
+    Args:
+        build : function creating a network from a configuration
+        configs : list of configurations
+        inputs : arrays whose first axis is time, one per network input
+        steps : number of timesteps (optional, defaults to the length
+            of the inputs)
+        learn : passed to `SpikingNet.run` (optional, default True)
+        record : names of the layers to record (optional, defaults to
+            the network outputs)
+        evaluate : function returning the results of a configuration
+            (optional, defaults to `mean_rates`)
+        results : JSON lines file where results are appended. Existing
+            results are loaded, and their configurations skipped
+            (optional)
+        workers : number of worker processes (optional, defaults to
+            the number of cores). If 0, configurations are run in the
+            calling process
+        mp_context : multiprocessing context of the pool (optional)
+
+    Returns:
+        A list with one dictionary per configuration, in the same
+        order, with keys config, and result or error. Results are
+        converted to their JSON representation.
+    """
+    done = {}
+    if results is not None:
+        for rec in load_results(results):
+            if "result" in rec:
+                done[config_key(rec["config"])] = rec
+
+    records = [done.get(config_key(config)) for config in configs]
+    pending = [i for i, rec in enumerate(records) if rec is None]
+    if not pending:
+        return records
+
+    run_kwargs = {"steps": steps, "learn": learn, "record": record}
+    shared = [SharedArray.from_array(a) for a in inputs]
+    out = None if results is None else open(results, "a+")
+    try:
+        if out is not None and out.tell() > 0:
+            # Terminates a line truncated by a crash
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+
+        def collect(index, result, error):
+            rec = {"config": configs[index]}
+            if error is None:
+                rec["result"] = result
+            else:
+                rec["error"] = error
+            line = json.dumps(rec, default=_jsonable)
+            # Records hold the same values whether they were just
+            # computed or read from the results file
+            records[index] = json.loads(line)
+            if out is not None:
+                out.write(line + "\n")
+                out.flush()
+
+        if workers == 0:
+            _init_worker(build, evaluate, shared, run_kwargs)
+            for i in pending:
+                collect(*_run_config(i, configs[i]))
+        else:
+            with ProcessPoolExecutor(workers, mp_context=mp_context,
+                    initializer=_init_worker,
+                    initargs=(build, evaluate, shared, run_kwargs)) as pool:
+                futures = [pool.submit(_run_config, i, configs[i]) for i in pending]
+                for future in as_completed(futures):
+                    collect(*future.result())
+    finally:
+        if out is not None:
+            out.close()
+        for a in shared:
+            a.unlink()
+    return records
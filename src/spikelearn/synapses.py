@@ -15,7 +15,11 @@ they will be implemented.
 """
 
 import numpy as np
-from .rules import STDPRule
+from .rules import STDPRule, WeightConstr
+from .ops import (matvec, weight_dtype, cast_weights, shard_bounds, sharded_matvec,
+                  state_shape)
+from .parallel import shared_executor
+from .sparse import SparseWeights
 
 
 class BaseSynapse:
@@ -28,16 +32,26 @@ class BaseSynapse:
         No : dimensions of postsynaptic neurons
         transform : input transform
         syn_type : type of synapse, one of exc, inh, hybrid, None
+        event_driven : propagate only the active inputs. If None, the
+            event-driven path is used when inputs are sparse.
+        dtype : floating point type of weights, transforms, and traces.
+            If None, the dtype of the initial weights is used.
 
    
     """
 
-    def __init__(self, Ne, No, W0, transform=None, learning_rule=None, syn_type=None):
+    def __init__(self, Ne, No, W0, transform=None, learning_rule=None, syn_type=None,
+                 event_driven=None, dtype=None):
 
         self.Ne = Ne
         self.No = No
         self.W = W0
-        self.out = np.zeros(self.No)
+        self.event_driven = event_driven
+        self.batch_size = None
+        self._shards = None
+        self.dtype = weight_dtype(W0) if dtype is None else np.dtype(dtype)
+        self._dtype_fixed = False
+        self.out = np.zeros(self.No, self.dtype)
 
         if syn_type is None:
             self.syn_type = 'hybrid'
@@ -52,6 +66,7 @@ class BaseSynapse:
         
         
         self._set_learning_rule(learning_rule)
+        self.set_dtype(self.dtype, override=dtype is not None)
 
 
     def _set_learning_rule(self, learning_rule):
@@ -70,26 +85,134 @@ class BaseSynapse:
 
 
     def calc(self, xe):
+        x = self.transform(xe)
+        if self._shards is not None and isinstance(self.W, np.ndarray):
+            out = sharded_matvec(self.W, x, self.event_driven, *self._shards)
+        else:
+            out = matvec(self.W, x, self.event_driven)
         if self.syn_type == "inh":
-            self.out = - self.W @ self.transform(xe)
+            self.out = - out
         else:
-            self.out =  self.W @ self.transform(xe)
+            self.out = out
         return self.out
 
 
+    def set_shards(self, shards, threads=None):
+        """Partitions the synapse into blocks of postsynaptic neurons
+
+        The product of the weights and the input, and the weight updates
+        of the learning rule, are then computed block by block in a
+        thread pool shared with the other sharded synapses. Each block
+        only needs its rows of the weights and its slice of the
+        postsynaptic activity and traces. Sparse weights are not
+        partitioned.
+
+        Args:
+            shards : number of blocks, or None to compute the whole
+                synapse at once
+            threads : number of threads (optional, defaults to the
+                number of blocks)
+        """
+        if shards is None or shards <= 1:
+            self._shards = None
+        else:
+            bounds = shard_bounds(self.No, shards)
+            self._shards = (bounds, shared_executor(threads or len(bounds)))
+        if self._plastic and hasattr(self.learning_rule, "set_shards"):
+            self.learning_rule.set_shards(self._shards)
+
+
     def reset(self):
         if self.has_transform:
             self.transform.reset()
         if self._plastic:
+            self.flush()
             self.learning_rule.reset()
 
 
+    def flush(self):
+        """Commits the weight changes of the current learning epoch
+
+        Rules with a learning_epoch accumulate weight changes and apply
+        them every few timesteps. Flushing applies the pending changes
+        immediately, for instance before reading or saving the weights.
+        """
+        if self._plastic and hasattr(self.learning_rule, "flush"):
+            self.W = self.learning_rule.flush(self.W)
+
+
+    def set_batch_size(self, batch_size):
+        """Sets the number of independent samples simulated in parallel
+
+        Synaptic weights are shared by all the samples, while transforms
+        and traces keep a separate state for each sample.
+
+        Args:
+            batch_size : number of samples, or None for a single
+                unbatched simulation
+        """
+        self.batch_size = batch_size
+        if self.has_transform:
+            self.transform.set_batch_size(batch_size)
+        if self._plastic:
+            self.learning_rule.set_batch_size(batch_size)
+
+
+    def set_dtype(self, dtype, override=True):
+        """Sets the floating point type of the synapse
+
+        Converts the weights and resets transforms and traces if their
+        dtype changes.
+
+        Args:
+            dtype : a numpy floating point type
+            override : if False, a dtype given explicitly when the synapse
+                was created is preserved
+        """
+        if self._dtype_fixed and not override:
+            return
+        self.dtype = np.dtype(dtype)
+        self._dtype_fixed = override
+        self.W = cast_weights(self.W, self.dtype)
+        self.out = self.out.astype(self.dtype, copy=False)
+        if self.has_transform and self.transform.dtype != self.dtype:
+            self.transform.set_dtype(self.dtype)
+        if self._plastic and self.learning_rule.dtype != self.dtype:
+            self.learning_rule.set_dtype(self.dtype)
+
+
     def update(self, xo, learn=True):
         if self._plastic:
             if learn:
                 self.W = self.learning_rule.update(self.xe, xo, self.W, learn)
             else:
-                self.learning_rule.update(self.xe, xo)
+                self.learning_rule.update(self.xe, xo, learn=False)
+
+    @property
+    def plastic(self):
+        """True if `update` changes the synapse
+
+        Synapses without a learning rule only need their update called
+        if they keep their own traces or plasticity state.
+        """
+        return self._plastic
+
+    @property
+    def fusable(self):
+        """True if the synapse can be fused with other static synapses
+
+        Fusable synapses have no learning rule and no transform, and
+        compute the product of dense, writeable weights and their input.
+        Read-only weights, such as weights shared with other processes,
+        are not fused, so that the synapse keeps reading them.
+        """
+        cls = type(self)
+        return (not self._plastic and not self.has_transform
+                and self._shards is None
+                and isinstance(self.W, np.ndarray) and self.W.ndim == 2
+                and self.W.flags.writeable
+                and cls.__call__ is BaseSynapse.__call__
+                and cls.calc is BaseSynapse.calc)
 
     @property
     def W(self):
@@ -105,19 +228,138 @@ class StaticSynapse(BaseSynapse):
     """
     Base class for a synapse where synaptic weights are stored in a 2D array.
        
+    Args:
+
+        Ne : number of presynaptic neurons
+        No : number of postsynaptic neurons
+        W0 : a 2D array or a `SparseWeights` object with the initial
+            synaptic weights
+        transform : input transform
+        syn_type : type of synapse, one of exc, inh, hybrid, None
+        event_driven : propagate only the active inputs (optional)
+        dtype : floating point type of the weights (optional)
+
+    """
+
+    def __init__(self, Ne, No, W0, transform=None, syn_type=None,
+                 event_driven=None, dtype=None):
+
+        super().__init__(Ne, No, W0, transform, None, syn_type, event_driven,
+                         dtype)
+
+
+
+class DelayedSynapse(BaseSynapse):
+    """
+    Static synapse with an integer delay for each connection
+
+    An input of presynaptic neuron j at timestep t reaches postsynaptic
+    neuron i at timestep t + delays[i, j]. When an input is active, its
+    contributions are added to a circular buffer with one slot per
+    timestep of delay, at the slot of their arrival. Each timestep then
+    reads a single slot, so that the cost depends on the activity and
+    not on the delays, and pending inputs are never moved.
+
+    A synapse where all connections have the same delay is better
+    implemented with a `DelayLine` transform.
+
     Args:
 
         Ne : number of presynaptic neurons
         No : number of postsynaptic neurons
         W0 : a 2D array with the initial synaptic weights
+        delays : a (No, Ne) array of non-negative integer delays, in
+            timesteps, or a single delay for all connections
         transform : input transform
         syn_type : type of synapse, one of exc, inh, hybrid, None
+        dtype : floating point type of the weights (optional)
+
+    Raises:
+
+        ValueError: invalid weights or delays
 
     """
 
-    def __init__(self, Ne, No, W0, transform=None, syn_type=None):
+    def __init__(self, Ne, No, W0, delays, transform=None, syn_type=None,
+                 dtype=None):
+
+        if not isinstance(W0, np.ndarray) or W0.shape != (No, Ne):
+            raise ValueError("Weights must be a ({}, {}) array".format(No, Ne))
+        delays = np.broadcast_to(np.asarray(delays), (No, Ne))
+        if delays.dtype.kind not in "iu" or delays.min() < 0:
+            raise ValueError("Delays must be non-negative integers")
+        self.max_delay = int(delays.max())
+        # Transposed, like the weights, so that the connections of an
+        # active input are contiguous
+        self._delays = np.ascontiguousarray(
+            delays.T, np.min_scalar_type(self.max_delay))
+        self._rows = np.arange(No)
+        super().__init__(Ne, No, np.asfortranarray(W0), transform, None, syn_type,
+                         True, dtype)
+
+
+    @property
+    def delays(self):
+        """The (No, Ne) array of delays"""
+        return self._delays.T
 
-        super().__init__(Ne, No, W0, transform, None, syn_type)
+
+    def _init_buffer(self):
+        shape = (self.max_delay + 1,) + state_shape(self.No, self.batch_size)
+        self._pending = np.zeros(shape, self.dtype)
+        self._step = 0
+
+
+    def reset(self):
+        super().reset()
+        self._init_buffer()
+
+
+    def set_batch_size(self, batch_size):
+        super().set_batch_size(batch_size)
+        self._init_buffer()
+
+
+    def set_dtype(self, dtype, override=True):
+        super().set_dtype(dtype, override)
+        self._init_buffer()
+
+
+    def calc(self, xe):
+        x = self.transform(xe)
+        pending = self._pending
+        L = len(pending)
+        slot = self._step % L
+        # The slot read at the previous timestep receives the inputs
+        # arriving max_delay timesteps from now
+        pending[(slot - 1) % L] = 0
+        if x.ndim == 1:
+            idx = np.flatnonzero(x)
+            offsets = self._rows
+            values = self.W[:, idx].T
+            if x.dtype != bool:
+                values = values*x[idx, None]
+        else:
+            b, idx = np.nonzero(x)
+            offsets = b[:, None]*self.No + self._rows
+            values = self.W[:, idx].T*x[b, idx][:, None]
+        if len(idx) > 0:
+            # Flat indices of the arrival slot of each contribution
+            # Delays are stored in the smallest integer type, and are
+            # widened before the addition so that it cannot overflow
+            flat = self._delays[idx].astype(np.intp)
+            flat += slot
+            flat %= L
+            flat *= pending[0].size
+            flat += offsets
+            np.add.at(pending.reshape(-1), flat.ravel(), values.ravel())
+        self._step += 1
+        # The output is a copy, as the slot is reused by later inputs
+        if self.syn_type == "inh":
+            self.out = - pending[slot]
+        else:
+            self.out = pending[slot].copy()
+        return self.out
 
 
 
@@ -131,33 +373,44 @@ class OneToOneSynapse(BaseSynapse):
     Args:
 
         Ne : Dimensions of neurons in the layer
-        W0 : Synaptic weights
+        W0 : Synaptic weights, either a 1D array or a `SparseWeights`
+            object whose synapses lie on the diagonal
         transform : input transform
         syn_type : type of synapse, one of exc, inh, hybrid, None
+        dtype : floating point type of the weights (optional)
 
     """
 
     def __init__(self, Ne, W0, transform=None, learning_rule=None,
-                 syn_type=None):
+                 syn_type=None, dtype=None):
 
-        super().__init__(Ne, Ne, W0, transform, learning_rule, syn_type)
+        super().__init__(Ne, Ne, W0, transform, learning_rule, syn_type,
+                         dtype=dtype)
 
 
     def calc(self, xe):
         self.xe = xe
+        if isinstance(self.W, SparseWeights):
+            out = self.W.dot(self.transform(xe))
+        else:
+            out = self.W * self.transform(xe)
         if self.syn_type == "inh":
-            return - self.W * self.transform(xe)
+            return - out
         else:
-            return self.W * self.transform(xe)
+            return out
 
 
 class STDPSynapse(BaseSynapse):
 
     def __init__(self, Ne, No, W0, tre, tro, transform=None,
-        rule_params = None, Wlim=1, syn_type=None, tracelim=10):
-
-        self.learning_rule = STDPRule(rule_params, tre, tro, tracelim, Wlim)
-        super().__init__(Ne, No, W0, transform, self.learning_rule, syn_type)
+        rule_params = None, Wlim=1, syn_type=None, tracelim=10,
+        event_driven=None, dtype=None, lazy_traces=False, learning_epoch=1):
+
+        self.learning_rule = STDPRule(rule_params, tre, tro, tracelim,
+                                      WeightConstr(Wlim), lazy_traces,
+                                      learning_epoch)
+        super().__init__(Ne, No, W0, transform, self.learning_rule, syn_type,
+                         event_driven, dtype)
 
 
     def old_apply_rule(self, xe, xo):
@@ -10,16 +10,18 @@ class TernarySynapse(BaseSynapse):
     """
 
     def __init__(self, Ne, No, Nm, W0, transform=None, transform_m=None,
-                 learning_rule=None, syn_type=None):
+                 learning_rule=None, syn_type=None, event_driven=None,
+                 dtype=None):
         self.Nm = Nm
 
         self.has_transform_m = transform_m is not None
         if self.has_transform_m:
-            self.transform_m = transform
+            self.transform_m = transform_m
         else:
             self.transform_m = lambda x: x
         
-        super().__init__(Ne, No, W0, transform, learning_rule, syn_type)
+        super().__init__(Ne, No, W0, transform, learning_rule, syn_type,
+                         event_driven, dtype)
       
 
     def _set_learning_rule(self, learning_rule):
@@ -38,11 +40,7 @@ class TernarySynapse(BaseSynapse):
 
 
     def calc(self, xe, xm):
-        if self.syn_type == "inh":
-            self.out = - self.W @ self.transform(xe)
-        else:
-            self.out =  self.W @ self.transform(xe)
-        return self.out
+        return super().calc(xe)
 
 
     def reset(self):
@@ -51,12 +49,24 @@ class TernarySynapse(BaseSynapse):
         super().reset()
 
 
+    def set_batch_size(self, batch_size):
+        if self.has_transform_m:
+            self.transform_m.set_batch_size(batch_size)
+        super().set_batch_size(batch_size)
+
+
+    def set_dtype(self, dtype, override=True):
+        super().set_dtype(dtype, override)
+        if self.has_transform_m and self.transform_m.dtype != self.dtype:
+            self.transform_m.set_dtype(self.dtype)
+
+
     def update(self, xo, learn=True):
         if self._plastic:
             if learn:
                 self.W = self.learning_rule.update(self.xe, xo, self.xm, self.W, learn)
             else:
-                self.learning_rule.update(self.xe, xo, self.xm)
+                self.learning_rule.update(self.xe, xo, self.xm, learn=False)
 
 
 
@@ -67,7 +77,8 @@ class MSESynapse(TernarySynapse):
 
     def __init__(self, Ne, No, W0, tre, tro, trm, transform=None,
         transform_mod=None,
-        rule_params = None, Wlim=1, syn_type=None, tracelim=10):
+        rule_params = None, Wlim=1, syn_type=None, tracelim=10,
+        event_driven=None, dtype=None, lazy_traces=False, learning_epoch=1):
         """
         Args:
             Ne : number of presynaptic neurons
@@ -82,10 +93,17 @@ class MSESynapse(TernarySynapse):
             Wlim : clamping parameter for synaptic weights
             syn_type : type of synapse ("exc", "inh", None)
             tracelim : clamping parameter for synaptic traces
+            event_driven : propagate only the active inputs (optional)
+            dtype : floating point type of weights and traces (optional)
+            lazy_traces : decay the traces only when they are read or
+                receive an input (optional, default False)
+            learning_epoch : number of timesteps between weight updates,
+                see `LearningRule` (optional, default 1)
         
         """
 
-        learning_rule = MSERule(rule_params, tre, tro, trm, tracelim, Wlim)
+        learning_rule = MSERule(rule_params, tre, tro, trm, tracelim, Wlim,
+                                lazy_traces, learning_epoch)
         super().__init__(Ne, No, No, W0, transform, transform_mod, learning_rule,
-                         syn_type)
+                         syn_type, event_driven, dtype)
 
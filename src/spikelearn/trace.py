@@ -1,23 +1,198 @@
 #Copyright Argonne 2022. See LICENSE.md for details.
 
 import numpy as np
+from .ops import state_shape, cast
 
 class Trace:
 
-    def __init__(self, N, t0, t1, tracelim):
+    def __init__(self, N, t0, t1, tracelim, batch_size=None, dtype=None):
         self.N = N
         self.t0 = t0
         self.t1 = t1
         self.tracelim = tracelim
+        self.batch_size = batch_size
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
         self.reset()
 
     def reset(self):
-        self.t = np.zeros(self.N)
+        self._t0 = cast(self.t0, self.dtype)
+        self._t1 = cast(self.t1, self.dtype)
+        self._tracelim = cast(self.tracelim, self.dtype)
+        self.t = np.zeros(state_shape(self.N, self.batch_size), self.dtype)
 
     def update(self, x):
-        self.t = self.t0*x + self.t1*self.t
-        self.t[self.t>self.tracelim] = self.tracelim
+        self.t *= self._t1
+        self.t += self._t0*x
+        np.minimum(self.t, self._tracelim, out=self.t)
 
     def __call__(self):
         return self.t
 
+
+class TraceView(Trace):
+    """A trace stored as a slice of a `TraceBank`
+
+    Has the same interface as `Trace`. Its values are a view of the
+    bank array, and are updated either individually or together with
+    all the traces of the bank through `TraceBank.update`.
+    """
+
+    def __init__(self, bank, start, N, t0, t1, tracelim):
+        self.N = N
+        self.t0 = t0
+        self.t1 = t1
+        self.tracelim = tracelim
+        self.batch_size = bank.batch_size
+        self.dtype = bank.dtype
+        self._t0 = cast(t0, self.dtype)
+        self._t1 = cast(t1, self.dtype)
+        self._tracelim = cast(tracelim, self.dtype)
+        self.t = bank.t[..., start:start+N]
+
+    def reset(self):
+        self.t[...] = 0
+
+
+class TraceBank:
+    """Stores several traces in a single contiguous array
+
+    All traces are updated at once: their inputs are copied into a
+    staging array and the decay, input and clamp steps are each applied
+    in place to the whole bank, using arrays with the parameters of
+    each entry. The individual traces are available as `TraceView`
+    objects in `traces`.
+
+    Args:
+        specs : list of tuples (N, t0, t1, tracelim), one per trace
+        batch_size : number of independent samples (optional)
+        dtype : floating point type of the traces (optional)
+
+    """
+
+    def __init__(self, specs, batch_size=None, dtype=None):
+        self.specs = [tuple(spec) for spec in specs]
+        self.batch_size = batch_size
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+
+        sizes = [spec[0] for spec in self.specs]
+        self.N = sum(sizes)
+        self._bounds = np.concatenate(([0], np.cumsum(sizes))).tolist()
+        self._t0 = np.repeat([spec[1] for spec in self.specs], sizes).astype(self.dtype)
+        self._t1 = np.repeat([spec[2] for spec in self.specs], sizes).astype(self.dtype)
+        self._tracelim = np.repeat([spec[3] for spec in self.specs], sizes).astype(self.dtype)
+
+        shape = state_shape(self.N, self.batch_size)
+        self.t = np.zeros(shape, self.dtype)
+        self._x = np.zeros(shape, self.dtype)
+        self.traces = [TraceView(self, start, *spec)
+                       for start, spec in zip(self._bounds, self.specs)]
+
+    def reset(self):
+        self.t[...] = 0
+
+    def update(self, *x):
+        """Updates all traces
+
+        Args:
+            x : one input per trace, in the order of `specs`
+        """
+        if len(x) != len(self.traces):
+            raise ValueError("Expected {} inputs, got {}".format(len(self.traces), len(x)))
+        xs = self._x
+        for start, end, xi in zip(self._bounds, self._bounds[1:], x):
+            xs[..., start:end] = xi
+        t = self.t
+        t *= self._t1
+        np.multiply(xs, self._t0, out=xs)
+        t += xs
+        np.minimum(t, self._tracelim, out=t)
+
+    def __call__(self):
+        return self.t
+
+
+class LazyTrace(Trace):
+    """A trace whose decay is computed only when needed
+
+    Stores, for each neuron, the value of the trace at the last step in
+    which it received an input, together with that step. Updates only
+    touch the neurons with nonzero input, applying the accumulated decay
+    `t1**dt`, so their cost scales with the number of spikes instead of
+    with N. Reading the whole trace brings all the entries up to date.
+
+    Has the same interface as `Trace`. The decay factor t1 should not be
+    larger than 1, so that entries without input never exceed the
+    trace limit.
+    """
+
+    def reset(self):
+        self._t0 = cast(self.t0, self.dtype)
+        self._t1 = cast(self.t1, self.dtype)
+        self._tracelim = cast(self.tracelim, self.dtype)
+        self._t = np.zeros(state_shape(self.N, self.batch_size), self.dtype)
+        self._last = np.zeros(self.N, np.int64)
+        self._step = 0
+        self._stale = False
+
+    def _decay(self, dt):
+        return self._t1**dt.astype(self.dtype)
+
+    def update(self, x):
+        self._step += 1
+        self._stale = True
+        x = np.asarray(x)
+        if x.ndim > 1:
+            idx = np.flatnonzero(np.any(x, axis=0))
+        else:
+            idx = np.flatnonzero(x)
+        if len(idx) == 0:
+            return
+        t = self._t[..., idx]*self._decay(self._step - self._last[idx])
+        t += self._t0*x[..., idx]
+        np.minimum(t, self._tracelim, out=t)
+        self._t[..., idx] = t
+        self._last[idx] = self._step
+
+    def at(self, idx):
+        """Returns the current value of the trace for some neurons"""
+        return self._t[..., idx]*self._decay(self._step - self._last[idx])
+
+    def __call__(self):
+        if self._stale:
+            self._t *= self._decay(self._step - self._last)
+            self._last[:] = self._step
+            self._stale = False
+        return self._t
+
+    @property
+    def t(self):
+        return self()
+
+
+class TraceList:
+    """Independent traces updated together
+
+    Provides the `update` and `reset` interface of `TraceBank` for
+    traces that cannot share a single array, such as `LazyTrace`.
+
+    Args:
+        specs : list of tuples (N, t0, t1, tracelim), one per trace
+        batch_size : number of independent samples (optional)
+        dtype : floating point type of the traces (optional)
+        trace_type : class of the traces (optional, default LazyTrace)
+
+    """
+
+    def __init__(self, specs, batch_size=None, dtype=None, trace_type=LazyTrace):
+        self.specs = [tuple(spec) for spec in specs]
+        self.traces = [trace_type(*spec, batch_size, dtype) for spec in self.specs]
+
+    def reset(self):
+        for trace in self.traces:
+            trace.reset()
+
+    def update(self, *x):
+        if len(x) != len(self.traces):
+            raise ValueError("Expected {} inputs, got {}".format(len(self.traces), len(x)))
+        for trace, xi in zip(self.traces, x):
+            trace.update(xi)
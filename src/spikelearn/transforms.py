@@ -1,13 +1,14 @@
 #Copyright Argonne 2022. See LICENSE.md for details.
 
 import numpy as np
+from .ops import state_shape, cast
 
 class BaseTrace:
     """ Implement the base class for a trace with optional delay
 
     """
 
-    def __init__(self, N, delay=False):
+    def __init__(self, N, delay=False, batch_size=None, dtype=None):
         """
         Instantiates a low pass function
         
@@ -15,18 +16,32 @@ class BaseTrace:
 
             N : Number of neurons
             delay : Optional. If true, delays input for one timestep (default False)
+            batch_size : Optional. Number of independent samples (default None)
+            dtype : Optional. Floating point type of the output (default float64)
 
         """
         self.N = N
-        self.value = np.zeros(self.N)
         self.delay = delay
-        self._trace = np.zeros(self.N)
+        self.batch_size = batch_size
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+        self.reset()
 
     def reset(self):
         """Resets internal state
         """
-        self.value = np.zeros(self.N)
-        self._trace = np.zeros(self.N)
+        shape = state_shape(self.N, self.batch_size)
+        self.value = np.zeros(shape, self.dtype)
+        self._trace = np.zeros(shape, self.dtype)
+
+    def set_batch_size(self, batch_size):
+        """Sets the number of independent samples and resets the state"""
+        self.batch_size = batch_size
+        self.reset()
+
+    def set_dtype(self, dtype):
+        """Sets the floating point type and resets the state"""
+        self.dtype = np.dtype(dtype)
+        self.reset()
 
     @property
     def trace(self):
@@ -47,23 +62,101 @@ class BaseTrace:
             Current trace value
         """
         if self.delay:
-            self._trace = self.value.copy()
+            self._trace[...] = self.value
             self._update(x)
         else:
             self._update(x)
-            self._trace = self.value.copy()
+            self._trace[...] = self.value
         return self.trace
 
 
+class DelayLine:
+    """Delays its input by a fixed number of timesteps
+
+    Inputs are written into a circular buffer with one slot per timestep
+    of delay, and the output is a view of the slot holding the input of
+    `delay` timesteps earlier, so that no value is moved once written.
+    The output is valid until the next call. Boolean and unsigned
+    integer inputs, such as compact spike arrays, are stored without
+    conversion.
+
+    Args:
+
+        N : Number of neurons
+        delay : delay in timesteps, a non-negative integer
+        batch_size : Optional. Number of independent samples (default None)
+        dtype : Optional. Floating point type of the output (default float64)
+
+    Raises:
+
+        ValueError: invalid delay
+
+    """
+
+    def __init__(self, N, delay, batch_size=None, dtype=None):
+        if int(delay) != delay or delay < 0:
+            raise ValueError("Delay must be a non-negative integer")
+        self.N = N
+        self.delay = int(delay)
+        self.batch_size = batch_size
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+        self.reset()
+
+    def reset(self):
+        """Discards the pending inputs"""
+        shape = (self.delay + 1,) + state_shape(self.N, self.batch_size)
+        self._buffer = np.zeros(shape, self.dtype)
+        self._step = 0
+
+    def set_batch_size(self, batch_size):
+        """Sets the number of independent samples and resets the state"""
+        self.batch_size = batch_size
+        self.reset()
+
+    def set_dtype(self, dtype):
+        """Sets the floating point type and resets the state"""
+        self.dtype = np.dtype(dtype)
+        self.reset()
+
+    def __call__(self, x):
+        """Passes a new input and returns the input of `delay` timesteps earlier"""
+        buffer = self._buffer
+        if x.dtype != buffer.dtype:
+            dtype = x.dtype if x.dtype.kind in "bu" else self.dtype
+            buffer = self._buffer = buffer.astype(dtype)
+        n = len(buffer)
+        buffer[self._step % n] = x
+        self._step += 1
+        return buffer[self._step % n]
+
+
 class PassThrough(BaseTrace):
 
     """
     Pass-through function with optional delay
 
+    Boolean and unsigned integer inputs, such as compact spike arrays,
+    are passed through without converting them to floating point. The
+    buffers follow the type of the input, and are kept compact by
+    `reset` and `set_dtype` while the inputs are.
+
     """
 
+    def reset(self):
+        super().reset()
+        compact = getattr(self, "_compact", None)
+        if compact is not None:
+            self.value = self.value.astype(compact)
+            self._trace = self._trace.astype(compact)
+
     def _update(self, x):
-        return x
+        if x.dtype != self.value.dtype:
+            self._compact = x.dtype if x.dtype.kind in "bu" else None
+            dtype = self.dtype if self._compact is None else self._compact
+            # Pending values of a delayed input are kept
+            self.value = self.value.astype(dtype)
+            self._trace = self._trace.astype(dtype)
+        self.value[...] = x
 
 
 class LowPass(BaseTrace):
@@ -71,7 +164,7 @@ class LowPass(BaseTrace):
 
     """
 
-    def __init__(self, N, tau, delay=False):
+    def __init__(self, N, tau, delay=False, batch_size=None, dtype=None):
         """
         Instantiates a low pass function
         
@@ -80,11 +173,18 @@ class LowPass(BaseTrace):
             N : Number of neurons
             tau : Characteristic time
             delay : Optional. If true, delays input for one timestep (default False)
+            batch_size : Optional. Number of independent samples (default None)
+            dtype : Optional. Floating point type of the output (default float64)
 
         """
         self.beta  = np.exp(-1/tau)
-        super().__init__(N, delay)
+        super().__init__(N, delay, batch_size, dtype)
+
+    def reset(self):
+        super().reset()
+        self._beta = cast(self.beta, self.dtype)
 
 
     def _update(self, x):
-        self.value = (1-self.beta)*x + self.beta*self.value
+        self.value *= self._beta
+        self.value += (1-self._beta)*x
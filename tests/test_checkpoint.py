@@ -0,0 +1,187 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+import pytest
+
+from spikelearn import SpikingNet, SpikingLayer, StaticSynapse, STDPSynapse
+from spikelearn.checkpoint import MAGIC, network_state, save_state, load_state
+from spikelearn.loihi import STDPrule
+from spikelearn.shared import share_weights, attach_weights
+
+
+def _net(seed=0):
+    rng = np.random.default_rng(seed)
+    net = SpikingNet()
+    net.add_input("in")
+    net.add_layer(SpikingLayer(8, 2), "l1")
+    net.add_synapse("l1", StaticSynapse(6, 8, rng.random((8, 6))), "in")
+    net.add_layer(SpikingLayer(4, 2), "l2")
+    net.add_synapse("l2", StaticSynapse(8, 4, rng.random((4, 8))), "l1")
+    net.add_output("l2")
+    return net
+
+
+def _weights(net):
+    return [syn.W for el in net._elements.values() for syn in el._synapses]
+
+
+def test_shared_weights_round_trip(tmp_path):
+    path = str(tmp_path / "net.ckpt")
+    owner = _net()
+    shared = share_weights(owner)
+    try:
+        replica = _net(1)
+        attach_weights(replica, shared)
+        replica.run((np.random.default_rng(2).random((10, 6)) < 0.5).astype(float),
+                    learn=False)
+        save_state(replica, path)
+
+        # Read-only weights are saved, and restored into another network
+        other = _net(3)
+        load_state(other, path)
+        for W, W0 in zip(_weights(other), _weights(owner)):
+            np.testing.assert_array_equal(W, W0)
+
+        # Loading the same weights into the replica leaves them shared
+        load_state(replica, path)
+        assert all(not W.flags.writeable for W in _weights(replica))
+
+        # Different weights cannot be written into read-only arrays
+        save_state(_net(4), path)
+        v = replica._elements["l1"]._neuron.v.copy()
+        with pytest.raises(ValueError):
+            load_state(replica, path)
+        np.testing.assert_array_equal(replica._elements["l1"]._neuron.v, v)
+        # unless they are memory-mapped
+        load_state(replica, path, mmap_weights=True)
+        for W, W0 in zip(_weights(replica), _weights(_net(4))):
+            np.testing.assert_array_equal(W, W0)
+    finally:
+        for array in shared.values():
+            array.unlink()
+
+
+def _plastic_net(fuse=False, epoch=1, seed=5):
+    rng = np.random.default_rng(seed)
+    net = SpikingNet(fuse_synapses=fuse)
+    net.add_input("in")
+    net.add_input("mod")
+    net.add_layer(SpikingLayer(10, 2), "l1")
+    net.add_synapse("l1", StaticSynapse(6, 10, rng.random((10, 6))), "in")
+    net.add_synapse("l1", StaticSynapse(6, 10, 0.3*rng.random((10, 6)), syn_type="inh"), "in")
+    net.add_layer(SpikingLayer(8, 2), "l2")
+    net.add_synapse("l2", STDPSynapse(10, 8, 0.5*rng.random((8, 10)), (0.9, 1), (0.8, 1),
+                                      rule_params={"Ap": 0.02, "An": 0.01},
+                                      learning_epoch=epoch), "l1")
+    net.add_synapse("l2", STDPrule(6, 8, 0.5*rng.random((8, 6)), (0.9, 1), (0.8, 1),
+                                   (0.7, 1), 0.01, 0.01, None, learning_epoch=epoch),
+                    "in", "mod")
+    net.add_output("l2")
+    return net
+
+
+def _inputs(T, seed=6):
+    rng = np.random.default_rng(seed)
+    return (rng.random((T, 6)) < 0.4).astype(float), rng.random((T, 8))
+
+
+def _load(path, **kwargs):
+    net = _plastic_net(seed=8, **kwargs)
+    net.load_state(path)
+    return net
+
+
+def _state(net):
+    arrays, scalars = network_state(net)
+    return ({key: np.array(a) for key, (_, _, a) in arrays.items()},
+            {key: v for key, (_, _, v) in scalars.items()})
+
+
+def _assert_same_state(net, ref):
+    arrays, scalars = _state(net)
+    ref_arrays, ref_scalars = _state(ref)
+    assert scalars == ref_scalars
+    assert not set(arrays) ^ set(ref_arrays)
+    for key in arrays:
+        np.testing.assert_array_equal(arrays[key], ref_arrays[key], err_msg=key)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "net.ckpt")
+    xs, ms = _inputs(40)
+    net = _plastic_net()
+    net.run(xs[:20], ms[:20])
+    net.save_state(path)
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+
+    restored = _load(path)
+    _assert_same_state(restored, net)
+    assert restored.t == 20
+    out = net.run(xs[20:], ms[20:])[0]
+    np.testing.assert_array_equal(restored.run(xs[20:], ms[20:])[0], out)
+    _assert_same_state(restored, net)
+
+
+def test_load_errors(tmp_path):
+    path = str(tmp_path / "net.ckpt")
+    _net().save_state(path)
+    with pytest.raises(ValueError):
+        _plastic_net().load_state(path)
+    with open(path, "r+b") as f:
+        f.write(b"X")
+    with pytest.raises(ValueError):
+        _net().load_state(path)
+
+
+def test_mmap_weights_are_copy_on_write(tmp_path):
+    path = str(tmp_path / "net.ckpt")
+    xs, ms = _inputs(30)
+    net = _plastic_net()
+    net.run(xs[:10], ms[:10])
+    net.save_state(path)
+    saved = _state(net)[0]
+
+    mapped = _plastic_net(seed=7)
+    mapped.load_state(path, mmap_weights=True)
+    syn = mapped._elements["l2"]._synapses[0]
+    assert isinstance(syn.W.base, np.memmap) or isinstance(syn.W, np.memmap)
+    _assert_same_state(mapped, net)
+    # Learning writes into private pages, not into the file
+    mapped.run(xs[10:], ms[10:])
+    assert not np.array_equal(syn.W, saved["synapses/l2/0/_W"])
+    restored = _load(path)
+    np.testing.assert_array_equal(restored._elements["l2"]._synapses[0].W,
+                                  saved["synapses/l2/0/_W"])
+    net.run(xs[10:], ms[10:])
+    _assert_same_state(mapped, net)
+
+
+def test_fused_synapses_round_trip(tmp_path):
+    path = str(tmp_path / "net.ckpt")
+    xs, ms = _inputs(30)
+    net = _plastic_net(fuse=True)
+    net.run(xs[:15], ms[:15])
+    net.save_state(path)
+    out = net.run(xs[15:], ms[15:])[0]
+    restored = _load(path, fuse=True)
+    np.testing.assert_array_equal(restored.run(xs[15:], ms[15:])[0], out)
+    _assert_same_state(restored, net)
+    # Fused and unfused networks share the checkpoint format
+    _assert_same_state(_load(path), _load(path, fuse=True))
+
+
+def test_pending_learning_epoch_is_committed(tmp_path):
+    path = str(tmp_path / "net.ckpt")
+    xs, ms = _inputs(30)
+    net = _plastic_net(epoch=4)
+    net.run(xs[:10], ms[:10])
+    W = net._elements["l2"]._synapses[0].W.copy()
+    # Two steps of the epoch are pending, and committed by save_state
+    net.save_state(path)
+    assert not np.array_equal(net._elements["l2"]._synapses[0].W, W)
+    restored = _load(path, epoch=4)
+    _assert_same_state(restored, net)
+    np.testing.assert_array_equal(restored.run(xs[10:], ms[10:])[0],
+                                  net.run(xs[10:], ms[10:])[0])
+    _assert_same_state(restored, net)
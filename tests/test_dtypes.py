@@ -0,0 +1,128 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import SpikingNet, SpikingLayer, StaticSynapse, STDPSynapse
+from spikelearn.checkpoint import network_state
+from spikelearn.loihi import STDPrule
+from spikelearn.synapses import DelayedSynapse
+from spikelearn.transforms import DelayLine, LowPass, PassThrough
+
+
+def test_explicit_spike_dtype_survives_network_changes():
+    net = SpikingNet(spike_dtype=np.uint8)
+    net.add_input("in")
+    explicit = SpikingLayer(3, 2, spike_dtype=bool)
+    default = SpikingLayer(3, 2)
+    net.add_layer(explicit, "explicit")
+    net.add_layer(default, "default")
+    assert explicit.out.dtype == bool
+    assert default.out.dtype == np.uint8
+
+    net.set_spike_dtype(np.float32)
+    assert explicit.out.dtype == bool
+    assert default.out.dtype == np.float32
+
+    explicit.set_spike_dtype(np.uint8)
+    assert explicit.out.dtype == np.uint8
+    net.set_spike_dtype(None)
+    assert explicit.out.dtype == np.uint8
+    assert default.out.dtype == default.dtype
+
+
+def _float_arrays(net):
+    arrays, _ = network_state(net)
+    return {key: a.dtype for key, (_, _, a) in arrays.items()
+            if np.issubdtype(a.dtype, np.floating)}
+
+
+def _float32_net(**kwargs):
+    rng = np.random.default_rng(0)
+    net = SpikingNet(dtype=np.float32, **kwargs)
+    net.add_input("in")
+    net.add_input("mod")
+    net.add_layer(SpikingLayer(10, 2), "l1")
+    net.add_synapse("l1", StaticSynapse(6, 10, rng.random((10, 6))), "in")
+    net.add_synapse("l1", DelayedSynapse(6, 10, rng.random((10, 6)), 2), "in")
+    net.add_synapse("l1", StaticSynapse(6, 10, rng.random((10, 6)), LowPass(6, 3),
+                                        syn_type="inh"), "in")
+    net.add_layer(SpikingLayer(8, 2), "l2")
+    net.add_synapse("l2", STDPSynapse(10, 8, rng.random((8, 10)), (0.9, 1), (0.8, 1),
+                                      rule_params={"Ap": 0.01, "An": 0.01}), "l1")
+    net.add_synapse("l2", STDPrule(6, 8, rng.random((8, 6)), (0.9, 1), (0.8, 1),
+                                   (0.7, 1), 0.01, 0.01, None), "in", "mod")
+    net.add_output("l1")
+    net.add_output("l2")
+    return net
+
+
+def test_float32_net_keeps_float32_state():
+    rng = np.random.default_rng(1)
+    for fuse in (False, True):
+        net = _float32_net(fuse_synapses=fuse)
+        dtypes = _float_arrays(net)
+        assert dtypes and set(dtypes.values()) == {np.dtype(np.float32)}, dtypes
+        xs = (rng.random((30, 6)) < 0.4).astype(np.float64)
+        ms = rng.random((30, 8))
+        for out in net.run(xs, ms):
+            assert out.dtype == np.float32
+        for out in net(xs[0], ms[0]):
+            assert out.dtype == np.float32
+        dtypes = _float_arrays(net)
+        assert set(dtypes.values()) == {np.dtype(np.float32)}, dtypes
+
+
+def test_explicit_dtypes_are_kept():
+    rng = np.random.default_rng(2)
+    net = SpikingNet(dtype=np.float32)
+    net.add_input("in")
+    explicit = SpikingLayer(4, 2, dtype=np.float64)
+    default = SpikingLayer(4, 2)
+    net.add_layer(explicit, "explicit")
+    net.add_layer(default, "default")
+    syn = StaticSynapse(3, 4, rng.random((4, 3)), dtype=np.float64)
+    net.add_synapse("explicit", syn, "in")
+    assert explicit.v.dtype == np.float64 and syn.W.dtype == np.float64
+    assert default.v.dtype == np.float32
+
+    net.set_dtype(np.float16)
+    assert explicit.v.dtype == np.float64 and syn.W.dtype == np.float64
+    assert default.v.dtype == np.float16
+    net.run(np.ones((3, 3)))
+    assert explicit.out.dtype == np.float64
+
+    # An explicit dtype set on an element replaces the default one
+    default.set_dtype(np.float64)
+    net.set_dtype(np.float32)
+    assert default.v.dtype == np.float64
+    syn.set_dtype(np.float32)
+    assert syn.W.dtype == np.float32
+
+
+def test_pass_through_follows_input_dtype():
+    trace = PassThrough(3, delay=True)
+    spikes = np.array([True, False, True])
+    trace(spikes)
+    assert trace(spikes).dtype == bool
+    trace.reset()
+    assert trace.value.dtype == bool
+    trace.set_dtype(np.float32)
+    assert trace.value.dtype == bool
+
+    # Switching back to float inputs must not truncate them
+    trace(spikes)
+    out = trace(np.array([0.5, 0.25, 2.0]))
+    assert out.dtype == np.float32
+    np.testing.assert_array_equal(out, [1, 0, 1])
+    np.testing.assert_array_equal(trace(np.zeros(3)), [0.5, 0.25, 2.0])
+    trace.reset()
+    assert trace.value.dtype == np.float32
+
+
+def test_delay_line_follows_input_dtype():
+    line = DelayLine(3, 1)
+    line(np.array([True, False, True]))
+    out = line(np.array([0.5, 0.25, 2.0]))
+    assert out.dtype == np.float64
+    np.testing.assert_array_equal(out, [1, 0, 1])
+    np.testing.assert_array_equal(line(np.zeros(3)), [0.5, 0.25, 2.0])
@@ -0,0 +1,75 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import SpikingNet, SpikingLayer, SpikingRecLayer
+from spikelearn.neurons import BioLIFLayer
+from spikelearn.synapses import StaticSynapse
+
+
+def _net(layer, fuse, W1, W2, types=("exc", "inh")):
+    net = SpikingNet(fuse_synapses=fuse)
+    net.add_input("a")
+    net.add_input("b")
+    net.add_layer(layer, "l1")
+    net.add_synapse("l1", StaticSynapse(6, 4, W1, syn_type=types[0]), "a")
+    net.add_synapse("l1", StaticSynapse(5, 4, W2, syn_type=types[1]), "b")
+    net.add_output("l1")
+    return net
+
+
+def _synapses(net):
+    return net._elements["l1"]._synapses
+
+
+def _states(make_layer, fuse, edit, steps=30):
+    rng = np.random.default_rng(0)
+    W1 = rng.random((4, 6))
+    W2 = rng.random((4, 5))
+    net = _net(make_layer(), fuse, W1, W2)
+    states = []
+    for t in range(steps):
+        if t == steps//2:
+            edit(_synapses(net))
+        net(rng.random(6) < 0.5, rng.random(5) < 0.5)
+        states.append(np.array(net._elements["l1"]._neuron.v))
+    return np.array(states)
+
+
+def _scale_in_place(synapses):
+    for syn in synapses:
+        syn.W *= 3
+
+
+def _replace(synapses):
+    for syn in synapses:
+        syn.W = 3*syn.W
+
+
+def test_fused_synapses_follow_weight_changes():
+    layers = [lambda: SpikingLayer(4, 3), lambda: BioLIFLayer(4, 0.5)]
+    for make_layer in layers:
+        for edit in (_scale_in_place, _replace):
+            np.testing.assert_allclose(_states(make_layer, True, edit),
+                                       _states(make_layer, False, edit))
+
+
+def test_fusion_copies_initial_weights():
+    W1 = np.ones((4, 6))
+    W2 = np.ones((4, 5))
+    net = _net(SpikingLayer(4, 3), True, W1, W2)
+    net(np.ones(6), np.ones(5))
+    syn1, syn2 = _synapses(net)
+    assert net._elements["l1"]._fusion[0]
+    assert not np.shares_memory(syn1.W, W1)
+    W1[:] = 0
+    assert np.all(syn1.W == 1)
+
+
+def test_read_only_weights_are_not_fused():
+    W1 = np.ones((4, 6))
+    W1.flags.writeable = False
+    net = _net(SpikingLayer(4, 3), True, W1, np.ones((4, 5)), ("exc", "exc"))
+    net(np.ones(6), np.ones(5))
+    assert not net._elements["l1"]._fusion[0]
+    assert not _synapses(net)[0].W.flags.writeable
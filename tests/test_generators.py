@@ -0,0 +1,74 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import SpikingNet, SpikingLayer, StaticSynapse
+from spikelearn.generators import Poisson, Periodic, SpikeSequence
+
+
+def _draw(gen, T):
+    return np.array([gen() for _ in range(T)])
+
+
+def test_poisson_is_reproducible():
+    r0 = np.random.default_rng(0).random(30)
+    s = _draw(Poisson(30, r0, seed=5), 250)
+    np.testing.assert_array_equal(_draw(Poisson(30, r0, seed=5), 250), s)
+    # The stream does not depend on the size of the blocks
+    np.testing.assert_array_equal(_draw(Poisson(30, r0, seed=5, block_size=7), 250), s)
+    seq = np.random.SeedSequence(5)
+    np.testing.assert_array_equal(_draw(Poisson(30, r0, seed=seq), 250), s)
+    assert not np.array_equal(_draw(Poisson(30, r0, seed=6), 250), s)
+    # Rates follow r0
+    np.testing.assert_allclose(s.mean(axis=0), r0, atol=0.15)
+
+
+def test_spawned_streams_are_independent():
+    gen = Poisson(50, 0.5, seed=1)
+    children = gen.spawn(3)
+    streams = [_draw(g, 400).astype(float) for g in [gen] + children]
+    for i in range(len(streams)):
+        for j in range(i):
+            assert not np.array_equal(streams[i], streams[j])
+            c = np.corrcoef(streams[i].ravel(), streams[j].ravel())[0, 1]
+            assert abs(c) < 0.05
+    # Spawning is reproducible
+    again = Poisson(50, 0.5, seed=1).spawn(3)
+    for g, s in zip(again, streams[1:]):
+        np.testing.assert_array_equal(_draw(g, 400), s)
+
+
+def test_default_dtype_is_uint8():
+    for gen in (Poisson(8, 0.5, seed=0), Periodic(8, 0.3),
+                SpikeSequence(8, np.eye(8, 5))):
+        s = gen()
+        assert s.dtype == np.uint8
+        assert set(np.unique(_draw(gen, 20))) <= {0, 1}
+        assert not s.flags.writeable
+    assert Poisson(8, 0.5, dtype=float)().dtype == np.float64
+
+
+def test_uint8_spikes_in_float_arithmetic():
+    # The former generators returned int64 spikes. Float expressions of
+    # uint8 spikes give the same values and dtype
+    rng = np.random.default_rng(2)
+    W = rng.random((5, 40))
+    s = _draw(Poisson(40, 0.4, seed=3), 10)
+    old = s.astype(np.int64)
+    for f in (lambda x: W @ x[0], lambda x: 0.5*x, lambda x: x - 0.5,
+              lambda x: x/3, lambda x: x.mean(axis=0), lambda x: x*W[0]):
+        new, ref = f(s), f(old)
+        assert new.dtype == ref.dtype == np.float64
+        np.testing.assert_array_equal(new, ref)
+
+    # And a network driven by them gives the same spikes
+    outs = []
+    for x in (s, old, s.astype(float)):
+        net = SpikingNet()
+        net.add_input("in")
+        net.add_layer(SpikingLayer(5, 2), "l1")
+        net.add_synapse("l1", StaticSynapse(40, 5, W), "in")
+        net.add_output("l1")
+        outs.append(net.run(x)[0])
+    np.testing.assert_array_equal(outs[0], outs[2])
+    np.testing.assert_array_equal(outs[1], outs[2])
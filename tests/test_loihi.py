@@ -0,0 +1,164 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+import pytest
+
+from spikelearn import SpikingNet, SpikingLayer
+from spikelearn.loihi import (LoihiSynapse, STDPrule, RuleKernel, PRE_FACTORS,
+                              POST_FACTORS, SYN_FACTORS)
+
+
+WRULE = [[(15, 0.01), (3, 0), (1, 0), (8, 0)], [(15, -0.01), (0, 0), (4, 0), (9, 0.5)]]
+TAGRULE = [[(15, 0.02), (3, 0), (1, 0)], [(15, -0.01), (0, 0), (12, 0), (11, 0.1)]]
+
+
+def _synapse(W0, epoch=1):
+    No, Ne = W0.shape
+    return LoihiSynapse(Ne, No, W0.copy(), (0.9, 1), (0.8, 1), WRULE, tagrule=TAGRULE,
+                        trm=(0.7, 1), Wlim=0.15, taglim=0.3, learning_epoch=epoch)
+
+
+def _inputs(T, Ne, No, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((T, Ne)) < 0.2, rng.random((T, No)) < 0.2, rng.random((T, No))
+
+
+def test_batched_loihi_matches_unbatched_on_identical_samples():
+    Ne, No, T, batch = 12, 7, 20, 3
+    xes, xos, xms = _inputs(T, Ne, No)
+    W0 = np.random.default_rng(1).normal(0, 0.1, (No, Ne))
+    for epoch in (1, 4):
+        single = _synapse(W0, epoch)
+        batched = _synapse(W0, epoch)
+        batched.set_batch_size(batch)
+        assert batched.te().shape == (batch, Ne)
+        assert batched.to().shape == (batch, No)
+        for t in range(T):
+            out = single(xes[t], xms[t])
+            bout = batched(np.tile(xes[t], (batch, 1)), np.tile(xms[t], (batch, 1)))
+            np.testing.assert_allclose(bout, np.tile(out, (batch, 1)), rtol=1e-12)
+            single.update(xos[t])
+            batched.update(np.tile(xos[t], (batch, 1)))
+        single.flush()
+        batched.flush()
+        np.testing.assert_allclose(batched.W, single.W, rtol=0, atol=1e-15)
+        np.testing.assert_allclose(batched.tag, single.tag, rtol=0, atol=1e-15)
+
+
+def test_batched_loihi_averages_over_the_batch():
+    # A single update is the average of the updates of each sample
+    Ne, No, batch = 9, 5, 4
+    rng = np.random.default_rng(2)
+    xe = rng.random((batch, Ne)) < 0.4
+    xo = rng.random((batch, No)) < 0.4
+    xm = rng.random((batch, No))
+    W0 = rng.normal(0, 0.05, (No, Ne))
+    dW = []
+    for b in range(batch):
+        syn = _synapse(W0)
+        syn(xe[b], xm[b])
+        syn.update(xo[b])
+        dW.append(syn.W - W0)
+    syn = _synapse(W0)
+    syn.set_batch_size(batch)
+    syn(xe, xm)
+    syn.update(xo)
+    np.testing.assert_allclose(syn.W - W0, np.mean(dW, axis=0), rtol=1e-12, atol=1e-15)
+
+
+def test_loihi_in_batched_net():
+    batch = 4
+    rng = np.random.default_rng(3)
+    W0 = rng.random((10, 20))
+    net = SpikingNet(batch_size=batch)
+    net.add_input("in")
+    net.add_input("mod")
+    net.add_layer(SpikingLayer(10, 2), "l1")
+    syn = STDPrule(20, 10, W0.copy(), (0.9, 1), (0.8, 1), (0.7, 1), 0.01, 0.01, None)
+    net.add_synapse("l1", syn, "in", "mod")
+    net.add_output("l1")
+    for _ in range(30):
+        out = net((rng.random((batch, 20)) < 0.3).astype(float), rng.random((batch, 10)))
+    assert out[0].shape == (batch, 10)
+    assert syn.te().shape == (batch, 20)
+    assert not np.array_equal(syn.W, W0)
+    net.set_batch_size(None)
+    assert syn.te().shape == (20,)
+
+
+def _reference(rule, values, W, tag):
+    # Direct evaluation of each factor of each chunk, as in the
+    # original LoihiSynapse.apply_rule
+    variables = dict(values, W=W, tag=tag)
+    dx = np.zeros(W.shape)
+    for chunk in rule:
+        dchunk = np.ones(W.shape)
+        for i, value in chunk:
+            if i in PRE_FACTORS:
+                dchunk = dchunk*(variables[PRE_FACTORS[i]] + value)
+            elif i in POST_FACTORS:
+                dchunk = (dchunk.T*(variables[POST_FACTORS[i]] + value)).T
+            elif i in SYN_FACTORS:
+                name, sign = SYN_FACTORS[i]
+                x = variables[name] + value
+                dchunk = dchunk*(np.sign(x) if sign else x)
+            elif i == 13:
+                dchunk = dchunk*np.sign(value)
+            else:
+                dchunk = dchunk*value
+        dx += dchunk
+    return dx
+
+
+RULES = [
+    WRULE,
+    TAGRULE,
+    # Constants only, presynaptic or postsynaptic factors only
+    [[(10, 0.5), (13, -2), (15, 0.1)], [(0, 0.2), (1, 0.1)], [(4, -0.3), (8, 0)]],
+    # Elementwise chunks with weights, tag, and their signs
+    [[(15, 0.1), (3, 0), (1, 0), (9, 0.2)], [(12, -0.1), (0, 0), (5, 0)],
+     [(11, 0), (14, 0.05), (7, 0.1), (2, 0)], [(9, 0), (11, 0.3)]],
+    # Repeated variables and several elementwise chunks of the same shape
+    [[(1, 0), (1, 0.5), (4, 0), (6, 0.2)], [(9, 0), (3, 0)], [(9, 0.1), (4, 0)],
+     [(15, -0.01), (0, 0), (12, 0)]],
+]
+
+
+def _values(rng, No, Ne, batch=None):
+    shape = () if batch is None else (batch,)
+    values = {name: rng.random(shape + (Ne,)) for name in PRE_FACTORS.values()}
+    values.update({name: rng.random(shape + (No,)) for name in POST_FACTORS.values()})
+    values["xe"] = (values["xe"] < 0.3).astype(float)
+    values["xo"] = (values["xo"] < 0.3).astype(float)
+    return values
+
+
+def test_rule_kernel_matches_reference():
+    rng = np.random.default_rng(4)
+    No, Ne = 6, 8
+    W = rng.normal(0, 0.3, (No, Ne))
+    tag = rng.normal(0, 0.3, (No, Ne))
+    for rule in RULES:
+        kernel = RuleKernel(rule)
+        assert len(kernel.rank1) + len(kernel.elementwise) == len(rule)
+        values = _values(rng, No, Ne)
+        np.testing.assert_allclose(kernel(values, W, tag), _reference(rule, values, W, tag),
+                                   rtol=1e-12, atol=1e-15)
+
+        # Summing the factors of several evaluations is exact for fixed W and tag
+        steps = [_values(rng, No, Ne) for _ in range(3)]
+        factors = [kernel.factors(v, No, Ne, W.dtype) for v in steps]
+        combined = kernel.combine([list(chunk) for chunk in zip(*factors)], W, tag)
+        np.testing.assert_allclose(combined, sum(_reference(rule, v, W, tag) for v in steps),
+                                   rtol=1e-12, atol=1e-14)
+
+        # Batched variables are averaged over the batch
+        batched = _values(rng, No, Ne, 3)
+        ref = np.mean([_reference(rule, {k: v[b] for k, v in batched.items()}, W, tag)
+                       for b in range(3)], axis=0)
+        np.testing.assert_allclose(kernel(batched, W, tag), ref, rtol=1e-12, atol=1e-15)
+
+
+def test_rule_kernel_rejects_unknown_factors():
+    with pytest.raises(ValueError):
+        RuleKernel([[(16, 1)]])
@@ -0,0 +1,101 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import SpikingNet, SpikingLayer, StaticSynapse
+from spikelearn.monitors import SpikeMonitor, StateMonitor
+
+
+class _Source:
+
+    def __init__(self, values):
+        self.values = values
+        self.out = values[0]
+
+    def run(self, monitor):
+        for t, value in enumerate(self.values):
+            self.out = value
+            monitor(t)
+
+
+def _spikes(shape, seed=0):
+    return np.random.default_rng(seed).random(shape) < 0.3
+
+
+def test_spike_monitor_events():
+    spikes = _spikes((50, 12))
+    source = _Source(spikes)
+    # A small capacity so that the event arrays grow
+    monitor = SpikeMonitor(source, capacity=4)
+    source.run(monitor)
+    t, i = np.nonzero(spikes)
+    np.testing.assert_array_equal(monitor.t, t)
+    np.testing.assert_array_equal(monitor.i, i)
+    assert monitor.sample is None
+    np.testing.assert_array_equal(monitor.counts(12), spikes.sum(axis=0))
+
+
+def test_spike_monitor_subset_and_every():
+    spikes = _spikes((40, 10), 1)
+    neurons = [1, 4, 7]
+    source = _Source(spikes)
+    monitor = SpikeMonitor(source, neurons=neurons, every=3, capacity=2)
+    source.run(monitor)
+    mask = np.zeros_like(spikes)
+    mask[::3, neurons] = True
+    t, i = np.nonzero(spikes & mask)
+    np.testing.assert_array_equal(monitor.t, t)
+    np.testing.assert_array_equal(monitor.i, i)
+
+
+def test_spike_monitor_batched():
+    spikes = _spikes((30, 3, 8), 2)
+    source = _Source(spikes)
+    monitor = SpikeMonitor(source, capacity=8)
+    source.run(monitor)
+    t, sample, i = np.nonzero(spikes)
+    order = np.lexsort((i, sample, t))
+    np.testing.assert_array_equal(monitor.t, t[order])
+    np.testing.assert_array_equal(monitor.sample, sample[order])
+    np.testing.assert_array_equal(monitor.i, i[order])
+
+
+def test_state_monitor_wraparound():
+    values = np.random.default_rng(3).random((23, 2, 5))
+    source = _Source(values)
+    monitor = StateMonitor(source, size=10)
+    source.run(monitor)
+    assert monitor.n == 23
+    np.testing.assert_array_equal(monitor.t, np.arange(13, 23))
+    np.testing.assert_array_equal(monitor.values, values[13:])
+
+    monitor = StateMonitor(source, neurons=[0, 3], every=2, size=4)
+    source.run(monitor)
+    np.testing.assert_array_equal(monitor.t, np.arange(16, 23, 2))
+    np.testing.assert_array_equal(monitor.values, values[16::2][..., [0, 3]])
+
+
+def test_monitors_in_net_and_reset():
+    rng = np.random.default_rng(4)
+    net = SpikingNet(batch_size=2)
+    net.add_input("in")
+    layer = SpikingLayer(6, 2)
+    net.add_layer(layer, "l1")
+    net.add_synapse("l1", StaticSynapse(6, 6, 2*rng.random((6, 6))), "in")
+    spikes = net.add_monitor(SpikeMonitor(layer))
+    states = net.add_monitor(StateMonitor(layer, "v", size=5))
+    inputs = (rng.random((20, 2, 6)) < 0.5).astype(float)
+    out = net.run(inputs, record=["l1"])[0]
+    t, sample, i = np.nonzero(out)
+    np.testing.assert_array_equal(spikes.t, t)
+    np.testing.assert_array_equal(spikes.sample, sample)
+    np.testing.assert_array_equal(spikes.i, i)
+    assert states.values.shape == (5, 2, 6)
+    np.testing.assert_array_equal(states.values[-1], layer.v)
+
+    net.reset()
+    assert spikes.n == 0 and len(spikes.t) == 0
+    assert states.n == 0 and len(states.t) == 0
+    net.run(inputs[:3])
+    np.testing.assert_array_equal(states.t, np.arange(3))
+    assert np.all(spikes.t < 3)
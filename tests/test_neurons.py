@@ -0,0 +1,69 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import tracemalloc
+
+import numpy as np
+
+from spikelearn import SpikingNet, StaticSynapse
+
+from spikelearn.neurons import LIFLayer, BioLIFLayer
+
+
+def test_layer_without_inputs():
+    layer = LIFLayer(5, 2)
+    layer.v[:] = 2
+    s = layer()
+    np.testing.assert_array_equal(s, np.ones(5))
+    np.testing.assert_array_equal(layer.v, 2*np.exp(-0.5))
+
+
+def test_outputs_alternate_between_two_buffers():
+    rng = np.random.default_rng(0)
+    for layer in (LIFLayer(20, 3), BioLIFLayer(20, 0.5)):
+        kept = []
+        for _ in range(10):
+            out = layer(rng.random(20), rng.random(20))
+            v = layer.v
+            # Outputs of the previous step are still valid
+            if kept:
+                np.testing.assert_array_equal(kept[-1][0], kept[-1][2])
+                np.testing.assert_array_equal(kept[-1][1], kept[-1][3])
+            kept.append((out, v, out.copy(), v.copy()))
+        for t in range(2, 10):
+            assert kept[t][0] is kept[t - 2][0]
+            assert kept[t][1] is kept[t - 2][1]
+            assert kept[t][0] is not kept[t - 1][0]
+
+
+def test_steps_do_not_allocate():
+    N = 10000
+    x = np.random.default_rng(1).random(N)
+    for layer in (LIFLayer(N, 3), BioLIFLayer(N, 0.5)):
+        layer(x, x)
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            for _ in range(20):
+                layer(x, x)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # Less than a single array of N spikes
+        assert peak - start < N
+        assert current - start < N
+
+
+def test_net_outputs_are_not_overwritten_by_later_steps():
+    rng = np.random.default_rng(2)
+    net = SpikingNet()
+    net.add_input("in")
+    net.add_layer(LIFLayer(10, 2), "l1")
+    net.add_synapse("l1", StaticSynapse(10, 10, rng.random((10, 10))), "in")
+    net.add_output("l1")
+    kept, copies = [], []
+    for _ in range(10):
+        out = net((rng.random(10) < 0.5).astype(float))[0]
+        kept.append(out)
+        copies.append(out.copy())
+    for s, s0 in zip(kept, copies):
+        np.testing.assert_array_equal(s, s0)
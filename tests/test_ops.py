@@ -0,0 +1,71 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn.ops import (rank1_update, matvec, sharded_matvec, shard_bounds,
+                            active_columns, EVENT_DENSITY)
+
+
+def _stdp_terms(rng, No, Ne, p):
+    xo = (rng.random(No) < p).astype(float)
+    xe = (rng.random(Ne) < p).astype(float)
+    te = rng.random(Ne)
+    to = rng.random(No)
+    return [(0.3, xo, lambda: te), (-0.2, to, xe)]
+
+
+def test_rank1_update_matches_dense_update():
+    rng = np.random.default_rng(0)
+    for p in (0.0, 0.02, 0.3, 1.0):
+        W = rng.uniform(-0.9, 0.9, (40, 50))
+        terms = _stdp_terms(rng, 40, 50, p)
+        expected = W + sum(c*np.outer(u, v() if callable(v) else v) for c, u, v in terms)
+        np.clip(expected, -0.9, 0.9, out=expected)
+        rank1_update(W, terms, -0.9, 0.9)
+        np.testing.assert_allclose(W, expected, rtol=0, atol=1e-15)
+
+
+def test_rank1_update_only_touches_active_bands():
+    # Weights outside the bands of the active rows and columns are left
+    # out of bounds, so that they reveal any work done on them
+    rng = np.random.default_rng(1)
+    No, Ne = 200, 300
+    terms = _stdp_terms(rng, No, Ne, 0.02)
+    rows = np.flatnonzero(terms[0][1])
+    cols = np.flatnonzero(terms[1][2])
+    W = np.full((No, Ne), 5.0)
+    rank1_update(W, terms, 0, 1)
+    touched = np.zeros((No, Ne), bool)
+    touched[rows] = True
+    touched[:, cols] = True
+    assert touched.mean() < 0.05
+    assert np.all(W[~touched] == 5.0)
+    assert np.all(W[touched] <= 1)
+
+
+def test_event_matvec_matches_dense():
+    rng = np.random.default_rng(4)
+    Ne, No = 100, 7
+    threshold = int(EVENT_DENSITY*Ne)
+    for wdtype in (np.float64, np.float32):
+        W = rng.normal(size=(No, Ne)).astype(wdtype)
+        for n_active in (0, 1, threshold - 1, threshold, threshold + 1, 30, Ne):
+            for batch in (None, 3):
+                shape = (Ne,) if batch is None else (batch, Ne)
+                x = np.zeros(shape)
+                for row in x.reshape(-1, Ne):
+                    row[rng.choice(Ne, n_active, replace=False)] = rng.random(n_active) + 1
+                for xdtype in (bool, np.uint8, np.float32, np.float64):
+                    xi = x.astype(xdtype)
+                    ref = xi @ W.T
+                    tol = 1e-5 if np.float32 in (wdtype, xdtype) else 1e-12
+                    for event_driven in (None, True, False):
+                        out = matvec(W, xi, event_driven)
+                        assert out.shape == ref.shape
+                        assert out.dtype == ref.dtype
+                        np.testing.assert_allclose(out, ref, rtol=tol, atol=tol)
+                        out = sharded_matvec(W, xi, event_driven, shard_bounds(No, 3), None)
+                        np.testing.assert_allclose(out, ref, rtol=tol, atol=tol)
+                    if batch is None:
+                        idx = active_columns(xi)
+                        assert (idx is None) == (n_active > threshold)
@@ -0,0 +1,97 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import SpikingNet, SpikingLayer, STDPSynapse, StaticSynapse
+from spikelearn.loihi import LoihiSynapse, STDPrule
+
+
+def _run(make_synapse, threads, steps=50):
+    rng = np.random.default_rng(0)
+    net = SpikingNet(threads=threads)
+    net.add_input("in")
+    net.add_input("mod")
+    net.add_layer(SpikingLayer(10, 2), "l1")
+    syn = make_synapse()
+    net.add_synapse("l1", syn, "in", "mod")
+    net.add_layer(SpikingLayer(10, 2), "l2")
+    net.add_synapse("l2", STDPSynapse(10, 10, np.full((10, 10), 0.3), (0.9, 1), (0.8, 1),
+                                      rule_params={"Ap": 0.01, "An": 0.01}), "l1")
+    for _ in range(steps):
+        net((rng.random(20) < 0.3).astype(float), rng.random(10))
+    return syn
+
+
+def _loihi():
+    W0 = np.random.default_rng(1).random((10, 20))
+    return STDPrule(20, 10, W0, (0.9, 1), (0.8, 1), (0.7, 1), 0.01, 0.01, None)
+
+
+def test_threaded_loihi_update_matches_serial():
+    serial = _run(_loihi, None)
+    threaded = _run(_loihi, 4)
+    assert not np.array_equal(serial.W, _loihi().W)
+    np.testing.assert_array_equal(threaded.W, serial.W)
+    np.testing.assert_array_equal(threaded.te(), serial.te())
+
+
+def test_sharded_loihi_learning_matches_unsharded():
+    rng = np.random.default_rng(3)
+    Ne, No, T = 50, 37, 30
+    xes = rng.random((T, Ne)) < 0.2
+    xos = rng.random((T, No)) < 0.2
+    xms = rng.random((T, No))
+    W0 = rng.normal(0, 0.1, (No, Ne))
+    wrule = [[(15, 0.01), (3, 0), (1, 0), (8, 0)], [(15, -0.01), (0, 0), (4, 0), (9, 0.5)]]
+    tagrule = [[(15, 0.02), (3, 0), (1, 0)], [(15, -0.01), (0, 0), (12, 0), (11, 0.1)]]
+    for epoch in (1, 4):
+        results = []
+        for shards in (None, 4):
+            syn = LoihiSynapse(Ne, No, W0.copy(), (0.9, 1), (0.8, 1), wrule, tagrule=tagrule,
+                               trm=(0.7, 1), Wlim=0.15, taglim=0.3, learning_epoch=epoch)
+            syn.set_shards(shards, threads=2)
+            for t in range(T):
+                syn(xes[t], xms[t])
+                syn.update(xos[t])
+            syn.flush()
+            results.append((syn.W, syn.tag))
+        np.testing.assert_allclose(results[1][0], results[0][0], rtol=0, atol=1e-15)
+        np.testing.assert_allclose(results[1][1], results[0][1], rtol=0, atol=1e-15)
+
+
+class _CountingSynapse(StaticSynapse):
+    """A non-plastic synapse keeping its own state in update"""
+
+    def __init__(self, Ne, No, W0):
+        super().__init__(Ne, No, W0)
+        self.total = np.zeros(No)
+
+    def update(self, xo, learn=True):
+        self.total += xo
+
+
+def _run_custom(threads, steps=30):
+    rng = np.random.default_rng(4)
+    net = SpikingNet(threads=threads)
+    net.add_input("in")
+    net.add_layer(SpikingLayer(10, 2), "l1")
+    syn = _CountingSynapse(20, 10, rng.random((10, 20)))
+    net.add_synapse("l1", syn, "in")
+    el = net._elements["l1"]
+    calls = []
+    default_update = el.update
+    for _ in range(steps):
+        net((rng.random(20) < 0.3).astype(float))
+    el.update = lambda learn: (calls.append(learn), default_update(learn))
+    for _ in range(steps):
+        net((rng.random(20) < 0.3).astype(float))
+    return syn.total, calls
+
+
+def test_threaded_update_dispatches_custom_updates():
+    serial, serial_calls = _run_custom(None)
+    threaded, threaded_calls = _run_custom(2)
+    assert serial.sum() > 0
+    assert len(serial_calls) == 30
+    assert threaded_calls == serial_calls
+    np.testing.assert_array_equal(threaded, serial)
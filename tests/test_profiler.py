@@ -0,0 +1,50 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import SpikingNet, SpikingLayer, StaticSynapse, STDPSynapse
+from spikelearn.profiler import Profiler
+from spikelearn.snn import _FusedSynapses
+
+
+def _net(fuse):
+    rng = np.random.default_rng(0)
+    net = SpikingNet(fuse_synapses=fuse)
+    net.add_input("in")
+    net.add_layer(SpikingLayer(10, 2), "l1")
+    net.add_synapse("l1", StaticSynapse(6, 10, rng.random((10, 6))), "in")
+    net.add_synapse("l1", StaticSynapse(6, 10, rng.random((10, 6))), "in")
+    net.add_synapse("l1", STDPSynapse(6, 10, rng.random((10, 6)), (0.9, 1), (0.8, 1),
+                                      rule_params={"Ap": 0.01, "An": 0.01}), "in")
+    net.add_output("l1")
+    return net
+
+
+def test_profiler_labels():
+    xs = (np.random.default_rng(1).random((20, 6)) < 0.5).astype(float)
+    for fuse in (False, True):
+        net = _net(fuse)
+        ref = _net(fuse).run(xs)[0]
+        profiler = Profiler(samples=True)
+        profiler.attach(net)
+        np.testing.assert_array_equal(net.run(xs)[0], ref)
+        stats = profiler.as_dict()
+        for label in ("forward", "update", "l1", "l1/neuron", "l1/synapse2",
+                      "l1/synapse2.update", "l1/synapse2.traces"):
+            assert stats[label]["calls"] == 20, label
+        assert len(stats["forward"]["samples"]) == 20
+        # Fused synapses are timed together, and not charged to the neuron
+        fused_calls = 20 if fuse else 0
+        assert stats["l1/fused"]["calls"] == fused_calls
+        for label in ("l1/synapse0", "l1/synapse1"):
+            assert stats[label]["calls"] == 20 - fused_calls
+        assert ("l1/fused" in profiler.report()) == fuse
+
+        profiler.detach()
+        el = net._elements["l1"]
+        assert el._call_fused_synapses is _FusedSynapses.__call__
+        assert el._call_neuron is el._neuron
+        net.reset()
+        profiler.reset()
+        net.run(xs)
+        assert profiler.as_dict()["forward"]["calls"] == 0
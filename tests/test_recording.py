@@ -0,0 +1,67 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn.monitors import SpikeMonitor, StateMonitor
+from spikelearn.recording import Recorder, open_recording
+
+
+class _Source:
+
+    def __init__(self, values):
+        self.values = values
+        self.out = values[0]
+
+    def run(self, *monitors, start=0):
+        for t, value in enumerate(self.values):
+            self.out = value
+            for monitor in monitors:
+                monitor(start + t)
+
+
+def test_recorder_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    spikes = rng.random((97, 2, 7)) < 0.3
+    values = rng.random((97, 4)).astype(np.float32)
+    spike_source, value_source = _Source(spikes), _Source(values)
+    with Recorder(str(tmp_path), max_pending=2) as recorder:
+        # Small chunks, so that several are queued and the last one is
+        # written when closing
+        spike_monitor = SpikeMonitor(spike_source, capacity=8, recorder=recorder, name="s")
+        state_monitor = StateMonitor(value_source, size=10, recorder=recorder, name="v")
+        for t in range(len(spikes)):
+            spike_source.out = spikes[t]
+            value_source.out = values[t]
+            spike_monitor(t)
+            state_monitor(t)
+    data = open_recording(str(tmp_path))
+    assert sorted(data) == ["s.i", "s.sample", "s.t", "v.t", "v.values"]
+    t, sample, i = np.nonzero(spikes)
+    np.testing.assert_array_equal(data["s.t"], t)
+    np.testing.assert_array_equal(data["s.sample"], sample)
+    np.testing.assert_array_equal(data["s.i"], i)
+    np.testing.assert_array_equal(data["v.t"], np.arange(97))
+    assert data["v.values"].dtype == np.float32
+    np.testing.assert_array_equal(data["v.values"], values)
+
+
+def test_reset_writes_pending_events(tmp_path):
+    rng = np.random.default_rng(1)
+    first = rng.random((10, 5)) < 0.5
+    second = rng.random((6, 5)) < 0.5
+    recorder = Recorder(str(tmp_path))
+    source = _Source(first)
+    spike_monitor = SpikeMonitor(source, capacity=1000, recorder=recorder, name="s")
+    state_monitor = StateMonitor(source, size=100, recorder=recorder, name="v")
+    source.run(spike_monitor, state_monitor)
+    spike_monitor.reset()
+    state_monitor.reset()
+    assert spike_monitor.n == 0
+    source.values = second
+    source.run(spike_monitor, state_monitor, start=len(first))
+    recorder.close()
+    data = open_recording(str(tmp_path))
+    t, i = np.nonzero(np.concatenate((first, second)))
+    np.testing.assert_array_equal(data["s.t"], t)
+    np.testing.assert_array_equal(data["s.i"], i)
+    np.testing.assert_array_equal(data["v.values"], np.concatenate((first, second)))
@@ -0,0 +1,85 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import STDPSynapse
+from spikelearn.rules import STDPRule, ModSTDPRule, MSERule
+from spikelearn.sparse import SparseWeights
+
+
+Ne, No = 9, 6
+
+
+def _rules(epoch):
+    # Small rates, so that the weights are never clipped
+    rule = STDPRule({"Ap": 0.002, "An": 0.001}, (1, 0.9), (1, 0.8), learning_epoch=epoch)
+    rule.init(Ne, No)
+    mod = ModSTDPRule({"Ap": 0.002, "An": 0.001}, (1, 0.9), (1, 0.8), (1, 0.7),
+                      learning_epoch=epoch)
+    mod.init(Ne, No, No)
+    mse = MSERule({"lr": 0.001}, (1, 0.9), (1, 0.8), (1, 0.7), learning_epoch=epoch)
+    mse.init(Ne, No, No)
+    return [(rule, False), (mod, True), (mse, True)]
+
+
+def _run(rule, modulated, W, T, flush=True):
+    rng = np.random.default_rng(0)
+    for _ in range(T):
+        x = [rng.random(Ne) < 0.3, rng.random(No) < 0.3]
+        if modulated:
+            x.append(rng.random(No))
+        W = rule.update(*[xi.astype(float) for xi in x], W)
+    return rule.flush(W) if flush else W
+
+
+def _weights(sparse):
+    W = np.random.default_rng(1).uniform(-0.5, 0.5, (No, Ne))
+    if sparse:
+        W[np.random.default_rng(2).random(W.shape) < 0.5] = 0
+        return SparseWeights.from_dense(W)
+    return W
+
+
+def _dense(W):
+    return W.toarray() if isinstance(W, SparseWeights) else W
+
+
+def test_learning_epoch_matches_single_steps():
+    T = 11
+    for sparse in (False, True):
+        for k in (2, 4):
+            for (rule, modulated), (ref, _) in zip(_rules(k), _rules(1)):
+                W = _run(rule, modulated, _weights(sparse), T)
+                W0 = _run(ref, modulated, _weights(sparse), T)
+                assert not np.allclose(_dense(W0), _dense(_weights(sparse)))
+                np.testing.assert_allclose(_dense(W), _dense(W0), rtol=0, atol=1e-12)
+                assert rule._epoch.steps == 0
+
+
+def test_learning_epoch_is_committed_every_k_steps():
+    k = 4
+    for (rule, modulated), (ref, _) in zip(_rules(k), _rules(1)):
+        W = _run(rule, modulated, _weights(False), 2*k, flush=False)
+        np.testing.assert_allclose(W, _run(ref, modulated, _weights(False), 2*k),
+                                   rtol=0, atol=1e-12)
+        W = _run(rule, modulated, W, k - 1, flush=False)
+        assert rule._epoch.steps == k - 1
+
+
+def test_reset_flushes_pending_updates():
+    rng = np.random.default_rng(3)
+    W0 = rng.uniform(0.2, 0.8, (No, Ne))
+    syns = [STDPSynapse(Ne, No, W0.copy(), (1, 0.9), (1, 0.8), learning_epoch=epoch,
+                        rule_params={"Ap": 0.002, "An": 0.001}) for epoch in (5, 1)]
+    for _ in range(3):
+        xe = (rng.random(Ne) < 0.5).astype(float)
+        xo = (rng.random(No) < 0.5).astype(float)
+        for syn in syns:
+            syn(xe)
+            syn.update(xo)
+    syn, ref = syns
+    np.testing.assert_array_equal(syn.W, W0)
+    syn.reset()
+    assert syn.learning_rule._epoch.steps == 0
+    np.testing.assert_allclose(syn.W, ref.W, rtol=0, atol=1e-12)
+    assert not np.any(syn.learning_rule.te())
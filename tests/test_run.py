@@ -0,0 +1,36 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import SpikingNet, SpikingLayer, STDPSynapse
+
+
+def _net():
+    net = SpikingNet()
+    net.add_input("in")
+    net.add_layer(SpikingLayer(8, 3), "l1")
+    W0 = np.random.default_rng(0).random((8, 12))
+    net.add_synapse("l1", STDPSynapse(12, 8, W0, (0.9, 1), (0.8, 1),
+                                      rule_params={"Ap": 0.01, "An": 0.01}), "in")
+    net.add_output("l1")
+    net.add_output("in")
+    return net
+
+
+def test_run_leaves_the_same_state_as_steps():
+    xs = (np.random.default_rng(1).random((25, 12)) < 0.4).astype(float)
+    stepped = _net()
+    outs = [[np.array(o) for o in stepped(x)] for x in xs]
+    ran = _net()
+    recorded = ran.run(xs)
+
+    np.testing.assert_array_equal(recorded[0], [o[0] for o in outs])
+    np.testing.assert_array_equal(recorded[1], xs)
+    assert ran.t == stepped.t
+    assert len(ran.out) == len(stepped.out)
+    for a, b in zip(ran.out, stepped.out):
+        np.testing.assert_array_equal(a, b)
+    l_ran, l_stepped = ran._elements["l1"], stepped._elements["l1"]
+    np.testing.assert_array_equal(l_ran.out, l_stepped.out)
+    np.testing.assert_array_equal(l_ran._neuron.v, l_stepped._neuron.v)
+    np.testing.assert_array_equal(l_ran._synapses[0].W, l_stepped._synapses[0].W)
@@ -0,0 +1,79 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import SparseWeights
+from spikelearn.ops import matvec, active_columns
+from spikelearn.rules import STDPRule, ModSTDPRule, MSERule
+
+
+def _weights(rng, No=12, Ne=30, p=0.3):
+    W = rng.normal(size=(No, Ne))
+    W[rng.random(W.shape) > p] = 0
+    # An input without synapses
+    W[:, 3] = 0
+    return W
+
+
+def test_dot_matches_dense():
+    rng = np.random.default_rng(0)
+    W = _weights(rng)
+    S = SparseWeights.from_dense(W)
+    np.testing.assert_array_equal(S.toarray(), W)
+    for batch in (None, 4):
+        shape = (30,) if batch is None else (batch, 30)
+        for p in (0, 0.05, 0.5, 1):
+            x = (rng.random(shape) < p)*(rng.random(shape) + 1)
+            for dtype in (bool, np.uint8, np.float32, np.float64):
+                xi = x.astype(dtype)
+                ref = xi @ W.T
+                tol = 1e-5 if dtype == np.float32 else 1e-12
+                for idx in (None, active_columns(xi, 1.0), np.arange(30)):
+                    out = S.dot(xi, idx)
+                    assert out.shape == ref.shape
+                    np.testing.assert_allclose(out, ref, rtol=tol, atol=tol)
+                for event_driven in (None, True, False):
+                    np.testing.assert_allclose(matvec(S, xi, event_driven), ref,
+                                               rtol=tol, atol=tol)
+
+
+def test_column_index():
+    rng = np.random.default_rng(1)
+    W = _weights(rng)
+    S = SparseWeights.from_dense(W)
+    for j in range(W.shape[1]):
+        syn = S.col_order[S.colptr[j]:S.colptr[j + 1]]
+        assert np.all(S.indices[syn] == j)
+        np.testing.assert_array_equal(S.rows[syn], np.flatnonzero(W[:, j]))
+        np.testing.assert_array_equal(S.data[syn], W[W[:, j] != 0, j])
+
+
+def _rules():
+    rule = STDPRule({"Ap": 0.02, "An": 0.01}, (1, 0.9), (1, 0.8))
+    rule.init(30, 12)
+    mod = ModSTDPRule({"Ap": 0.02, "An": 0.01}, (1, 0.9), (1, 0.8), (1, 0.7))
+    mod.init(30, 12, 12)
+    mse = MSERule({"lr": 0.01}, (1, 0.9), (1, 0.8), (1, 0.7))
+    mse.init(30, 12, 12)
+    return [(rule, False), (mod, True), (mse, True)]
+
+
+def test_sparse_rules_match_dense():
+    rng = np.random.default_rng(2)
+    W = _weights(rng)
+    S = SparseWeights.from_dense(W)
+    mask = W != 0
+    for (rule, modulated), (dense_rule, _) in zip(_rules(), _rules()):
+        Ws, Wd = S.copy(), W.copy()
+        for t in range(20):
+            x = [(rng.random(30) < 0.3).astype(float), (rng.random(12) < 0.3).astype(float)]
+            if modulated:
+                x.append(rng.random(12))
+            np.testing.assert_allclose(rule.apply_rule_sparse(*x, S.rows, S.indices),
+                                       dense_rule.apply_rule(*x)[mask], rtol=1e-12)
+            Ws = rule.update(*x, Ws)
+            # Only the existing synapses are updated
+            Wd = dense_rule.update(*x, Wd)
+            Wd[~mask] = 0
+        np.testing.assert_allclose(Ws.toarray(), Wd, rtol=1e-12, atol=1e-12)
+        assert not np.allclose(Ws.data, S.data)
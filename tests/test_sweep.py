@@ -0,0 +1,56 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import os
+
+import numpy as np
+
+from spikelearn import SpikingNet, SpikingLayer, StaticSynapse
+from spikelearn.sweep import grid, run_sweep, load_results
+
+
+def build(config):
+    """Builds a small network, failing while the file config["fail"] exists"""
+    with open(config["log"], "a") as f:
+        f.write("{}\n".format(config["tau"]))
+    if config["tau"] < 0 and os.path.exists(config["fail"]):
+        raise RuntimeError("negative tau")
+    net = SpikingNet()
+    net.add_input("in")
+    net.add_layer(SpikingLayer(4, abs(config["tau"])), "l1")
+    net.add_synapse("l1", StaticSynapse(3, 4, np.full((4, 3), config["w"])), "in")
+    net.add_output("l1")
+    return net
+
+
+def test_sweep_records_errors_and_resumes(tmp_path):
+    log = str(tmp_path / "builds.log")
+    fail = str(tmp_path / "fail")
+    results = str(tmp_path / "results.jsonl")
+    open(fail, "w").close()
+    configs = grid({"tau": [2, -3, 4], "w": [0.5, 1.5], "log": [log], "fail": [fail]})
+    inputs = (np.random.default_rng(0).random((20, 3)) < 0.5).astype(float)
+
+    records = run_sweep(build, configs, [inputs], results=results, workers=2)
+    assert [rec["config"] for rec in records] == configs
+    failed = [i for i, config in enumerate(configs) if config["tau"] < 0]
+    for i, rec in enumerate(records):
+        if i in failed:
+            assert "negative tau" in rec["error"] and "result" not in rec
+        else:
+            assert len(rec["result"]["rates"]) == 1
+    assert sorted(map(str, load_results(results))) == sorted(map(str, records))
+
+    # Resuming only runs the configurations that failed
+    os.remove(fail)
+    os.remove(log)
+    resumed = run_sweep(build, configs, [inputs], results=results, workers=2)
+    with open(log) as f:
+        assert sorted(f.read().split()) == ["-3", "-3"]
+    for i, rec in enumerate(resumed):
+        assert "result" in rec
+        if i not in failed:
+            assert rec == records[i]
+    # Serial runs give the same results
+    serial = run_sweep(build, configs, [inputs], workers=0)
+    assert serial == resumed
+    assert len(load_results(results)) == len(configs) + len(failed)
@@ -0,0 +1,64 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn.synapses import DelayedSynapse
+
+
+def _delayed_reference(W, delays, xs):
+    # Output at step t: sum over j of W[i, j]*x[t - delays[i, j], j]
+    T = len(xs)
+    No, Ne = W.shape
+    out = np.zeros((T,) + xs.shape[1:-1] + (No,))
+    for t in range(T):
+        for i in range(No):
+            for j in range(Ne):
+                t0 = t - delays[i, j]
+                if t0 >= 0:
+                    out[t, ..., i] += W[i, j]*xs[t0, ..., j]
+    return out
+
+
+def _run(syn, xs):
+    return np.array([np.array(syn(x)) for x in xs])
+
+
+def test_delayed_synapse_long_delays():
+    # Delays close to and above the range of uint8, so that the arrival
+    # slot exceeds 255
+    rng = np.random.default_rng(0)
+    Ne, No = 6, 4
+    W = rng.random((No, Ne))
+    xs = (rng.random((700, Ne)) < 0.3).astype(float)
+    for max_delay in (200, 255, 300):
+        delays = rng.integers(0, max_delay + 1, (No, Ne))
+        delays[0, 0] = max_delay
+        syn = DelayedSynapse(Ne, No, W, delays)
+        np.testing.assert_allclose(_run(syn, xs), _delayed_reference(W, delays, xs),
+                                   rtol=1e-12, atol=1e-12)
+
+
+def test_delayed_synapse_batched():
+    rng = np.random.default_rng(1)
+    Ne, No, batch = 5, 3, 4
+    W = rng.random((No, Ne))
+    delays = rng.integers(0, 7, (No, Ne))
+    xs = (rng.random((40, batch, Ne)) < 0.3).astype(float)*rng.random((40, batch, Ne))
+    syn = DelayedSynapse(Ne, No, W, delays)
+    syn.set_batch_size(batch)
+    np.testing.assert_allclose(_run(syn, xs), _delayed_reference(W, delays, xs),
+                               rtol=1e-12, atol=1e-12)
+
+
+def test_delayed_synapse_outputs_are_kept():
+    rng = np.random.default_rng(2)
+    Ne, No = 5, 3
+    W = rng.random((No, Ne))
+    delays = rng.integers(0, 4, (No, Ne))
+    xs = (rng.random((30, Ne)) < 0.5).astype(float)
+    for syn_type in (None, "inh"):
+        syn = DelayedSynapse(Ne, No, W, delays, syn_type=syn_type)
+        outs = [syn(x) for x in xs]
+        sign = -1 if syn_type == "inh" else 1
+        np.testing.assert_allclose(np.array(outs), sign*_delayed_reference(W, delays, xs),
+                                   rtol=1e-12, atol=1e-12)
@@ -0,0 +1,121 @@
+#Copyright Argonne 2022. See LICENSE.md for details.
+
+import numpy as np
+
+from spikelearn import STDPSynapse
+from spikelearn.trace import Trace, TraceBank, TraceList
+from spikelearn.rules import STDPRule
+from spikelearn.loihi import STDPrule
+
+
+SPECS = [(4, 1, 0.9, 10), (3, 0.5, 0.8, 1), (5, 2, 0.7, 3)]
+
+
+def _inputs(T, batch_size=None, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (T,) if batch_size is None else (T, batch_size)
+    return [rng.random(shape + (spec[0],)) < 0.4 for spec in SPECS]
+
+
+def test_trace_bank_matches_traces():
+    for batch_size in (None, 3):
+        bank = TraceBank(SPECS, batch_size)
+        traces = [Trace(*spec, batch_size) for spec in SPECS]
+        assert bank.t.shape == (() if batch_size is None else (batch_size,)) + (12,)
+        xs = _inputs(20, batch_size)
+        for t in range(20):
+            bank.update(*[x[t] for x in xs])
+            for trace, x in zip(traces, xs):
+                trace.update(x[t])
+        for view, trace in zip(bank.traces, traces):
+            assert view().shape == trace().shape
+            assert np.shares_memory(view(), bank.t)
+            np.testing.assert_allclose(view(), trace(), rtol=1e-12)
+
+
+def test_trace_bank_reset():
+    bank = TraceBank(SPECS, 2)
+    views = list(bank.traces)
+    for x in zip(*_inputs(5, 2)):
+        bank.update(*x)
+    assert np.any(bank.t[..., 4:7])
+    # Resetting a view only clears its own slice
+    views[1].reset()
+    assert not np.any(bank.t[..., 4:7])
+    assert np.any(bank.t[..., :4])
+    bank.reset()
+    assert bank.traces == views
+    for view in views:
+        assert not np.any(view())
+        assert np.shares_memory(view(), bank.t)
+
+
+def test_trace_views_follow_dtype_and_batch_size():
+    rule = STDPRule({"Ap": 0.01, "An": 0.01}, (1, 0.9), (1, 0.8))
+    rule.init(6, 4)
+    rule.set_batch_size(3)
+    rule.set_dtype(np.float32)
+    for view in (rule.te, rule.to):
+        assert view().dtype == np.float32
+        assert view().shape[0] == 3
+        assert np.shares_memory(view(), rule.traces.t)
+
+    syn = STDPrule(6, 4, np.zeros((4, 6)), (0.9, 1), (0.8, 1), (0.7, 1), 0.01, 0.01, None)
+    syn.set_batch_size(2)
+    syn.set_dtype(np.float32)
+    assert syn.W.dtype == np.float32
+    for name in ("te", "to", "tm"):
+        view = getattr(syn, name)
+        assert view().dtype == np.float32
+        assert view().shape[0] == 2
+        assert np.shares_memory(view(), syn.traces.t)
+    syn.reset()
+    assert syn.te().dtype == np.float32
+
+
+def test_lazy_traces_match_eager_traces():
+    rng = np.random.default_rng(4)
+    for batch_size in (None, 2):
+        shape = () if batch_size is None else (batch_size,)
+        lazy = TraceList(SPECS, batch_size)
+        eager = TraceBank(SPECS, batch_size)
+        for t in range(60):
+            # Sparse inputs, with runs of steps without any input
+            active = t % 10 < 3
+            x = [(rng.random(shape + (spec[0],)) < 0.3)*active for spec in SPECS]
+            lazy.update(*x)
+            eager.update(*x)
+            if t % 7 == 0:
+                idx = np.array([0, 2])
+                for trace, view in zip(lazy.traces, eager.traces):
+                    np.testing.assert_allclose(trace.at(idx), view()[..., idx], rtol=1e-12)
+            if t % 5 == 0:
+                for trace, view in zip(lazy.traces, eager.traces):
+                    np.testing.assert_allclose(trace(), view(), rtol=1e-12)
+            if t == 30:
+                lazy.reset()
+                eager.reset()
+                for trace in lazy.traces:
+                    assert not np.any(trace())
+        for trace, view in zip(lazy.traces, eager.traces):
+            np.testing.assert_allclose(trace.t, view.t, rtol=1e-12)
+
+
+def test_lazy_trace_rules_match_eager_rules():
+    rng = np.random.default_rng(5)
+    W0 = rng.uniform(0.2, 0.8, (4, 6))
+    syns = [STDPSynapse(6, 4, W0.copy(), (1, 0.9), (1, 0.8), lazy_traces=lazy,
+                        rule_params={"Ap": 0.01, "An": 0.01}) for lazy in (True, False)]
+    for t in range(40):
+        xe = (rng.random(6) < 0.2*(t % 6 < 2)).astype(float)
+        xo = (rng.random(4) < 0.2*(t % 4 < 1)).astype(float)
+        for syn in syns:
+            syn(xe)
+            syn.update(xo)
+        if t == 20:
+            for syn in syns:
+                syn.reset()
+    assert not np.array_equal(syns[1].W, W0)
+    np.testing.assert_allclose(syns[0].W, syns[1].W, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(syns[0].learning_rule.te(), syns[1].learning_rule.te(),
+                               rtol=1e-12)